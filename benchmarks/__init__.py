@@ -0,0 +1,14 @@
+"""
+Benchmarks for the pipelines in `solved/`.
+
+They run against a mocked LLM and embedding backend (see `mock.py`) so the
+numbers measure our own Python code, not the latency of the provider. Results
+are written as JSON to compare them between commits:
+
+```bash
+python -m benchmarks.pipelines --output base.json
+# ... change something ...
+python -m benchmarks.pipelines --output head.json
+python -m benchmarks.compare base.json head.json
+```
+"""
@@ -0,0 +1,129 @@
+"""
+Answer cache of `solved/rag/v5.py` (see `retrieval/answers.py`) with a
+stream of repeated and paraphrased questions.
+
+Each base question is asked once and then `--repeats` more times, alternating
+a copy with other case and punctuation (exact level) and one with the words
+reordered (semantic level: the mocked embeddings are a bag of words). The
+questions are shuffled and answered with the cache and without it.
+
+```bash
+python -m benchmarks.answer_cache --questions 50 --repeats 4 --latency 0.05
+```
+"""
+
+import argparse
+import json
+import random
+import statistics
+from contextlib import suppress
+from time import perf_counter
+
+import chromadb
+from chromadb.config import Settings
+
+from gateway.router import Router
+from retrieval.answers import AnswerCache
+from retrieval.embeddings import OpenAIEmbedder
+
+from .mock import FakeOpenAI, FakeRequests, synthetic_page, synthetic_questions
+from .pipelines import RAG_URL, patched
+
+
+class NoCache:
+    def exact(self, question):
+        return None
+
+    def similar(self, vector):
+        return None
+
+    def store(self, *args, **kwargs):
+        pass
+
+    def invalidate(self):
+        pass
+
+
+def variants(question: str, repeats: int, rng: random.Random) -> list[str]:
+    words = question.rstrip("?").split()
+    result = []
+    for i in range(repeats):
+        if i % 2 == 0:
+            result.append(question.upper().rstrip("?") + " ?!")
+        else:
+            shuffled = words[:]
+            rng.shuffle(shuffled)
+            result.append(" ".join(shuffled) + "?")
+    return result
+
+
+def run(rag, questions: list[str], answers, args) -> dict:
+    db = chromadb.EphemeralClient(settings=Settings(anonymized_telemetry=False))
+    # On the first run there is no collection yet
+    with suppress(ValueError):
+        db.delete_collection("rag")
+
+    client = FakeOpenAI(latency=args.latency, seed=args.seed)
+    fake = rag.Clients.create(
+        client=client,
+        router=Router(client=client),
+        db=db,
+        embedder=OpenAIEmbedder(FakeOpenAI(latency=args.embedding_latency)),
+        sources=None,  # Only for `ingest`
+        tenants=None,
+        answers=answers,
+    )
+    pages = FakeRequests({RAG_URL: synthetic_page(args.paragraphs, args.seed)})
+    with patched(rag, clients=lambda: fake, http=lambda: pages):
+        rag.chatbot(questions[0])  # Indexing is not measured
+
+        latencies = []
+        for question in questions:
+            start = perf_counter()
+            rag.chatbot(question)
+            latencies.append(perf_counter() - start)
+    return {
+        "mean_seconds": statistics.mean(latencies),
+        "p50_seconds": statistics.median(latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--questions", type=int, default=50)
+    parser.add_argument("--repeats", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.05, help="LLM seconds")
+    parser.add_argument("--embedding-latency", type=float, default=0.01)
+    parser.add_argument("--threshold", type=float, default=0.95)
+    parser.add_argument("--paragraphs", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Path of the JSON results")
+    args = parser.parse_args()
+
+    from solved.rag import v5 as rag
+
+    rng = random.Random(args.seed)
+    questions = []
+    for question in dict.fromkeys(synthetic_questions(args.questions, args.seed)):
+        questions += [question, *variants(question, args.repeats, rng)]
+    rng.shuffle(questions)
+
+    answers = AnswerCache(threshold=args.threshold)
+    cached = run(rag, questions, answers, args)
+    uncached = run(rag, questions, NoCache(), args)
+    metrics = answers.metrics()
+
+    print(f"{len(questions)} questions: "
+          f"exact hits {metrics['exact_hit_rate']:.0%}, "
+          f"semantic hits {metrics['semantic_hit_rate']:.0%}, "
+          f"saved {metrics['seconds_saved']:.2f}s")
+    print(f"mean latency: {uncached['mean_seconds'] * 1000:.1f} ms without cache, "
+          f"{cached['mean_seconds'] * 1000:.1f} ms with cache")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"cache": metrics, "cached": cached, "uncached": uncached}, f)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Memory of the chunks of a large corpus: a `str` per chunk (`text_splitter`
+of `solved/rag/v5.py`, like the `Chunk` tuples that `ingest` used to keep)
+against `__slots__` records with offsets into a memory-mapped
+`SourceStore` (`retrieval/splitting.py` and `retrieval/chunks.py`).
+
+Python allocations are measured with `tracemalloc`: the held memory once
+every page is split and the peak while splitting. The store is on disk and
+mapped (its size is reported apart); only the chunks that reach a prompt
+are materialised, which is also timed.
+
+```bash
+python -m benchmarks.chunks --pages 1000 --paragraphs 50
+```
+"""
+
+import argparse
+import json
+import os
+import random
+import tempfile
+import tracemalloc
+from time import perf_counter
+from typing import NamedTuple
+
+from retrieval.chunks import Chunk, SourceStore, chunk_hash
+from retrieval.ingest import parse_post
+from retrieval.splitting import span_splitter
+
+from .mock import synthetic_page
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+
+class StringChunk(NamedTuple):
+    source: str
+    index: int
+    text: str
+
+
+def measure(build) -> tuple[object, dict[str, float]]:
+    tracemalloc.start()
+    start = perf_counter()
+    held = build()
+    seconds = perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return held, {
+        "seconds": seconds,
+        "held_mib": current / 2**20,
+        "peak_mib": peak / 2**20,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--pages", type=int, default=1000)
+    parser.add_argument("--paragraphs", type=int, default=50, help="Per page")
+    parser.add_argument("--prompts", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Path of the JSON results")
+    args = parser.parse_args()
+
+    from solved.rag import v5 as rag
+
+    # The pages are generated (and parsed) lazily, as they are downloaded
+    def texts():
+        for i in range(args.pages):
+            page = synthetic_page(args.paragraphs, args.seed + i)
+            yield f"page-{i}", parse_post(page)
+
+    def strings():
+        return [
+            StringChunk(source, i, text)
+            for source, doc in texts()
+            for i, text in enumerate(rag.text_splitter(doc))
+        ]
+
+    directory = tempfile.mkdtemp(prefix="chunks-")
+    sources = SourceStore(os.path.join(directory, "sources"))
+
+    def offsets():
+        chunks = []
+        for source, doc in texts():
+            text = doc.encode()
+            view = memoryview(text)
+            sources.add(source, text)
+            chunks.extend(
+                Chunk(source, start, end, chunk_hash(view[start:end]))
+                for start, end in span_splitter(text)
+            )
+        return chunks
+
+    results = {}
+    rng = random.Random(args.seed)
+    for name, build in [("strings", strings), ("offsets", offsets)]:
+        chunks, row = measure(build)
+        row["chunks"] = len(chunks)
+        row["bytes_per_chunk"] = row["held_mib"] * 2**20 / len(chunks)
+
+        # Five chunks per prompt, like the chatbot
+        picks = [rng.sample(chunks, 5) for _ in range(args.prompts)]
+        start = perf_counter()
+        for pick in picks:
+            if name == "strings":
+                "\n\n".join(chunk.text for chunk in pick)
+            else:
+                "\n\n".join(sources.texts(pick))
+        row["materialise_us"] = (perf_counter() - start) / args.prompts * 1e6
+        results[name] = row
+        del chunks, picks
+
+    results["offsets"]["store_mib"] = os.path.getsize(sources.data_path) / 2**20
+    for name, row in results.items():
+        print(
+            f"{name}: {row['chunks']} chunks, {row['held_mib']:.1f} MiB held "
+            f"({row['bytes_per_chunk']:.0f} B/chunk), peak {row['peak_mib']:.1f} MiB, "
+            f"{row['materialise_us']:.1f} us per prompt context"
+        )
+    print(f"Store on disk (mapped): {results['offsets']['store_mib']:.1f} MiB")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
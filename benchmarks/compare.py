@@ -0,0 +1,73 @@
+"""
+Compare two results of `benchmarks.pipelines` and fail (exit code 1) if any
+stage, the wall time or the peak memory got worse than `--threshold`.
+
+```bash
+python -m benchmarks.compare base.json head.json --threshold 0.1
+```
+"""
+
+import argparse
+import json
+import sys
+
+
+def metrics(result: dict) -> dict[str, float]:
+    values = {
+        "wall_seconds": result["wall_seconds"],
+        "peak_memory_bytes": result["peak_memory_bytes"],
+    }
+    for stage, stage_values in result["stages"].items():
+        values[f"stages.{stage}"] = stage_values["seconds"]
+    return values
+
+
+def compare(base: dict, head: dict, threshold: float, min_seconds: float):
+    """
+    Yields `(pipeline, metric, base, head, regression)` for every metric in
+    both results. Time differences under `min_seconds` are considered noise.
+    """
+    for pipeline, head_result in head["pipelines"].items():
+        if pipeline not in base["pipelines"]:
+            continue
+
+        base_metrics = metrics(base["pipelines"][pipeline])
+        for metric, head_value in metrics(head_result).items():
+            base_value = base_metrics.get(metric)
+            if base_value is None:
+                continue
+
+            worse = head_value > base_value * (1 + threshold)
+            if metric != "peak_memory_bytes":
+                worse = worse and head_value - base_value > min_seconds
+            yield pipeline, metric, base_value, head_value, worse
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("base")
+    parser.add_argument("head")
+    parser.add_argument("--threshold", type=float, default=0.1)
+    parser.add_argument("--min-seconds", type=float, default=0.001)
+    args = parser.parse_args()
+
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.head) as f:
+        head = json.load(f)
+
+    regressions = 0
+    for pipeline, metric, base_value, head_value, worse in compare(
+        base, head, args.threshold, args.min_seconds
+    ):
+        change = (head_value - base_value) / base_value if base_value else 0.0
+        mark = "REGRESSION" if worse else ""
+        print(f"{pipeline:<10} {metric:<20} {base_value:>14.6g} {head_value:>14.6g}"
+              f" {change:>+8.1%} {mark}")
+        regressions += worse
+
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Throughput of the async extractor (v6) against threads (v5) with many
+requests in flight.
+
+Each document is one extraction (plus the LLM validation of the
+technologies) against a mocked backend with `--latency` seconds per call. v5
+runs in a pool of `--concurrency` threads, v6 in one event loop with the same
+number of concurrent extractions. `tracemalloc` doesn't see the stacks of the
+threads, so the extra threads are reported apart.
+
+```bash
+python -m benchmarks.concurrency --documents 500 --concurrency 50 200 500
+```
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import threading
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from time import perf_counter
+
+from gateway.retry import Retry
+from gateway.router import Router
+
+from .mock import FakeAsyncOpenAI, FakeOpenAI, synthetic_talk
+from .pipelines import patched
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+
+def measure(run) -> dict:
+    tracemalloc.start()
+    threads = threading.active_count()
+    start = perf_counter()
+    results, peak_threads = run()
+    seconds = perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "seconds": seconds,
+        "documents_per_second": len(results) / seconds,
+        "peak_memory_bytes": peak,
+        "extra_threads": peak_threads - threads,
+        "failed": sum(result is None for result in results),
+    }
+
+
+def run_threads(module, docs: list[str], concurrency: int):
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [pool.submit(module.extractor, module.talk, doc) for doc in docs]
+        peak_threads = threading.active_count()
+        return [future.result() for future in futures], peak_threads
+
+
+def run_async(module, docs: list[str], concurrency: int):
+    async def main():
+        results = await module.extract_all(module.talk, docs, concurrency)
+        return results, threading.active_count()
+
+    return asyncio.run(main())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--documents", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[50, 200, 500])
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds per call")
+    parser.add_argument("--invalid-rate", type=float, default=0.2)
+    parser.add_argument("--words", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Path of the JSON results")
+    args = parser.parse_args()
+
+    from solved.extractor import v5, v6
+
+    docs = [synthetic_talk(args.words, args.seed + i) for i in range(args.documents)]
+    fake = {
+        "latency": args.latency,
+        "invalid_rate": args.invalid_rate,
+        "seed": args.seed,
+    }
+    # No hedging: we compare the concurrency models, not duplicated requests
+    retry = Retry()
+
+    results = []
+    for concurrency in args.concurrency:
+        router = Router(client=FakeOpenAI(**fake))
+        with patched(v5, router=router, retry=retry):
+            threads = measure(partial(run_threads, v5, docs, concurrency))
+
+        router = Router(client=FakeAsyncOpenAI(**fake))
+        with patched(v6, router=router, retry=retry):
+            tasks = measure(partial(run_async, v6, docs, concurrency))
+
+        results.append({"concurrency": concurrency, "v5": threads, "v6": tasks})
+        print(f"concurrency {concurrency}: "
+              f"threads {threads['documents_per_second']:.0f} docs/s "
+              f"({threads['peak_memory_bytes'] / 2**20:.1f} MiB, "
+              f"+{threads['extra_threads']} threads), "
+              f"async {tasks['documents_per_second']:.0f} docs/s "
+              f"({tasks['peak_memory_bytes'] / 2**20:.1f} MiB, "
+              f"+{tasks['extra_threads']} threads)")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
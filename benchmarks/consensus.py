@@ -0,0 +1,90 @@
+"""
+Early exit by consensus of smartllm v4 against the full pipeline of the same
+version (`consensus_threshold=None`), so both generate the ideas
+concurrently and the difference is only the early exit.
+
+The mocked backend answers the same idea prompt with the same text except for
+a fraction of `--diversity` of the calls. With low diversity (easy questions)
+v4 stops after the ideas; with high diversity it runs the full pipeline.
+
+```bash
+python -m benchmarks.consensus --latency 0.05 --diversity 0 0.5 1
+```
+"""
+
+import argparse
+import json
+import os
+import statistics
+from time import perf_counter
+
+from gateway.router import Router
+
+from .mock import FakeOpenAI, synthetic_questions
+from .pipelines import patched
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+
+def run(
+    module, questions: list[str], args, diversity: float, threshold: float | None
+) -> dict:
+    client = FakeOpenAI(latency=args.latency, diversity=diversity, seed=args.seed)
+
+    latencies, calls, tokens, early_exits = [], 0, 0, 0
+    with patched(module, router=Router(client=client)):
+        for question in questions:
+            start = perf_counter()
+            _, usage = module.smartllm(
+                question, n_ideas=args.ideas, consensus_threshold=threshold
+            )
+            latencies.append(perf_counter() - start)
+
+            calls += sum(u.calls for u in usage.values())
+            tokens += sum(u.prompt_tokens + u.completion_tokens for u in usage.values())
+            early_exits += usage["critique"].calls == 0
+
+    return {
+        "mean_seconds": statistics.mean(latencies),
+        "p95_seconds": sorted(latencies)[int(0.95 * (len(latencies) - 1))],
+        "calls_per_question": calls / len(questions),
+        "tokens_per_question": tokens / len(questions),
+        "early_exit_rate": early_exits / len(questions),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--questions", type=int, default=20)
+    parser.add_argument("--ideas", type=int, default=2)
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds per call")
+    parser.add_argument("--diversity", type=float, nargs="+", default=[0.0, 0.5, 1.0])
+    parser.add_argument("--threshold", type=float, default=0.9)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Path of the JSON results")
+    args = parser.parse_args()
+
+    from solved.smartllm import v4
+
+    questions = synthetic_questions(args.questions, args.seed)
+    results = []
+    for diversity in args.diversity:
+        full = run(v4, questions, args, diversity, None)
+        early = run(v4, questions, args, diversity, args.threshold)
+        results.append({"diversity": diversity, "full": full, "early_exit": early})
+
+        speedup = full["mean_seconds"] / early["mean_seconds"]
+        print(f"diversity {diversity:.2f}: "
+              f"full {full['mean_seconds'] * 1000:.0f} ms, "
+              f"early exit {early['mean_seconds'] * 1000:.0f} ms ({speedup:.1f}x), "
+              f"tokens {full['tokens_per_question']:.0f} -> "
+              f"{early['tokens_per_question']:.0f}, "
+              f"early exits {early['early_exit_rate']:.0%}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
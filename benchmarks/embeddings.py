@@ -0,0 +1,77 @@
+"""
+Throughput of the embedding backends of `retrieval/embeddings.py` over the
+synthetic chunks, with and without the persistent cache.
+
+The API is mocked with `--latency` seconds per request. `local` needs
+`sentence-transformers` (and downloads the model the first time), without it
+it's skipped.
+
+```bash
+python -m benchmarks.embeddings --chunks 2000 --latency 0.2
+```
+"""
+
+import argparse
+import json
+import os
+import tempfile
+from time import perf_counter
+
+from retrieval.embeddings import (
+    CachedEmbedder,
+    HashingEmbedder,
+    LocalEmbedder,
+    OpenAIEmbedder,
+)
+
+from .mock import FakeOpenAI, synthetic_text
+
+
+def throughput(embedder, texts: list[str]) -> float:
+    start = perf_counter()
+    embedder.embed(texts)
+    return len(texts) / (perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--words", type=int, default=150, help="Words per chunk")
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds per call")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Path of the JSON results")
+    args = parser.parse_args()
+
+    texts = [synthetic_text(args.words, args.seed + i) for i in range(args.chunks)]
+    backends = {
+        "openai": OpenAIEmbedder(
+            FakeOpenAI(latency=args.latency), batch_size=args.batch_size
+        ),
+        "hashing": HashingEmbedder(),
+        "local": LocalEmbedder(batch_size=args.batch_size),
+    }
+
+    results = {}
+    cache_dir = tempfile.mkdtemp()
+    for name, embedder in backends.items():
+        try:
+            cold = throughput(embedder, texts)
+        except ImportError as e:
+            print(f"{name}: skipped ({e})")
+            continue
+
+        cached = CachedEmbedder(embedder, os.path.join(cache_dir, f"{name}.sqlite"))
+        cached.embed(texts)
+        warm = throughput(cached, texts)
+
+        results[name] = {"texts_per_second": cold, "cached_texts_per_second": warm}
+        print(f"{name}: {cold:.0f} texts/s, cached {warm:.0f} texts/s")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
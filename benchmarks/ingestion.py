@@ -0,0 +1,75 @@
+"""
+Scaling of the parallel ingestion of `retrieval/ingest.py`: throughput of
+parsing and splitting synthetic pages with `parse_post` and the splitter of
+`--splitter` (`span_splitter` by default), from 1 process (no pool) to one
+per core.
+
+```bash
+python -m benchmarks.ingestion --pages 500 --workers 1 2 4 8
+```
+"""
+
+import argparse
+import json
+import os
+from time import perf_counter
+
+from retrieval.ingest import chunk_pages
+
+from .mock import synthetic_page
+
+
+def default_workers() -> list[int]:
+    cores = os.cpu_count() or 1
+    workers = [1]
+    while workers[-1] * 2 <= cores:
+        workers.append(workers[-1] * 2)
+    if workers[-1] != cores:
+        workers.append(cores)
+    return workers
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--pages", type=int, default=500)
+    parser.add_argument("--paragraphs", type=int, default=50, help="Per page")
+    parser.add_argument("--workers", type=int, nargs="+", default=default_workers())
+    parser.add_argument("--splitter", default="", help="See `make_splitter`")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Path of the JSON results")
+    args = parser.parse_args()
+
+    pages = [
+        (f"page-{i}", synthetic_page(args.paragraphs, args.seed + i))
+        for i in range(args.pages)
+    ]
+
+    results = {}
+    for workers in args.workers:
+        start = perf_counter()
+        chunks = sum(
+            len(page_chunks)
+            for _, _, page_chunks in chunk_pages(iter(pages), args.splitter, workers)
+        )
+        seconds = perf_counter() - start
+        results[workers] = {
+            "seconds": seconds,
+            "pages_per_second": args.pages / seconds,
+            "chunks_per_second": chunks / seconds,
+            "speedup": results[args.workers[0]]["seconds"] / seconds
+            if results
+            else 1.0,
+        }
+        print(
+            f"{workers} workers: {args.pages / seconds:.0f} pages/s, "
+            f"{chunks / seconds:.0f} chunks/s, "
+            f"speedup x{results[workers]['speedup']:.2f}"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
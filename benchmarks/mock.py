@@ -0,0 +1,317 @@
+"""
+Fake backends and synthetic corpora for the benchmarks.
+
+`FakeOpenAI` mimics the subset of the `OpenAI()` client that the pipelines use
+(`chat.completions.create` and `embeddings.create`). Answers are deterministic
+and shaped so that the parsers and validators of the pipelines accept them.
+`FakeAsyncOpenAI` and `FakeAsyncHTTP` do the same for the async pipelines.
+"""
+
+import asyncio
+import hashlib
+import json
+import math
+import random
+import re
+import time
+from types import SimpleNamespace
+
+WORDS = """agent memory planning tool reflection task decomposition chain thought
+retrieval vector embedding index query context prompt model token answer
+question python framework pipeline chunk document search ranking critique idea
+merge resolver extraction field validator schema json speaker title link talk
+technology observability latency throughput cache batch stream""".split()
+
+EMBEDDING_DIM = 256
+
+
+def synthetic_text(n_words: int, seed: int) -> str:
+    rng = random.Random(seed)
+    sentences = []
+    while n_words > 0:
+        length = min(n_words, rng.randint(8, 20))
+        words = rng.choices(WORDS, k=length)
+        sentences.append(" ".join(words).capitalize() + ".")
+        n_words -= length
+    return " ".join(sentences)
+
+
+def synthetic_page(n_paragraphs: int, seed: int = 0) -> str:
+    """
+    HTML page with the same structure as the blog scraped by `chatbot`.
+    """
+    paragraphs = "\n".join(
+        f"<p>{synthetic_text(80, seed + i)}</p>" for i in range(n_paragraphs)
+    )
+    return f"""<html><body>
+<h1 class="post-title">Synthetic post {seed}</h1>
+<div class="post-content">
+{paragraphs}
+</div>
+</body></html>"""
+
+
+def synthetic_talk(n_words: int, seed: int = 0) -> str:
+    """
+    Calendar entry with the same shape as the talks processed by `extractor`.
+    """
+    return f"""BEGIN:VCALENDAR
+BEGIN:VEVENT
+SUMMARY:Synthetic talk {seed}
+DESCRIPTION:{synthetic_text(n_words, seed)}
+URL:https://example.com/talks/{seed}
+END:VEVENT
+END:VCALENDAR
+"""
+
+
+def synthetic_questions(n: int, seed: int = 0) -> list[str]:
+    rng = random.Random(seed)
+    return [f"What is {' '.join(rng.choices(WORDS, k=2))}?" for _ in range(n)]
+
+
+def count_tokens(text: str) -> int:
+    """Rough estimation: ~4 characters per token."""
+    return max(1, len(text) // 4)
+
+
+def fake_embedding(text: str) -> list[float]:
+    """
+    Hashing bag-of-words vector: texts that share words get similar vectors,
+    which is enough to exercise retrieval.
+    """
+    vector = [0.0] * EMBEDDING_DIM
+    for word in re.findall(r"\w+", text.lower()):
+        bucket = int.from_bytes(hashlib.blake2b(word.encode(), digest_size=4).digest())
+        vector[bucket % EMBEDDING_DIM] += 1.0
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+def fake_answer(prompt: str, invalid: bool = False, variant: int = 0) -> str:
+    """
+    Answer according to the kind of prompt we receive. The same prompt gets
+    the same free-text answer unless `variant` changes.
+    """
+    if "# Errors" in prompt:
+        return '```json\n[]\n```'
+
+    if "Fields to extract" in prompt or "# Corrected extraction" in prompt:
+        links = [{"url": "https://example.com", "description": "Example link"}]
+        if invalid:
+            links = [{"url": "https://example.com"}]
+        fields = {
+            "title": "Synthetic talk",
+            "speaker": "Jane Doe",
+            "links": links,
+            "technologies": ["Python", "RAG (Retrieval Augmented Generation)"],
+        }
+        return f"```json\n{json.dumps(fields, indent=2)}\n```"
+
+    seed = int.from_bytes(hashlib.blake2b(prompt.encode(), digest_size=4).digest())
+    seed += variant
+    if "response options provided" in prompt:
+        return f"{synthetic_text(60, seed)}\nBest idea: 1"
+    return synthetic_text(60, seed)
+
+
+class FakeCompletions:
+    def __init__(self, latency: float, invalid_rate: float, diversity: float, seed: int):
+        self.latency = latency
+        self.invalid_rate = invalid_rate
+        self.diversity = diversity
+        self.rng = random.Random(seed)
+
+    def create(
+        self,
+        model: str,
+        messages: list[dict[str, str]],
+        max_tokens: int | None = None,
+        stop: list[str] | None = None,
+        stream: bool = False,
+        **kwargs,
+    ):
+        if self.latency:
+            time.sleep(self.latency)
+        return self.respond(model, messages, max_tokens, stop, stream)
+
+    def respond(
+        self,
+        model: str,
+        messages: list[dict[str, str]],
+        max_tokens: int | None = None,
+        stop: list[str] | None = None,
+        stream: bool = False,
+    ):
+        prompt = "\n".join(msg["content"] for msg in messages)
+        invalid = "Fields to extract" in prompt and self.rng.random() < self.invalid_rate
+        variant = self.rng.randint(1, 2**16) if self.rng.random() < self.diversity else 0
+        content = fake_answer(prompt, invalid=invalid, variant=variant)
+
+        finish_reason = "stop"
+        for sequence in stop or []:
+            content = content.split(sequence)[0]
+        if max_tokens is not None and count_tokens(content) > max_tokens:
+            content, finish_reason = content[: max_tokens * 4], "length"
+
+        prompt_tokens = count_tokens(prompt)
+        completion_tokens = count_tokens(content)
+        usage = SimpleNamespace(
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            total_tokens=prompt_tokens + completion_tokens,
+            prompt_tokens_details=SimpleNamespace(cached_tokens=0),
+        )
+
+        if stream:
+            return self.stream(model, content, finish_reason, usage)
+
+        return SimpleNamespace(
+            model=model,
+            choices=[
+                SimpleNamespace(
+                    index=0,
+                    finish_reason=finish_reason,
+                    message=SimpleNamespace(role="assistant", content=content),
+                )
+            ],
+            usage=usage,
+        )
+
+    def stream(self, model: str, content: str, finish_reason: str, usage):
+        """
+        Chunks of a few words, like `stream=True` with
+        `stream_options={"include_usage": True}`.
+        """
+        words = content.split(" ")
+        for i in range(0, len(words), 4):
+            text = " ".join(words[i : i + 4]) + (" " if i + 4 < len(words) else "")
+            last = i + 4 >= len(words)
+            yield SimpleNamespace(
+                model=model,
+                choices=[
+                    SimpleNamespace(
+                        index=0,
+                        delta=SimpleNamespace(content=text),
+                        finish_reason=finish_reason if last else None,
+                    )
+                ],
+                usage=None,
+            )
+        yield SimpleNamespace(model=model, choices=[], usage=usage)
+
+
+class FakeAsyncCompletions(FakeCompletions):
+    async def create(
+        self,
+        model: str,
+        messages: list[dict[str, str]],
+        max_tokens: int | None = None,
+        stop: list[str] | None = None,
+        stream: bool = False,
+        **kwargs,
+    ):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        response = self.respond(model, messages, max_tokens, stop, stream)
+        return self.stream_async(response) if stream else response
+
+    async def stream_async(self, chunks):
+        for chunk in chunks:
+            yield chunk
+
+
+class FakeEmbeddings:
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    def create(self, model: str, input: str | list[str], **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        return self.respond(model, input)
+
+    def respond(self, model: str, input: str | list[str]):
+        texts = [input] if isinstance(input, str) else input
+        tokens = sum(count_tokens(text) for text in texts)
+        return SimpleNamespace(
+            model=model,
+            data=[
+                SimpleNamespace(index=i, embedding=fake_embedding(text))
+                for i, text in enumerate(texts)
+            ],
+            usage=SimpleNamespace(prompt_tokens=tokens, total_tokens=tokens),
+        )
+
+
+class FakeOpenAI:
+    """
+    Replacement for `OpenAI()` with a fixed `latency` per call (in seconds).
+
+    `invalid_rate` is the fraction of extractions that return a link without
+    description, so the retry loop of `extractor` is exercised. `diversity` is
+    the fraction of free-text answers that differ from the usual answer to the
+    same prompt (like sampling with a high temperature).
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        invalid_rate: float = 0.0,
+        diversity: float = 0.0,
+        seed: int = 0,
+    ):
+        self.chat = SimpleNamespace(
+            completions=FakeCompletions(latency, invalid_rate, diversity, seed)
+        )
+        self.embeddings = FakeEmbeddings(latency)
+
+
+class FakeAsyncEmbeddings(FakeEmbeddings):
+    async def create(self, model: str, input: str | list[str], **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self.respond(model, input)
+
+
+class FakeAsyncOpenAI:
+    """
+    Replacement for `AsyncOpenAI()`, see `FakeOpenAI`.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        invalid_rate: float = 0.0,
+        diversity: float = 0.0,
+        seed: int = 0,
+    ):
+        self.chat = SimpleNamespace(
+            completions=FakeAsyncCompletions(latency, invalid_rate, diversity, seed)
+        )
+        self.embeddings = FakeAsyncEmbeddings(latency)
+
+
+class FakeRequests:
+    """
+    Replacement for the `requests` module serving pages from memory.
+    """
+
+    def __init__(self, pages: dict[str, str], latency: float = 0.0):
+        self.pages = pages
+        self.latency = latency
+
+    def get(self, url: str, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        return SimpleNamespace(status_code=200, text=self.pages[url])
+
+
+class FakeAsyncHTTP(FakeRequests):
+    """
+    Replacement for `httpx.AsyncClient` serving pages from memory.
+    """
+
+    async def get(self, url: str, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return SimpleNamespace(status_code=200, text=self.pages[url])
@@ -0,0 +1,305 @@
+"""
+End-to-end benchmark of `chatbot`, `extractor` and `smartllm` with synthetic
+corpora and a mocked backend.
+
+Each pipeline is run `--repeat` times. We keep the median of the wall time
+and of each stage (scrape, split, embed, store, retrieve, prompt, llm, parse,
+validate) plus the peak of memory allocated by Python (`tracemalloc`) in an
+extra run, because tracing memory slows down the code.
+
+```bash
+python -m benchmarks.pipelines --paragraphs 500 --documents 50 --output head.json
+```
+"""
+
+import argparse
+import importlib
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import tracemalloc
+from contextlib import contextmanager, suppress
+from functools import cache, partial
+from time import perf_counter
+
+from gateway.router import Router
+from retrieval.answers import AnswerCache
+from retrieval.embeddings import OpenAIEmbedder
+
+from .mock import (
+    FakeOpenAI,
+    FakeRequests,
+    synthetic_page,
+    synthetic_questions,
+    synthetic_talk,
+)
+from .stages import Stages
+
+# The pipelines create an `OpenAI()` client on import, which requires a key
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+
+RAG_URL = "https://lilianweng.github.io/posts/2023-06-23-agent/"
+
+
+# Corpora are generated once, outside of the measured runs
+synthetic_page = cache(synthetic_page)
+synthetic_questions = cache(synthetic_questions)
+
+
+@cache
+def synthetic_talks(n: int, n_words: int, seed: int) -> list[str]:
+    return [synthetic_talk(n_words, seed + i) for i in range(n)]
+
+
+@contextmanager
+def patched(module, **attrs):
+    """
+    Temporarily replace attributes of a module.
+    """
+    original = {name: getattr(module, name) for name in attrs}
+    for name, value in attrs.items():
+        setattr(module, name, value)
+    try:
+        yield module
+    finally:
+        for name, value in original.items():
+            setattr(module, name, value)
+
+
+class TimedEmbedder:
+    def __init__(self, embedder, stages: Stages):
+        self.embedder = embedder
+        self.model = embedder.model
+        self.stages = stages
+
+    def embed(self, texts: list[str]) -> list[list[float]]:
+        with self.stages.stage("embed"):
+            return self.embedder.embed(texts)
+
+
+class TimedDB:
+    """
+    Wraps a chroma client so the collections it returns time `add` (store)
+    and `query` (retrieve). Embedding time is accounted apart.
+    """
+
+    def __init__(self, db, stages: Stages):
+        self.db = db
+        self.stages = stages
+
+    def get_or_create_collection(self, *args, **kwargs):
+        collection = self.db.get_or_create_collection(*args, **kwargs)
+        collection.add = self.stages.wrap("store", collection.add)
+        collection.query = self.stages.wrap("retrieve", collection.query)
+        return collection
+
+
+def run_chatbot(args, stages: Stages):
+    import chromadb
+    from chromadb.config import Settings
+
+    from solved.rag import v5 as rag
+
+    db = chromadb.EphemeralClient(settings=Settings(anonymized_telemetry=False))
+    # On the first run there is no collection yet
+    with suppress(ValueError):
+        db.delete_collection("rag")
+
+    client = FakeOpenAI(latency=args.latency, seed=args.seed)
+    embedder = OpenAIEmbedder(FakeOpenAI(latency=args.latency))
+    fake = rag.Clients.create(
+        client=client,
+        router=Router(client=client),
+        db=TimedDB(db, stages),
+        embedder=TimedEmbedder(embedder, stages),
+        sources=None,  # Only for `ingest`
+        tenants=None,
+        # Each run starts without cached answers
+        answers=AnswerCache(),
+    )
+    pages = FakeRequests({RAG_URL: synthetic_page(args.paragraphs, args.seed)})
+    with patched(
+        rag,
+        clients=lambda: fake,
+        http=lambda: pages,
+        scrape_web=stages.wrap("scrape", rag.scrape_web),
+        text_splitter=stages.wrap_iter("split", rag.text_splitter),
+        prompt=stages.wrap("prompt", rag.prompt),
+        llm=stages.wrap("llm", rag.llm),
+    ):
+        for question in synthetic_questions(args.questions, args.seed):
+            rag.chatbot(question)
+
+
+def run_extractor(args, stages: Stages):
+    from solved.extractor import v5 as extractor
+
+    model = extractor.Model(
+        fields=[
+            extractor.Field(
+                name=field.name,
+                description=field.description,
+                validator=stages.wrap("validate", field.validator),
+            )
+            for field in extractor.talk.fields
+        ]
+    )
+    client = FakeOpenAI(
+        latency=args.latency, invalid_rate=args.invalid_rate, seed=args.seed
+    )
+    with patched(
+        extractor,
+        router=Router(client=client),
+        extract_fields_prompt=stages.wrap("prompt", extractor.extract_fields_prompt),
+        fix_fields_prompt=stages.wrap("prompt", extractor.fix_fields_prompt),
+        llm=stages.wrap("llm", extractor.llm),
+        parse_json_block=stages.wrap("parse", extractor.parse_json_block),
+    ):
+        for doc in synthetic_talks(args.documents, args.words, args.seed):
+            extractor.extractor(model, doc)
+
+
+def run_smartllm(args, stages: Stages, version: str, **kwargs):
+    """
+    Each call of the fake client answers something different (`--diversity`),
+    so the ideas don't agree and the critique and the merge run too.
+    """
+    smartllm = importlib.import_module(f"solved.smartllm.{version}")
+    client = FakeOpenAI(latency=args.latency, diversity=args.diversity, seed=args.seed)
+    # Stages of the later versions (`compact_merge_prompt`, `stream_llm`...)
+    timed = {
+        name: stages.wrap(stage, getattr(smartllm, name))
+        for name, stage in SMARTLLM_STAGES.items()
+        if hasattr(smartllm, name)
+    }
+    with patched(smartllm, router=Router(client=client), **timed):
+        for question in synthetic_questions(args.questions, args.seed):
+            smartllm.smartllm(question, **kwargs)
+
+
+SMARTLLM_STAGES = {
+    "idea_prompt": "prompt",
+    "critique_prompt": "prompt",
+    "merge_prompt": "prompt",
+    "compact_merge_prompt": "prompt",
+    "llm": "llm",
+    "stream_llm": "llm",
+}
+
+# A fixed key per version: results of different commits compare the same code
+PIPELINES = {
+    "chatbot": run_chatbot,
+    "extractor": run_extractor,
+    "smartllm_v2": partial(run_smartllm, version="v2"),
+    "smartllm_v3": partial(run_smartllm, version="v3"),
+    "smartllm_v5": partial(run_smartllm, version="v5"),
+    # Without the early exit by consensus, whatever the ideas
+    "smartllm_v5_full": partial(run_smartllm, version="v5", consensus_threshold=None),
+}
+
+
+def measure(run, args) -> dict:
+    """
+    Time not covered by any stage (glue code, client setup...) is reported
+    as the `other` stage. Stages that run concurrently (the ideas of
+    smartllm) add up to more than their wall time: the excess is reported
+    as `overlap_seconds`.
+    """
+    run(args, Stages())  # Warm up: imports, corpora and caches
+
+    walls, overlaps, runs = [], [], []
+    for _ in range(args.repeat):
+        stages = Stages()
+        start = perf_counter()
+        run(args, stages)
+        wall = perf_counter() - start
+        overlaps.append(stages.overlap())
+        stages.seconds["other"] = max(0.0, wall - stages.busy())
+        walls.append(wall)
+        runs.append(stages)
+
+    tracemalloc.start()
+    try:
+        run(args, Stages())
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "wall_seconds": statistics.median(walls),
+        "overlap_seconds": statistics.median(overlaps),
+        "peak_memory_bytes": peak,
+        "stages": {
+            name: {
+                "seconds": statistics.median(stages.seconds[name] for stages in runs),
+                "calls": runs[0].calls[name],
+            }
+            for name in runs[0].seconds
+        },
+    }
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--only", nargs="+", choices=PIPELINES, default=list(PIPELINES))
+    parser.add_argument("--paragraphs", type=int, default=200, help="RAG page size")
+    parser.add_argument("--documents", type=int, default=20, help="Talks to extract")
+    parser.add_argument("--words", type=int, default=300, help="Words per talk")
+    parser.add_argument("--questions", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds per call")
+    parser.add_argument("--invalid-rate", type=float, default=0.2)
+    parser.add_argument(
+        "--diversity", type=float, default=1.0, help="Free-text answers that vary"
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Path of the JSON results")
+    args = parser.parse_args()
+
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": {k: v for k, v in vars(args).items() if k != "output"},
+        },
+        "pipelines": {},
+    }
+
+    for name in args.only:
+        result = measure(PIPELINES[name], args)
+        results["pipelines"][name] = result
+
+        print(f"{name}: {result['wall_seconds'] * 1000:.1f} ms, "
+              f"peak {result['peak_memory_bytes'] / 2**20:.1f} MiB, "
+              f"overlap of concurrent stages {result['overlap_seconds'] * 1000:.1f} ms")
+        for stage, values in result["stages"].items():
+            print(f"  {stage:<10} {values['seconds'] * 1000:>10.2f} ms"
+                  f"  ({values['calls']} calls)")
+
+    # Whole process high-water mark (KiB on Linux, bytes on macOS)
+    results["meta"]["maxrss"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
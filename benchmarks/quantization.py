@@ -0,0 +1,141 @@
+"""
+Recall, latency and memory of the `int8` memory-mapped index of
+`retrieval/quantized.py` against exact search over `float32` vectors.
+
+The vectors are synthetic: gaussian clusters (like the topics of a corpus)
+and queries near the vectors of the index. The recall@k is the fraction of
+the `k` exact nearest neighbours that the quantised search returns, for each
+number of re-ranked `--candidates`.
+
+```bash
+python -m benchmarks.quantization --vectors 200000 --dim 384
+```
+"""
+
+import argparse
+import json
+import os
+import tempfile
+from time import perf_counter
+
+import numpy as np
+
+from retrieval.quantized import QuantizedIndex
+
+
+def rss() -> dict[str, int]:
+    """
+    Resident memory of the process in bytes (Linux): `anon` is memory of the
+    process, `file` pages of the page cache mapped by it (they can be
+    reclaimed and shared with other processes).
+    """
+    fields = {"RssAnon": "anon", "RssFile": "file"}
+    memory = {"anon": 0, "file": 0}
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                name, _, value = line.partition(":")
+                if name in fields:
+                    memory[fields[name]] = int(value.split()[0]) * 1024
+    except OSError:
+        pass
+    return memory
+
+
+def delta(before: dict[str, int]) -> dict[str, int]:
+    return {key: value - before[key] for key, value in rss().items()}
+
+
+def synthetic_vectors(n: int, dim: int, clusters: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim), dtype=np.float32)
+    labels = rng.integers(0, clusters, n)
+    noise = rng.standard_normal((n, dim), dtype=np.float32)
+    return centers[labels] + noise * 0.6
+
+
+def mean_ms(fn, queries) -> float:
+    start = perf_counter()
+    for query in queries:
+        fn(query)
+    return (perf_counter() - start) / len(queries) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--vectors", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--clusters", type=int, default=100)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--candidates", type=int, nargs="+", default=[10, 50, 200])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Path of the JSON results")
+    args = parser.parse_args()
+
+    path = tempfile.mkdtemp()
+    vectors = synthetic_vectors(args.vectors, args.dim, args.clusters, args.seed)
+    writer = QuantizedIndex(path)
+    for start in range(0, len(vectors), 10_000):
+        batch = vectors[start : start + 10_000]
+        ids = [str(i) for i in range(start, start + len(batch))]
+        writer.add(batch, ids, ids)
+
+    rng = np.random.default_rng(args.seed + 1)
+    sample = rng.integers(0, args.vectors, args.queries)
+    queries = vectors[sample] + rng.standard_normal((args.queries, args.dim)) * 0.3
+    del vectors, writer
+
+    before = rss()
+    start = perf_counter()
+    index = QuantizedIndex(path)
+    open_seconds = perf_counter() - start
+    quantized_ms = mean_ms(lambda query: index.search(query, args.k), queries)
+    quantized_rss = delta(before)
+
+    before = rss()
+    start = perf_counter()
+    loaded = np.fromfile(os.path.join(path, "vectors.f32"), dtype=np.float32)
+    load_seconds = perf_counter() - start
+    loaded_rss = delta(before)
+    del loaded
+
+    exact = [set(index.exact_search(query, args.k)[0]) for query in queries]
+    exact_ms = mean_ms(lambda query: index.exact_search(query, args.k), queries)
+
+    recall = {}
+    for candidates in args.candidates:
+        found = [
+            len(exact[i] & set(index.search(query, args.k, candidates)[0]))
+            for i, query in enumerate(queries)
+        ]
+        recall[candidates] = sum(found) / (args.k * len(queries))
+
+    results = {
+        "open_seconds": open_seconds,
+        "load_float32_seconds": load_seconds,
+        "codes_bytes": index.codes.nbytes,
+        "float32_bytes": index.vectors.nbytes,
+        "quantized_rss_bytes": quantized_rss,
+        "float32_rss_bytes": loaded_rss,
+        "quantized_query_ms": quantized_ms,
+        "exact_query_ms": exact_ms,
+        "recall": recall,
+    }
+
+    print(f"open {open_seconds * 1000:.1f} ms (mmap), "
+          f"load float32 {load_seconds * 1000:.1f} ms")
+    for name, memory in [("int8 search", quantized_rss), ("float32", loaded_rss)]:
+        print(f"resident {name}: {memory['anon'] / 2**20:.1f} MiB anonymous, "
+              f"{memory['file'] / 2**20:.1f} MiB mapped from files")
+    print(f"query: int8 + re-rank {quantized_ms:.2f} ms, exact {exact_ms:.2f} ms")
+    for candidates, value in recall.items():
+        print(f"recall@{args.k} with {candidates} candidates: {value:.3f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
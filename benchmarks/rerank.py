@@ -0,0 +1,107 @@
+"""
+Quality and prompt size of the re-ranking stage of `retrieval/rerank.py`
+against passing the top 5 chunks of the vector index to the prompt.
+
+Each synthetic chunk has a few rare words and each question asks about the
+rare words of one chunk (its "gold" chunk). The embeddings are a hashing
+bag of words with few `--dimensions`, a weak retriever with collisions like a
+small embedding model. The recall is the fraction of questions whose gold
+chunk reaches the prompt. `cross-encoder` needs `sentence-transformers`
+(and downloads the model the first time), without it it's skipped.
+
+```bash
+python -m benchmarks.rerank --chunks 5000 --candidates 50 --top-n 3
+```
+"""
+
+import argparse
+import json
+import random
+from time import perf_counter
+
+import numpy as np
+
+from retrieval.embeddings import HashingEmbedder
+from retrieval.rerank import BM25Reranker, CrossEncoderReranker
+
+from .mock import WORDS, count_tokens, synthetic_text
+
+
+def corpus(n: int, seed: int) -> tuple[list[str], list[str]]:
+    """
+    Chunks and one question per chunk, about its rare words.
+    """
+    rng = random.Random(seed)
+    rare = [f"{rng.choice(WORDS)}{i}" for i in range(n)]
+    chunks, questions = [], []
+    for i in range(n):
+        words = rng.sample(rare, 3)
+        text = synthetic_text(60, seed + i)
+        chunks.append(f"{text} {' '.join(words)}.")
+        common = " ".join(rng.sample(text.lower().rstrip(".").split(), 3))
+        questions.append(f"What about {common} and {' '.join(words[:2])}?")
+    return chunks, questions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--chunks", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--dimensions", type=int, default=256)
+    parser.add_argument("--candidates", type=int, default=50)
+    parser.add_argument("--top-n", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Path of the JSON results")
+    args = parser.parse_args()
+
+    chunks, questions = corpus(args.chunks, args.seed)
+    embedder = HashingEmbedder(args.dimensions)
+    vectors = np.array(embedder.embed(chunks), dtype=np.float32)
+    gold = random.Random(args.seed).sample(range(args.chunks), args.queries)
+
+    def retrieve(question: str, n: int) -> list[str]:
+        scores = vectors @ np.array(embedder.embed_one(question), dtype=np.float32)
+        return [chunks[i] for i in np.argsort(-scores)[:n]]
+
+    strategies = {
+        "top5": lambda question: retrieve(question, 5),
+        "bm25": lambda question: BM25Reranker().rerank(
+            question, retrieve(question, args.candidates), args.top_n
+        ),
+        "cross-encoder": lambda question: CrossEncoderReranker().rerank(
+            question, retrieve(question, args.candidates), args.top_n
+        ),
+    }
+
+    results = {}
+    for name, strategy in strategies.items():
+        found, tokens, seconds = 0, 0, 0.0
+        try:
+            for i in gold:
+                start = perf_counter()
+                context = strategy(questions[i])
+                seconds += perf_counter() - start
+                found += chunks[i] in context
+                tokens += count_tokens("\n".join(context) + questions[i])
+        except ImportError as e:
+            print(f"{name}: skipped ({e})")
+            continue
+
+        results[name] = {
+            "recall": found / len(gold),
+            "prompt_tokens": tokens / len(gold),
+            "retrieve_ms": seconds / len(gold) * 1000,
+        }
+        print(
+            f"{name}: recall {found / len(gold):.2f}, "
+            f"{tokens / len(gold):.0f} prompt tokens, "
+            f"{seconds / len(gold) * 1000:.2f} ms retrieving"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
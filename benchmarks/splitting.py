@@ -0,0 +1,152 @@
+"""
+Parameter sweep of the splitters of `retrieval/splitting.py`:
+`span_splitter` (fixed size in characters) against `StructuredSplitter`
+(sections, paragraphs and sentences sized in tokens), for several chunk
+sizes and overlaps.
+
+The synthetic pages have sections with a heading and a few paragraphs; one
+sentence of each section states a fact with rare words ("Its {a} for {b}
+equals {c}.") and each question asks about one fact with other words (the
+hashing embedder has no IDF: shared stop words would match every fact).
+With too few `--dimensions` the collisions of the hashing embedder hide the
+rare words and every splitter scores low. A question is found at `k`
+when one of its `k` first chunks contains the whole fact (recall@k). Per
+configuration: the chunks, the size of the index (vectors and texts) and
+how much larger it is than the corpus, the ingestion time (split, embed and
+add to a `QuantizedIndex`) and the latency of a query.
+
+```bash
+python -m benchmarks.splitting --pages 200 --sections 6
+```
+"""
+
+import argparse
+import json
+import random
+import statistics
+import tempfile
+from time import perf_counter
+
+from retrieval.embeddings import HashingEmbedder
+from retrieval.quantized import QuantizedIndex
+from retrieval.splitting import StructuredSplitter, span_splitter
+
+from .mock import WORDS, synthetic_text
+
+SPAN_SIZES = [(250, 0), (500, 100), (1000, 0), (1000, 200), (2000, 400)]
+STRUCTURED_SIZES = [(64, 0), (128, 0), (256, 0), (256, 32), (512, 64)]
+
+
+def corpus(
+    pages: int, sections: int, seed: int
+) -> tuple[list[bytes], list[tuple[str, bytes]]]:
+    """
+    Pages (as `parse_post` leaves them: a block per line) and one question
+    per section with the fact that answers it.
+    """
+    rng = random.Random(seed)
+    docs, questions = [], []
+    for p in range(pages):
+        lines = [f"Synthetic post {p}"]
+        for s in range(sections):
+            a, b, c = (f"{rng.choice(WORDS)}{p}x{s}x{i}" for i in range(3))
+            fact = f"Its {a} for {b} equals {c}."
+            paragraphs = [
+                synthetic_text(rng.randint(40, 120), seed + p * 1000 + s * 10 + i)
+                for i in range(rng.randint(2, 5))
+            ]
+            at = rng.randrange(len(paragraphs))
+            paragraphs[at] = f"{paragraphs[at]} {fact}"
+            lines.append(f"Section {s}: {' '.join(rng.choices(WORDS, k=3))}")
+            lines.extend(paragraphs)
+            questions.append((f"What about {a} and {b}?", fact.encode()))
+        docs.append("\n".join(lines).encode())
+    return docs, questions
+
+
+def sweep(docs, splitter, embedder, queries, k) -> dict[str, float]:
+    corpus_bytes = sum(len(doc) for doc in docs)
+    index = QuantizedIndex(tempfile.mkdtemp(prefix="splitting-"))
+
+    start = perf_counter()
+    chunks = [doc[s:e] for doc in docs for s, e in splitter(doc)]
+    split_seconds = perf_counter() - start
+    texts = [chunk.decode() for chunk in chunks]
+    for batch in range(0, len(texts), 1000):
+        part = texts[batch : batch + 1000]
+        ids = [str(batch + i) for i in range(len(part))]
+        index.add(embedder.embed(part), ids, part)
+    ingest_seconds = perf_counter() - start
+
+    found = {1: 0, k: 0}
+    latencies = []
+    for question, fact in queries:
+        start = perf_counter()
+        positions, _ = index.search(embedder.embed_one(question), k)
+        latencies.append((perf_counter() - start) * 1000)
+        hits = [fact in chunks[i] for i in positions]
+        found[1] += any(hits[:1])
+        found[k] += any(hits)
+
+    text_bytes = sum(len(chunk) for chunk in chunks)
+    index_bytes = text_bytes + len(chunks) * embedder.dimensions * (4 + 1)
+    return {
+        "chunks": len(chunks),
+        "mean_chunk_bytes": text_bytes / len(chunks),
+        "index_mib": index_bytes / 2**20,
+        "text_inflation": text_bytes / corpus_bytes,
+        "split_seconds": split_seconds,
+        "ingest_seconds": ingest_seconds,
+        "query_p50_ms": statistics.median(latencies),
+        "recall_at_1": found[1] / len(queries),
+        f"recall_at_{k}": found[k] / len(queries),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--sections", type=int, default=6, help="Per page")
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--dimensions", type=int, default=1024)
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Path of the JSON results")
+    args = parser.parse_args()
+
+    docs, questions = corpus(args.pages, args.sections, args.seed)
+    queries = random.Random(args.seed).sample(
+        questions, min(args.queries, len(questions))
+    )
+    embedder = HashingEmbedder(args.dimensions)
+
+    splitters = {
+        f"span:{size}:{overlap}": lambda doc, size=size, overlap=overlap: (
+            span_splitter(doc, size, overlap)
+        )
+        for size, overlap in SPAN_SIZES
+    }
+    splitters |= {
+        f"structured:{tokens}:{overlap}": StructuredSplitter(tokens, overlap)
+        for tokens, overlap in STRUCTURED_SIZES
+    }
+
+    results = {}
+    for name, splitter in splitters.items():
+        row = sweep(docs, splitter, embedder, queries, args.k)
+        results[name] = row
+        print(
+            f"{name}: {row['chunks']} chunks ({row['mean_chunk_bytes']:.0f} B), "
+            f"index {row['index_mib']:.1f} MiB (x{row['text_inflation']:.2f} text), "
+            f"ingest {row['ingest_seconds']:.2f} s, query "
+            f"{row['query_p50_ms']:.2f} ms, recall@1 {row['recall_at_1']:.2f}, "
+            f"recall@{args.k} {row[f'recall_at_{args.k}']:.2f}"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Per-stage timer. Stages can be nested (e.g. `validate` calls `llm`): each
+stage only accounts for its own time, so the stages of a run add up to its
+wall time. When stages run in several threads at once they add up to more:
+`busy` is the wall time covered by any stage (the union of their intervals)
+and `overlap` how much the stages add up beyond it.
+"""
+
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import wraps
+from time import perf_counter
+
+
+class Stages:
+    def __init__(self):
+        self.seconds = defaultdict(float)
+        self.calls = defaultdict(int)
+        # (start, end) of every stage, nested ones included
+        self.intervals: list[tuple[float, float]] = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str):
+        stack = self._local.__dict__.setdefault("stack", [])
+        frame = [0.0]  # time spent in nested stages
+        stack.append(frame)
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            end = perf_counter()
+            elapsed = end - start
+            stack.pop()
+            if stack:
+                stack[-1][0] += elapsed
+            with self._lock:
+                self.seconds[name] += elapsed - frame[0]
+                self.calls[name] += 1
+                self.intervals.append((start, end))
+
+    def busy(self) -> float:
+        """
+        Wall time during which at least one stage was running.
+        """
+        with self._lock:
+            intervals = sorted(self.intervals)
+        total, current_start, current_end = 0.0, None, None
+        for start, end in intervals:
+            if current_end is None or start > current_end:
+                if current_end is not None:
+                    total += current_end - current_start
+                current_start, current_end = start, end
+            else:
+                current_end = max(current_end, end)
+        if current_end is not None:
+            total += current_end - current_start
+        return total
+
+    def overlap(self) -> float:
+        """
+        Seconds of the stages that ran at the same time as others.
+        """
+        return max(0.0, sum(self.seconds.values()) - self.busy())
+
+    def wrap(self, name: str, fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with self.stage(name):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    def wrap_iter(self, name: str, fn):
+        """
+        Like `wrap` for generators: only the time spent producing each item
+        is accounted, not the time the consumer spends with it.
+        """
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            iterator = iter(fn(*args, **kwargs))
+            while True:
+                with self.stage(name):
+                    try:
+                        item = next(iterator)
+                    except StopIteration:
+                        return
+                yield item
+
+        return wrapper
+
+    def to_dict(self) -> dict[str, dict[str, float]]:
+        return {
+            name: {"seconds": self.seconds[name], "calls": self.calls[name]}
+            for name in self.seconds
+        }
@@ -0,0 +1,186 @@
+"""
+Start time of the CLI entry points, from `python -X importtime`.
+
+For each module, "cold" is the first import (it may compile the `.pyc`
+files) and "warm" the median of the next `--repeat`. The heaviest imports
+show where the time goes.
+
+With `--daemon` it also measures a question to `solved/rag/v4.py` answered
+by its daemon (with a mocked backend) from a new process, which only pays
+for the imports of the client.
+
+```bash
+python -m benchmarks.startup --daemon
+```
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from time import perf_counter
+
+ENTRY_POINTS = [
+    "rag",
+    "smartllm",
+    "solved.rag.v2",
+    "solved.rag.v3",
+    "solved.rag.v4",
+    "solved.rag.v5",
+    "solved.smartllm.v5",
+    "solved.extractor.v5",
+]
+
+IMPORT_TIME_RE = re.compile(r"import time:\s*(\d+) \|\s*(\d+) \| (\s*)(\S+)")
+
+
+def parse_import_time(
+    stderr: str, module: str
+) -> tuple[float, list[tuple[str, float]]]:
+    """
+    Cumulative seconds of `module` and of the modules it imports directly,
+    from the heaviest.
+    """
+    children, total = [], 0.0
+    for line in stderr.splitlines():
+        match = IMPORT_TIME_RE.match(line)
+        if not match:
+            continue
+        cumulative = int(match.group(2)) / 1e6
+        depth, name = len(match.group(3)), match.group(4)
+        # The children are printed before their parent
+        if depth == 0:
+            if name == module:
+                total = cumulative
+                break
+            children = []
+        elif depth == 2:
+            children.append((name, cumulative))
+    return total, sorted(children, key=lambda child: -child[1])
+
+
+def import_time(module: str) -> dict:
+    start = perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    wall = perf_counter() - start
+    if result.returncode != 0:
+        error = result.stderr.strip().splitlines()[-1]
+        return {"error": error}
+
+    seconds, children = parse_import_time(result.stderr, module)
+    return {"wall_seconds": wall, "import_seconds": seconds, "heaviest": children[:5]}
+
+
+def measure_imports(module: str, repeat: int) -> dict:
+    cold = import_time(module)
+    if "error" in cold:
+        return cold
+
+    warm = [import_time(module) for _ in range(repeat)]
+    return {
+        "cold_seconds": cold["import_seconds"],
+        "warm_seconds": statistics.median(run["import_seconds"] for run in warm),
+        "warm_wall_seconds": statistics.median(run["wall_seconds"] for run in warm),
+        "heaviest": warm[0]["heaviest"],
+    }
+
+
+def serve_fake(path: str):
+    """
+    Daemon of `solved/rag/v4.py` with mocked backends.
+    """
+    import asyncio
+
+    import chromadb
+    from chromadb.config import Settings
+
+    from gateway.ratelimit import RateLimiter
+    from gateway.retry import Retry
+    from gateway.router import Router
+    from solved.rag import v4 as rag
+
+    from .mock import FakeAsyncHTTP, FakeAsyncOpenAI, synthetic_page
+
+    client = FakeAsyncOpenAI()
+    fake = rag.Clients(
+        client=client,
+        limiter=RateLimiter(),
+        router=Router(client=client),
+        retry=Retry(),
+        db=chromadb.EphemeralClient(settings=Settings(anonymized_telemetry=False)),
+        http=FakeAsyncHTTP({url: synthetic_page(50, 0) for url in rag.URLS}),
+    )
+    rag.clients = lambda: fake
+    asyncio.run(rag.serve(path))
+
+
+def measure_daemon(repeat: int) -> dict:
+    path = os.path.join(tempfile.mkdtemp(), "rag.sock")
+    code = f"from benchmarks.startup import serve_fake; serve_fake({path!r})"
+    daemon = subprocess.Popen([sys.executable, "-c", code], stdout=subprocess.DEVNULL)
+    try:
+        while not os.path.exists(path):
+            if daemon.poll() is not None:
+                raise RuntimeError("The daemon didn't start")
+            time.sleep(0.05)
+
+        command = [sys.executable, "-m", "solved.rag.v4", "--socket", path, "Why?"]
+        times = []
+        for _ in range(repeat + 1):
+            start = perf_counter()
+            subprocess.run(command, check=True, capture_output=True)
+            times.append(perf_counter() - start)
+    finally:
+        daemon.terminate()
+        daemon.wait()
+
+    return {"cold_seconds": times[0], "warm_seconds": statistics.median(times[1:])}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--only", nargs="+", default=ENTRY_POINTS, help="Modules")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--daemon", action="store_true", help="Measure the daemon")
+    parser.add_argument("--output", help="Path of the JSON results")
+    args = parser.parse_args()
+
+    os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+
+    results = {}
+    for module in args.only:
+        results[module] = result = measure_imports(module, args.repeat)
+        if "error" in result:
+            print(f"{module}: {result['error']}")
+            continue
+        heaviest = ", ".join(
+            f"{name} {seconds * 1000:.0f} ms" for name, seconds in result["heaviest"]
+        )
+        print(f"{module}: cold {result['cold_seconds'] * 1000:.0f} ms, "
+              f"warm {result['warm_seconds'] * 1000:.0f} ms "
+              f"(process {result['warm_wall_seconds'] * 1000:.0f} ms)")
+        print(f"  {heaviest}")
+
+    if args.daemon:
+        results["daemon"] = daemon = measure_daemon(args.repeat)
+        print(f"question to the daemon: cold {daemon['cold_seconds'] * 1000:.0f} ms, "
+              f"warm {daemon['warm_seconds'] * 1000:.0f} ms")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Render cost of the precompiled prompt templates (`gateway/templates.py`)
+against the f-strings of the previous versions.
+
+- `extract`: `extract_fields_prompt` of the extractor v4 (f-string, formats
+  every field on each call) against v5 (template precompiled per model) with
+  models of `--fields` fields.
+- `merge`: `merge_prompt` of smartllm v4 (renders `critique_prompt` and
+  `idea_prompt` again) against v5 (one template) with `--ideas` ideas.
+
+```bash
+python -m benchmarks.templates --fields 4 64 512 4096
+```
+"""
+
+import argparse
+import json
+import os
+from functools import partial
+from timeit import Timer
+
+from .mock import synthetic_talk, synthetic_text
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+
+def per_call_us(fn) -> float:
+    timer = Timer(fn)
+    number, _ = timer.autorange()
+    runs = timer.repeat(repeat=5, number=number)
+    return min(runs) / number * 1_000_000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--fields", type=int, nargs="+", default=[4, 64, 512, 4096])
+    parser.add_argument("--ideas", type=int, nargs="+", default=[2, 8, 32])
+    parser.add_argument("--words", type=int, default=500, help="Words per document")
+    parser.add_argument("--output", help="Path of the JSON results")
+    args = parser.parse_args()
+
+    from solved.extractor import v4 as extractor_v4
+    from solved.extractor import v5 as extractor_v5
+    from solved.smartllm import v4 as smartllm_v4
+    from solved.smartllm import v5 as smartllm_v5
+
+    results = {"extract": {}, "merge": {}}
+    doc = synthetic_talk(args.words)
+    for n in args.fields:
+        fields = [
+            extractor_v5.Field(name=f"field_{i}", description=f"Field number {i}")
+            for i in range(n)
+        ]
+        v4 = extractor_v4.Model(fields=fields)
+        v5 = extractor_v5.Model(fields=fields)
+        # Same prompt, only the way of building it changes
+        expected = extractor_v4.extract_fields_prompt(v4, doc)
+        assert extractor_v5.extract_fields_prompt(v5, doc) == expected
+
+        row = {
+            "fstring_us": per_call_us(
+                partial(extractor_v4.extract_fields_prompt, v4, doc)
+            ),
+            "template_us": per_call_us(
+                partial(extractor_v5.extract_fields_prompt, v5, doc)
+            ),
+            # First call of a model: formats its fields and precompiles
+            "template_first_call_us": per_call_us(
+                lambda fields=fields: extractor_v5.extract_fields_prompt(
+                    extractor_v5.Model(fields=fields), doc
+                )
+            ),
+        }
+        results["extract"][n] = row
+        print(
+            f"extract, {n} fields: f-string {row['fstring_us']:.1f} us, "
+            f"template {row['template_us']:.1f} us "
+            f"(first call {row['template_first_call_us']:.1f} us)"
+        )
+
+    question = "What is the meaning of life?"
+    critique = synthetic_text(300, 1)
+    for n in args.ideas:
+        ideas = [synthetic_text(200, seed) for seed in range(n)]
+        row = {
+            "fstring_us": per_call_us(
+                partial(smartllm_v4.merge_prompt, question, ideas, critique)
+            ),
+            "template_us": per_call_us(
+                partial(smartllm_v5.merge_prompt, question, ideas, critique)
+            ),
+        }
+        results["merge"][n] = row
+        print(
+            f"merge, {n} ideas: f-string {row['fstring_us']:.1f} us, "
+            f"template {row['template_us']:.1f} us"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
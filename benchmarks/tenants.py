@@ -0,0 +1,125 @@
+"""
+Latency and memory of the per-tenant indexes of `retrieval/tenants.py` under
+a memory budget.
+
+`--tenants` indexes of `--chunks` synthetic chunks each; the queries follow
+a Zipf distribution (a few hot tenants, a long tail of cold ones). The
+latency of a query (getting the index and searching it) is reported apart
+for warm indexes and for the ones that had to be opened, with the hit rate,
+the evictions and the estimated memory of the open indexes.
+
+```bash
+python -m benchmarks.tenants --tenants 50 --budget-mb 20 --store quantized
+```
+"""
+
+import argparse
+import json
+import random
+import statistics
+import tempfile
+from time import perf_counter
+
+from retrieval.embeddings import EmbeddingFunction, HashingEmbedder
+from retrieval.quantized import QuantizedClient
+from retrieval.tenants import Tenants, chroma_settings
+
+from .mock import synthetic_text
+
+
+def open_db(store: str, path: str, budget: int):
+    if store == "quantized":
+        return QuantizedClient(path)
+
+    import chromadb
+    from chromadb.config import Settings
+
+    return chromadb.PersistentClient(
+        path=path,
+        settings=Settings(anonymized_telemetry=False, **chroma_settings(budget)),
+    )
+
+
+def percentile(values: list[float], q: float) -> float:
+    return sorted(values)[int(q * (len(values) - 1))] if values else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--tenants", type=int, default=50)
+    parser.add_argument("--chunks", type=int, default=1000, help="Per tenant")
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--budget-mb", type=float, default=20)
+    parser.add_argument("--zipf", type=float, default=1.2, help="Skew of the tenants")
+    parser.add_argument("--store", choices=["quantized", "chroma"], default="quantized")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Path of the JSON results")
+    args = parser.parse_args()
+
+    embedder = HashingEmbedder()
+    budget = int(args.budget_mb * 2**20)
+    path = tempfile.mkdtemp(prefix="tenants-")
+    db = open_db(args.store, path, budget)
+    ef = EmbeddingFunction(embedder)
+    item_bytes = 4 * embedder.dimensions
+
+    # Indexing, without budget so nothing is evicted while writing
+    writer = Tenants(db, ef, path, item_bytes=item_bytes)
+    for t in range(args.tenants):
+        texts = [synthetic_text(60, t * args.chunks + i) for i in range(args.chunks)]
+        collection = writer.get(f"tenant-{t}").collection
+        for start in range(0, len(texts), 500):
+            batch = texts[start : start + 500]
+            collection.add(
+                ids=[f"{t}-{start + i}" for i in range(len(batch))],
+                documents=batch,
+                embeddings=embedder.embed(batch),
+            )
+    del writer
+
+    tenants = Tenants(db, ef, path, memory_budget=budget, item_bytes=item_bytes)
+    rng = random.Random(args.seed)
+    weights = [1 / (rank + 1) ** args.zipf for rank in range(args.tenants)]
+    questions = [synthetic_text(8, 10**6 + i) for i in range(args.queries)]
+    vectors = embedder.embed(questions)
+
+    warm, cold, peak = [], [], 0
+    for vector in vectors:
+        [t] = rng.choices(range(args.tenants), weights)
+        loads = tenants.loads
+        start = perf_counter()
+        tenant = tenants.get(f"tenant-{t}")
+        tenant.collection.query(query_embeddings=[vector], n_results=5)
+        seconds = perf_counter() - start
+        (cold if tenants.loads > loads else warm).append(seconds * 1000)
+        peak = max(peak, tenants.memory())
+
+    metrics = tenants.metrics()
+    results = {
+        "warm_p50_ms": percentile(warm, 0.5),
+        "warm_p95_ms": percentile(warm, 0.95),
+        "cold_p50_ms": percentile(cold, 0.5),
+        "cold_p95_ms": percentile(cold, 0.95),
+        "mean_ms": statistics.mean(warm + cold),
+        "hit_rate": metrics["hit_rate"],
+        "evictions": metrics["evictions"],
+        "peak_memory_mib": peak / 2**20,
+        "budget_mib": args.budget_mb,
+        "index_mib": args.chunks * item_bytes / 2**20,
+    }
+    print(
+        f"{args.store}: warm p50 {results['warm_p50_ms']:.2f} ms "
+        f"(p95 {results['warm_p95_ms']:.2f}), cold p50 "
+        f"{results['cold_p50_ms']:.2f} ms (p95 {results['cold_p95_ms']:.2f}), "
+        f"hit rate {results['hit_rate']:.2f}, {results['evictions']} evictions, "
+        f"peak {results['peak_memory_mib']:.1f} of {args.budget_mb:.0f} MiB "
+        f"({results['index_mib']:.1f} MiB per index)"
+    )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,7 @@
+"""
+Helpers for the calls to the LLM provider that production pipelines need and
+the workshop examples leave out on purpose: retries, deadlines, hedging...
+
+Each one is a small module with no magic so the `llm()` function of each
+pipeline is still readable: you can see what is done in every call.
+"""
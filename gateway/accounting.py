@@ -0,0 +1,258 @@
+"""
+Token and cost accounting per pipeline, stage and model, with budgets.
+
+```python
+ledger = default_ledger()
+
+
+@ledger.request("extractor")
+def extractor(model, doc): ...
+
+
+def llm(prompt, model):
+    model = ledger.model(model)  # Downgraded or `BudgetExceeded`
+    response = client.chat.completions.create(model=model, ...)
+    ledger.record(model, response.usage)
+```
+
+`ledger.stage("validate")` attributes the calls inside it to that stage
+(the innermost one wins). The request, the stage and its budget live in
+context variables: they follow `asyncio` tasks and, with
+`contextvars.copy_context().run`, thread pools.
+
+Two budgets, both in tokens and/or dollars:
+
+- Per request (`BUDGET_REQUEST_TOKENS`, `BUDGET_REQUEST_COST`): one call to
+  the pipeline.
+- Per job (`BUDGET_JOB_TOKENS`, `BUDGET_JOB_COST`): everything the process
+  does with this ledger.
+
+Once a budget is spent, the models of `downgrade` are replaced with their
+cheaper one and calls to any other model raise `BudgetExceeded`. The check
+is done before each call, so a budget can be exceeded by one call.
+
+`ledger.to_dict()` returns the totals and, with `USAGE_FILE`, they are saved
+as JSON when the process exits. `default_ledger()` is shared by all the
+pipelines of the process, so the job budget covers all of them.
+"""
+
+import atexit
+import functools
+import json
+import os
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+
+# USD per million tokens: prompt, cached prompt and completion
+PRICES = {
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "gpt-4o": (2.50, 1.25, 10.00),
+}
+
+DOWNGRADE = {"gpt-4o": "gpt-4o-mini"}
+
+# Price of the calls sent through the Batch API (see `gateway/batch.py`)
+BATCH_DISCOUNT = 0.5
+
+
+class BudgetExceeded(Exception):
+    pass
+
+
+@dataclass
+class Usage:
+    calls: int = 0
+    prompt_tokens: int = 0
+    cached_tokens: int = 0
+    completion_tokens: int = 0
+    cost: float = 0.0
+
+    @property
+    def tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    def add(self, other: "Usage"):
+        self.calls += other.calls
+        self.prompt_tokens += other.prompt_tokens
+        self.cached_tokens += other.cached_tokens
+        self.completion_tokens += other.completion_tokens
+        self.cost += other.cost
+
+
+def call_usage(model: str, usage, discount: float = 1.0) -> Usage:
+    """
+    `Usage` of one call from `response.usage` (`None` if the API didn't
+    return it). `discount` multiplies the price.
+    """
+    if usage is None:
+        return Usage(calls=1)
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = (getattr(details, "cached_tokens", None) or 0) if details else 0
+
+    prompt, cached_prompt, completion = PRICES.get(model, (0.0, 0.0, 0.0))
+    cost = (
+        (usage.prompt_tokens - cached) * prompt
+        + cached * cached_prompt
+        + usage.completion_tokens * completion
+    ) * discount / 1_000_000
+    return Usage(1, usage.prompt_tokens, cached, usage.completion_tokens, cost)
+
+
+@dataclass
+class Budget:
+    max_tokens: int | None = None
+    max_cost: float | None = None
+    used: Usage = field(default_factory=Usage)
+
+    def spent(self) -> bool:
+        if self.max_tokens is not None and self.used.tokens >= self.max_tokens:
+            return True
+        return self.max_cost is not None and self.used.cost >= self.max_cost
+
+
+@dataclass
+class Request:
+    pipeline: str
+    budget: Budget
+    stage: str = "main"
+
+
+_request: ContextVar[Request | None] = ContextVar("request", default=None)
+
+
+def number(name: str, cast=float):
+    value = os.getenv(name)
+    return cast(value) if value else None
+
+
+class Ledger:
+    def __init__(
+        self,
+        request_budget: Budget | None = None,
+        job_budget: Budget | None = None,
+        downgrade: dict[str, str] = DOWNGRADE,
+    ):
+        # Limits of the budget of each request (`used` is ignored)
+        self.request_budget = request_budget or Budget()
+        self.job = job_budget or Budget()
+        self.downgrade = downgrade
+        self.downgrades = 0
+        self.aborted = 0
+        # (pipeline, stage, model) -> usage
+        self.totals: dict[tuple[str, str, str], Usage] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "Ledger":
+        ledger = cls(
+            request_budget=Budget(
+                number("BUDGET_REQUEST_TOKENS", int), number("BUDGET_REQUEST_COST")
+            ),
+            job_budget=Budget(
+                number("BUDGET_JOB_TOKENS", int), number("BUDGET_JOB_COST")
+            ),
+        )
+        if path := os.getenv("USAGE_FILE"):
+            atexit.register(ledger.save, path)
+        return ledger
+
+    def new_request(self, pipeline: str, budget: Budget | None = None) -> Request:
+        limits = budget or self.request_budget
+        return Request(pipeline, Budget(limits.max_tokens, limits.max_cost))
+
+    @contextmanager
+    def request(
+        self,
+        pipeline: str,
+        budget: Budget | None = None,
+        resume: Request | None = None,
+    ):
+        """
+        A call to `pipeline` with its own budget (by default the limits of
+        `request_budget`). Can be used as a decorator. With `resume`, the
+        calls are added to that request instead (e.g. a document of a batch
+        job, extracted over several rounds).
+        """
+        request = resume or self.new_request(pipeline, budget)
+        token = _request.set(request)
+        try:
+            yield request
+        finally:
+            _request.reset(token)
+
+    @contextmanager
+    def stage(self, name: str):
+        current = _request.get() or Request("-", Budget())
+        token = _request.set(Request(current.pipeline, current.budget, name))
+        try:
+            yield
+        finally:
+            _request.reset(token)
+
+    def model(self, model: str) -> str:
+        """
+        Model to call instead of `model` according to the budgets.
+        """
+        request = _request.get()
+        budgets = [self.job] + ([request.budget] if request else [])
+        with self._lock:
+            if not any(budget.spent() for budget in budgets):
+                return model
+            if model in self.downgrade:
+                self.downgrades += 1
+                return self.downgrade[model]
+            self.aborted += 1
+        where = f"{request.pipeline}/{request.stage}" if request else "job"
+        raise BudgetExceeded(f"Budget of {where} spent, {model} not called")
+
+    def record(self, model: str, usage, discount: float = 1.0) -> Usage:
+        """
+        Attributes the `usage` of a response of `model` to the current
+        pipeline and stage.
+        """
+        used = call_usage(model, usage, discount)
+        request = _request.get()
+        pipeline, stage = (request.pipeline, request.stage) if request else ("-", "-")
+        key = (pipeline, stage, model)
+        with self._lock:
+            self.totals.setdefault(key, Usage()).add(used)
+            self.job.used.add(used)
+            if request is not None:
+                request.budget.used.add(used)
+        return used
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            rows = [
+                {"pipeline": pipeline, "stage": stage, "model": model, **asdict(usage)}
+                for (pipeline, stage, model), usage in sorted(self.totals.items())
+            ]
+            return {
+                "total": asdict(self.job.used),
+                "downgrades": self.downgrades,
+                "aborted": self.aborted,
+                "stages": rows,
+            }
+
+    def save(self, path: str):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def __str__(self) -> str:
+        lines = []
+        for row in self.to_dict()["stages"]:
+            lines.append(
+                f"{row['pipeline']}/{row['stage']} {row['model']}: "
+                f"{row['calls']} calls, {row['prompt_tokens']} prompt "
+                f"({row['cached_tokens']} cached), {row['completion_tokens']} "
+                f"completion, ${row['cost']:.4f}"
+            )
+        return "\n".join(lines)
+
+
+@functools.cache
+def default_ledger() -> Ledger:
+    # Created on first use, after the pipelines load `.env`
+    return Ledger.from_env()
@@ -0,0 +1,220 @@
+"""
+Batch API: the requests of a whole job go in one JSONL file that the
+provider processes offline (at half the price, within a completion window
+of up to 24h) instead of one round trip per request.
+
+```python
+batches = OpenAIBatches(openai_client())  # or LocalBatches(router.create)
+requests = {"talk-1": {"model": "gpt-4o-mini", "messages": [...]}, ...}
+outputs = run_batch(batches, requests, "round-1.jsonl")
+# custom_id -> `ChatCompletion`, or `BatchError` if that request failed
+```
+
+`run_batch` writes the file, submits it, polls until the batch ends and
+reads the output and error files. Requests without a result (for example
+when the batch expires or fails) come back as `BatchError`, so the caller
+can send them again in the next batch. A file has one model and at most
+`MAX_REQUESTS` requests and `MAX_BYTES` (the limits of the Batch API): larger
+jobs are split into several batches, submitted together.
+
+`LocalBatches` is a stand-in for the endpoint: it runs the requests of the
+file in a pool of threads with any `create` function (a local backend,
+`router.create`, a fake client...) and returns an output file with the same
+format as the provider.
+"""
+
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable
+
+ENDPOINT = "/v1/chat/completions"
+
+# States of a batch that won't change anymore
+FINISHED = {"completed", "expired", "failed", "cancelled"}
+
+# Limits of an input file of the Batch API
+MAX_REQUESTS = 50_000
+MAX_BYTES = 200 * 2**20
+
+
+class BatchError(Exception):
+    pass
+
+
+def request_line(custom_id: str, body: dict[str, Any]) -> str:
+    line = {"custom_id": custom_id, "method": "POST", "url": ENDPOINT}
+    return json.dumps({**line, "body": body}) + "\n"
+
+
+def write_requests(path: str, requests: dict[str, dict[str, Any]]):
+    with open(path, "w") as f:
+        f.writelines(
+            request_line(custom_id, body) for custom_id, body in requests.items()
+        )
+
+
+def split_requests(
+    requests: dict[str, dict[str, Any]],
+    max_requests: int = MAX_REQUESTS,
+    max_bytes: int = MAX_BYTES,
+) -> list[dict[str, dict[str, Any]]]:
+    """
+    Groups `requests` in files of one model within the limits of a batch.
+    """
+    parts: list[dict[str, dict[str, Any]]] = []
+    open_parts: dict[str, tuple[dict[str, dict[str, Any]], int]] = {}
+    for custom_id, body in requests.items():
+        size = len(request_line(custom_id, body).encode())
+        part, used = open_parts.get(body.get("model"), ({}, 0))
+        if part and (len(part) >= max_requests or used + size > max_bytes):
+            part, used = {}, 0
+        if not part:
+            parts.append(part)
+        part[custom_id] = body
+        open_parts[body.get("model")] = (part, used + size)
+    return parts
+
+
+def read_results(text: str) -> dict[str, Any]:
+    """
+    `custom_id` -> `ChatCompletion` or `BatchError` of the lines of an output
+    (or error) file.
+    """
+    from openai.types.chat import ChatCompletion
+
+    results = {}
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        row = json.loads(line)
+        response = row.get("response") or {}
+        if row.get("error") or response.get("status_code") != 200:
+            error = row.get("error") or response.get("body")
+            results[row["custom_id"]] = BatchError(error)
+        else:
+            results[row["custom_id"]] = ChatCompletion.model_validate(response["body"])
+    return results
+
+
+class OpenAIBatches:
+    """
+    Batch API of OpenAI (and compatible providers).
+    """
+
+    poll = 60.0  # Seconds between checks of the state
+
+    def __init__(self, client, completion_window: str = "24h"):
+        self.client = client
+        self.completion_window = completion_window
+
+    def submit(self, path: str) -> str:
+        with open(path, "rb") as f:
+            file = self.client.files.create(file=f, purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=file.id,
+            endpoint=ENDPOINT,
+            completion_window=self.completion_window,
+        )
+        return batch.id
+
+    def status(self, batch_id: str) -> str:
+        return self.client.batches.retrieve(batch_id).status
+
+    def results(self, batch_id: str) -> dict[str, Any]:
+        batch = self.client.batches.retrieve(batch_id)
+        results = {}
+        # An expired batch has the results of the requests it processed
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if file_id:
+                results.update(read_results(self.client.files.content(file_id).text))
+        return results
+
+
+class LocalBatches:
+    """
+    Emulates the Batch API in this process. Each batch is processed in the
+    background, one after another, with `workers` requests in flight.
+    """
+
+    poll = 0.05
+
+    def __init__(self, create: Callable[..., Any], workers: int = 16):
+        self.create = create
+        self.queue = ThreadPoolExecutor(max_workers=1, thread_name_prefix="batch")
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="batch-request"
+        )
+        self.jobs: dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, path: str) -> str:
+        with open(path) as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+        batch_id = f"batch_{uuid.uuid4().hex}"
+        with self._lock:
+            self.jobs[batch_id] = self.queue.submit(self.process, rows)
+        return batch_id
+
+    def process(self, rows: list[dict[str, Any]]) -> str:
+        return "\n".join(self.executor.map(self.execute, rows))
+
+    def execute(self, row: dict[str, Any]) -> str:
+        response = error = None
+        try:
+            body = self.create(**row["body"]).model_dump(mode="json")
+            response = {"status_code": 200, "body": body}
+        except Exception as e:
+            error = {"code": type(e).__name__, "message": str(e)}
+        return json.dumps(
+            {
+                "id": f"batch_req_{uuid.uuid4().hex}",
+                "custom_id": row["custom_id"],
+                "response": response,
+                "error": error,
+            }
+        )
+
+    def status(self, batch_id: str) -> str:
+        with self._lock:
+            job = self.jobs[batch_id]
+        if not job.done():
+            return "in_progress"
+        return "failed" if job.exception() else "completed"
+
+    def results(self, batch_id: str) -> dict[str, Any]:
+        with self._lock:
+            job = self.jobs.pop(batch_id)
+        return read_results(job.result())
+
+
+def run_batch(
+    batches: OpenAIBatches | LocalBatches,
+    requests: dict[str, dict[str, Any]],
+    path: str,
+) -> dict[str, Any]:
+    """
+    Sends `requests` (`custom_id` -> body of `chat.completions.create`) as
+    one batch per part of `split_requests` (`path`, or `path-N.jsonl` when
+    there are several) and waits for them. Returns a result per request.
+    """
+    parts = split_requests(requests)
+    root, ext = os.path.splitext(path)
+    submitted = []
+    for n, part in enumerate(parts, 1):
+        part_path = path if len(parts) == 1 else f"{root}-{n}{ext}"
+        write_requests(part_path, part)
+        submitted.append((batches.submit(part_path), part))
+
+    results = {}
+    for batch_id, part in submitted:
+        while (status := batches.status(batch_id)) not in FINISHED:
+            time.sleep(batches.poll)
+        # The requests of a failed batch are sent again with the next one
+        done = {} if status in ("failed", "cancelled") else batches.results(batch_id)
+        missing = BatchError(f"No result in batch {batch_id} ({status})")
+        results.update({custom_id: done.get(custom_id, missing) for custom_id in part})
+    return results
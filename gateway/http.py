@@ -0,0 +1,225 @@
+"""
+HTTP connection pools shared by the pipelines: the calls to the API (LLM and
+embeddings) and the scraping reuse the same keep-alive connections instead
+of opening a TCP and TLS connection per call.
+
+```python
+client = openai_client()      # OpenAI over the shared pool
+response = http().get(url)
+
+client = async_openai()       # AsyncOpenAI over the shared async pool
+response = await async_http().get(url)
+```
+
+HTTP/2 is used when `h2` is installed (`pip install httpx[http2]`): many
+concurrent requests to the same host share one connection.
+
+`stats()` returns the state of the pools: open and idle connections,
+requests in flight, connections reused and the time requests waited for a
+free connection.
+"""
+
+import importlib.util
+import threading
+from dataclasses import dataclass, field
+from time import perf_counter
+from typing import Any
+
+import httpx
+from openai import AsyncOpenAI, OpenAI
+
+HTTP2 = importlib.util.find_spec("h2") is not None
+
+LIMITS = httpx.Limits(
+    max_connections=200, max_keepalive_connections=50, keepalive_expiry=30
+)
+TIMEOUT = httpx.Timeout(60, connect=10)
+
+# Trace events of `httpcore` spent opening a connection
+CONNECT_EVENTS = ("connection.connect_tcp.", "connection.start_tls.")
+
+
+class Probe:
+    """
+    Follows one request through the trace events of `httpcore` to know if it
+    opened a connection and how long it waited for one.
+    """
+
+    def __init__(self):
+        self.start = perf_counter()
+        self.connecting: float | None = None
+        self.connect_seconds = 0.0
+        self.new_connection = False
+        self.sent: float | None = None
+
+    def __call__(self, event: str, info: dict[str, Any]):
+        if event.startswith(CONNECT_EVENTS):
+            if event.endswith(".started"):
+                self.connecting = perf_counter()
+            elif self.connecting is not None:
+                self.connect_seconds += perf_counter() - self.connecting
+                self.new_connection = True
+        elif event.endswith("send_request_headers.started") and self.sent is None:
+            self.sent = perf_counter()
+
+    async def trace_async(self, event: str, info: dict[str, Any]):
+        self(event, info)
+
+    def wait(self) -> float:
+        """
+        Seconds between the request and the moment it got a connection.
+        """
+        if self.sent is None:
+            return 0.0
+        return max(0.0, self.sent - self.start - self.connect_seconds)
+
+
+@dataclass
+class PoolStats:
+    requests: int = 0
+    in_flight: int = 0
+    new_connections: int = 0
+    connect_seconds: float = 0.0
+    wait_seconds: float = 0.0
+    max_wait_seconds: float = 0.0
+
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def started(self):
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+
+    def finished(self, probe: Probe):
+        with self._lock:
+            self.in_flight -= 1
+            self.new_connections += probe.new_connection
+            self.connect_seconds += probe.connect_seconds
+            self.wait_seconds += probe.wait()
+            self.max_wait_seconds = max(self.max_wait_seconds, probe.wait())
+
+    def to_dict(self, pool) -> dict[str, Any]:
+        """
+        `in_flight` counts the requests until their headers arrive.
+        """
+        connections = getattr(pool, "connections", [])
+        with self._lock:
+            requests = max(1, self.requests)
+            return {
+                "connections": len(connections),
+                "idle": sum(connection.is_idle() for connection in connections),
+                "in_flight": self.in_flight,
+                "requests": self.requests,
+                "reused": (self.requests - self.new_connections) / requests,
+                "connect_seconds": self.connect_seconds,
+                "mean_wait_seconds": self.wait_seconds / requests,
+                "max_wait_seconds": self.max_wait_seconds,
+            }
+
+
+class Transport(httpx.HTTPTransport):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.stats = PoolStats()
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        probe = Probe()
+        request.extensions["trace"] = probe
+        self.stats.started()
+        try:
+            return super().handle_request(request)
+        finally:
+            self.stats.finished(probe)
+
+    def pool_stats(self) -> dict[str, Any]:
+        return self.stats.to_dict(self._pool)
+
+
+class AsyncTransport(httpx.AsyncHTTPTransport):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.stats = PoolStats()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        probe = Probe()
+        request.extensions["trace"] = probe.trace_async
+        self.stats.started()
+        try:
+            return await super().handle_async_request(request)
+        finally:
+            self.stats.finished(probe)
+
+    def pool_stats(self) -> dict[str, Any]:
+        return self.stats.to_dict(self._pool)
+
+
+_http = _transport = None
+_async_http = _async_transport = None
+_lock = threading.Lock()
+
+
+def http() -> httpx.Client:
+    return shared_http()
+
+
+def async_http() -> httpx.AsyncClient:
+    return shared_async_http()
+
+
+# `openai_client` doesn't call `http()` because `observability.cassette`
+# replaces it with a proxy that records the pages, and `OpenAI` only
+# accepts real clients
+
+
+def shared_http() -> httpx.Client:
+    global _http, _transport
+    with _lock:
+        if _http is None:
+            _transport = Transport(limits=LIMITS, http2=HTTP2)
+            _http = httpx.Client(
+                transport=_transport,
+                timeout=TIMEOUT,
+                follow_redirects=True,
+            )
+    return _http
+
+
+def shared_async_http() -> httpx.AsyncClient:
+    global _async_http, _async_transport
+    with _lock:
+        if _async_http is None:
+            _async_transport = AsyncTransport(limits=LIMITS, http2=HTTP2)
+            _async_http = httpx.AsyncClient(
+                transport=_async_transport,
+                timeout=TIMEOUT,
+                follow_redirects=True,
+            )
+    return _async_http
+
+
+def openai_client(**kwargs) -> OpenAI:
+    """
+    `OpenAI` client over the shared pool. Retries are done by
+    `gateway.retry`.
+    """
+    return OpenAI(http_client=shared_http(), max_retries=0, **kwargs)
+
+
+def async_openai(**kwargs) -> AsyncOpenAI:
+    """
+    `AsyncOpenAI` client over the shared pool. Retries are done by
+    `gateway.retry`.
+    """
+    return AsyncOpenAI(http_client=shared_async_http(), max_retries=0, **kwargs)
+
+
+def stats() -> dict[str, dict[str, Any]]:
+    """
+    Statistics of the pools created so far (`sync` and `async`).
+    """
+    transports = {"sync": _transport, "async": _async_transport}
+    return {
+        name: transport.pool_stats()
+        for name, transport in transports.items()
+        if transport is not None
+    }
@@ -0,0 +1,238 @@
+"""
+Client-side rate limiter: a token bucket for requests per minute (RPM) and
+another one for tokens per minute (TPM), like the quotas of the provider.
+
+```python
+limiter = RateLimiter(rpm=500, tpm=200_000)
+
+response = limiter(client.chat.completions.create, model=model, messages=messages)
+```
+
+Before sending, the tokens of the request are estimated (prompt plus
+`max_tokens`) and the call waits until both buckets can admit it. When the
+response arrives the estimation is corrected with `response.usage`.
+
+The buckets are shared by all the threads of the process. To share them
+between processes (e.g. several `extractor` workers) pass `path`: the state
+is kept in that file and protected with `flock`.
+
+`acquire_async` and `call_async` wait with `asyncio.sleep` for async code,
+and take the file lock in a thread so they don't block the event loop.
+
+A streamed response (`stream=True`) is settled when its last chunk brings
+the usage (`stream_options={"include_usage": True}`); without it the
+estimation stays.
+"""
+
+import asyncio
+import fcntl
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable
+
+# Completion tokens assumed when the request doesn't set `max_tokens`
+DEFAULT_COMPLETION_TOKENS = 256
+
+# Bucket levels (requests, tokens) and time of the last refill
+STATE = struct.Struct("ddd")
+
+
+def estimate_tokens(
+    messages: list[dict[str, str]] | None = None,
+    input: str | list[str] | None = None,
+    max_tokens: int | None = None,
+    **_,
+) -> int:
+    """
+    Rough estimation (~4 characters per token) from the arguments of
+    `chat.completions.create` or `embeddings.create`.
+    """
+    if input is not None:
+        texts = [input] if isinstance(input, str) else input
+        return sum(len(text) // 4 + 1 for text in texts)
+
+    prompt = sum(len(msg["content"]) // 4 + 4 for msg in messages or [])
+    return prompt + (max_tokens or DEFAULT_COMPLETION_TOKENS)
+
+
+@dataclass
+class RateLimiter:
+    rpm: float | None = None
+    tpm: float | None = None
+    path: str | None = None
+
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+    _state: list[float] | None = field(default=None, repr=False)
+
+    @classmethod
+    def from_env(cls) -> "RateLimiter":
+        """
+        Limits from `OPENAI_RPM`, `OPENAI_TPM` and `OPENAI_RATE_LIMIT_FILE`.
+        Without them the limiter admits everything.
+        """
+        rpm, tpm = os.getenv("OPENAI_RPM"), os.getenv("OPENAI_TPM")
+        return cls(
+            rpm=float(rpm) if rpm else None,
+            tpm=float(tpm) if tpm else None,
+            path=os.getenv("OPENAI_RATE_LIMIT_FILE") or None,
+        )
+
+    @property
+    def limits(self) -> tuple[float | None, float | None]:
+        return self.rpm, self.tpm
+
+    def full(self) -> list[float]:
+        return [limit or 0.0 for limit in self.limits] + [time.time()]
+
+    @contextmanager
+    def state(self):
+        """
+        Yields the state `[requests, tokens, timestamp]` with exclusive access
+        (between threads and, with `path`, between processes) and saves it
+        afterwards.
+        """
+        with self._lock:
+            if self.path is None:
+                if self._state is None:
+                    self._state = self.full()
+                yield self._state
+                return
+
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                data = os.pread(fd, STATE.size, 0)
+                state = list(STATE.unpack(data)) if len(data) == STATE.size else self.full()
+                yield state
+                os.pwrite(fd, STATE.pack(*state), 0)
+            finally:
+                os.close(fd)  # Also releases the lock
+
+    def refill(self, state: list[float]):
+        now = time.time()
+        elapsed = max(0.0, now - state[2])
+        for i, limit in enumerate(self.limits):
+            if limit:
+                state[i] = min(limit, state[i] + limit / 60 * elapsed)
+        state[2] = now
+
+    def take(self, tokens: int) -> float:
+        """
+        Takes one request and `tokens` from the buckets if both have enough.
+        Otherwise returns the seconds to wait before trying again.
+        """
+        with self.state() as state:
+            self.refill(state)
+
+            wait = 0.0
+            amounts = (1, tokens)
+            for i, limit in enumerate(self.limits):
+                if limit:
+                    # A request bigger than the bucket would wait forever
+                    missing = min(amounts[i], limit) - state[i]
+                    wait = max(wait, missing / (limit / 60))
+
+            if wait <= 0:
+                for i, limit in enumerate(self.limits):
+                    if limit:
+                        state[i] -= amounts[i]
+            return max(0.0, wait)
+
+    def acquire(self, tokens: int = 0) -> float:
+        """
+        Blocks until the request is admitted. Returns the seconds waited.
+        """
+        waited = 0.0
+        while wait := self.take(tokens):
+            time.sleep(wait)
+            waited += wait
+        return waited
+
+    async def take_async(self, tokens: int) -> float:
+        if self.path is None:
+            return self.take(tokens)  # The lock is only held for the update
+        # `flock` waits for the other processes: in a thread
+        return await asyncio.to_thread(self.take, tokens)
+
+    async def acquire_async(self, tokens: int = 0) -> float:
+        """
+        Like `acquire` without blocking the event loop.
+        """
+        waited = 0.0
+        while wait := await self.take_async(tokens):
+            await asyncio.sleep(wait)
+            waited += wait
+        return waited
+
+    def settle(self, estimated: int, actual: int):
+        """
+        Corrects the tokens taken in `acquire` with the real usage.
+        """
+        if not self.tpm:
+            return
+        with self.state() as state:
+            self.refill(state)
+            state[1] = min(self.tpm, state[1] + estimated - actual)
+
+    async def settle_async(self, estimated: int, actual: int):
+        if self.path is None:
+            self.settle(estimated, actual)
+        else:
+            await asyncio.to_thread(self.settle, estimated, actual)
+
+    def __call__(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        tokens = estimate_tokens(**kwargs)
+        self.acquire(tokens)
+        response = fn(*args, **kwargs)
+        if kwargs.get("stream"):
+            return SettledStream(response, self, tokens)
+
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            self.settle(tokens, usage.total_tokens)
+        return response
+
+    async def call_async(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        tokens = estimate_tokens(**kwargs)
+        await self.acquire_async(tokens)
+        response = await fn(*args, **kwargs)
+        if kwargs.get("stream"):
+            return SettledStream(response, self, tokens)
+
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            await self.settle_async(tokens, usage.total_tokens)
+        return response
+
+
+class SettledStream:
+    """
+    A streamed response that settles the `estimated` tokens taken by
+    `limiter` with the usage of its last chunk. The rest of attributes are
+    the ones of `stream`.
+    """
+
+    def __init__(self, stream, limiter: RateLimiter, estimated: int):
+        self.stream = stream
+        self.limiter = limiter
+        self.estimated = estimated
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.stream, name)
+
+    def __iter__(self):
+        for chunk in self.stream:
+            if (usage := getattr(chunk, "usage", None)) is not None:
+                self.limiter.settle(self.estimated, usage.total_tokens)
+            yield chunk
+
+    async def __aiter__(self):
+        async for chunk in self.stream:
+            if (usage := getattr(chunk, "usage", None)) is not None:
+                await self.limiter.settle_async(self.estimated, usage.total_tokens)
+            yield chunk
+
@@ -0,0 +1,243 @@
+"""
+Retries with exponential backoff, deadlines and hedging.
+
+```python
+retry = Retry(max_attempts=5, deadline=60, hedge=True)
+
+response = retry(client.chat.completions.create, model=model, messages=messages)
+```
+
+- Transient errors (429, 5xx, timeouts and connection errors) are retried
+  with exponential backoff and full jitter, honouring `Retry-After`.
+- `attempt_timeout` is passed as `timeout` to each attempt and `deadline`
+  bounds the whole call, including the waits between attempts.
+- With `hedge=True`, if an attempt takes longer than the p95 of the previous
+  ones, a duplicate request is sent and we keep the first answer. The slow
+  one is abandoned (its result is discarded).
+
+Create the client with `max_retries=0`, otherwise the SDK retries on its own
+and the attempts multiply. Each attempt is a span (see
+`observability.tracing`).
+
+`call_async` does the same for coroutine functions (e.g. `AsyncOpenAI`).
+"""
+
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable
+
+from openai import APIConnectionError, APIStatusError
+
+from observability.tracing import span
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="hedge")
+    return _executor
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, APIStatusError):
+        return error.status_code in RETRYABLE_STATUS
+    return isinstance(error, (APIConnectionError, TimeoutError))
+
+
+def retry_after(error: Exception) -> float | None:
+    """
+    Seconds to wait according to the `Retry-After` headers of the response,
+    if any (`retry-after-ms` is an OpenAI extension).
+    """
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+
+    if value := headers.get("retry-after-ms"):
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+
+    if value := headers.get("retry-after"):
+        try:
+            return float(value)
+        except ValueError:
+            pass
+        try:
+            return parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            pass
+
+    return None
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+@dataclass
+class Retry:
+    max_attempts: int = 5
+    base_delay: float = 0.5
+    max_delay: float = 30.0
+    attempt_timeout: float | None = 60.0
+    deadline: float | None = 120.0
+    hedge: bool = False
+    hedge_quantile: float = 0.95
+    hedge_min_samples: int = 20
+
+    # Latencies of the last successful attempts (used for hedging)
+    latencies: deque = field(default_factory=lambda: deque(maxlen=500), repr=False)
+
+    def backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+    def hedge_delay(self) -> float | None:
+        if not self.hedge or len(self.latencies) < self.hedge_min_samples:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[int(self.hedge_quantile * (len(ordered) - 1))]
+
+    def timeout(self, start: float) -> float | None:
+        """
+        Timeout of the next attempt of a call started at `start`.
+        """
+        timeout = self.attempt_timeout
+        if self.deadline is not None:
+            remaining = self.deadline - (time.monotonic() - start)
+            if remaining <= 0:
+                raise DeadlineExceeded(f"Deadline of {self.deadline}s exceeded")
+            timeout = remaining if timeout is None else min(timeout, remaining)
+        return timeout
+
+    def delay(self, error: Exception, attempt: int, start: float) -> float | None:
+        """
+        Seconds to wait before retrying after `error` or `None` to give up.
+        """
+        if not is_retryable(error) or attempt == self.max_attempts - 1:
+            return None
+
+        delay = retry_after(error)
+        if delay is None:
+            delay = self.backoff(attempt)
+
+        if self.deadline is not None and delay >= self.deadline - (
+            time.monotonic() - start
+        ):
+            return None
+        return max(0.0, delay)
+
+    def __call__(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        start = time.monotonic()
+        for attempt in range(self.max_attempts):
+            timeout = self.timeout(start)
+            try:
+                with span("attempt", attempt=attempt + 1, timeout=timeout):
+                    return self.attempt(fn, args, kwargs, timeout)
+            except Exception as e:
+                delay = self.delay(e, attempt, start)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+
+    def attempt(self, fn, args, kwargs, timeout: float | None) -> Any:
+        hedge_delay = self.hedge_delay()
+        start = time.monotonic()
+
+        if hedge_delay is None:
+            result = fn(*args, **kwargs, timeout=timeout)
+        else:
+            result = self.hedged(fn, args, kwargs, timeout, hedge_delay)
+
+        self.latencies.append(time.monotonic() - start)
+        return result
+
+    def hedged(self, fn, args, kwargs, timeout: float | None, delay: float) -> Any:
+        pending = {executor().submit(fn, *args, **kwargs, timeout=timeout)}
+        done, _ = wait(pending, timeout=delay)
+
+        if not done:
+            if timeout is not None:
+                timeout = max(0.0, timeout - delay)
+            pending.add(executor().submit(fn, *args, **kwargs, timeout=timeout))
+
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    async def call_async(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Same as calling the instance but `fn` is a coroutine function (e.g.
+        `AsyncOpenAI().chat.completions.create`).
+        """
+        start = time.monotonic()
+        for attempt in range(self.max_attempts):
+            timeout = self.timeout(start)
+            try:
+                with span("attempt", attempt=attempt + 1, timeout=timeout):
+                    return await self.attempt_async(fn, args, kwargs, timeout)
+            except Exception as e:
+                delay = self.delay(e, attempt, start)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+
+    async def attempt_async(self, fn, args, kwargs, timeout: float | None) -> Any:
+        hedge_delay = self.hedge_delay()
+        start = time.monotonic()
+
+        if hedge_delay is None:
+            result = await fn(*args, **kwargs, timeout=timeout)
+        else:
+            result = await self.hedged_async(fn, args, kwargs, timeout, hedge_delay)
+
+        self.latencies.append(time.monotonic() - start)
+        return result
+
+    async def hedged_async(
+        self, fn, args, kwargs, timeout: float | None, delay: float
+    ) -> Any:
+        """
+        Unlike threads, the request that loses the race is cancelled.
+        """
+        pending = {asyncio.ensure_future(fn(*args, **kwargs, timeout=timeout))}
+        done, _ = await asyncio.wait(pending, timeout=delay)
+
+        if not done:
+            if timeout is not None:
+                timeout = max(0.0, timeout - delay)
+            pending.add(asyncio.ensure_future(fn(*args, **kwargs, timeout=timeout)))
+
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
@@ -0,0 +1,237 @@
+"""
+Router between several OpenAI-compatible backends (OpenAI, a local `ollama`
+or `vllm`, another provider...).
+
+Each backend serves one model and has tags with the capabilities it offers.
+`create(model=...)` accepts a model name or a tag and sends the request to
+the fastest healthy backend that satisfies it:
+
+- Latency is an exponential moving average per backend. The score is the
+  expected time per successful call: `latency / (1 - error_rate)`.
+- After consecutive transient errors a backend rests for a cooldown that
+  doubles with each failure, so a degraded provider stops receiving traffic
+  and is probed again later.
+- A small fraction of calls (`explore`) goes to a random healthy backend to
+  keep the statistics of the others fresh.
+
+Backends are configured in a JSON file pointed by `LLM_BACKENDS`:
+
+```json
+[
+    {"name": "openai", "model": "gpt-4o-mini", "tags": ["fast", "strong"]},
+    {
+        "name": "ollama",
+        "base_url": "http://localhost:11434/v1",
+        "api_key": "ollama",
+        "model": "llama3.1",
+        "tags": ["fast", "local", "gpt-4o-mini"],
+        "rpm": 120
+    }
+]
+```
+
+Models that no backend serves go to the default `client`, so without
+configuration everything works as with a plain `OpenAI()` client.
+"""
+
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any
+
+from openai import AsyncOpenAI, OpenAI
+
+from .http import async_http, http
+from .ratelimit import RateLimiter
+from .retry import is_retryable
+
+
+@dataclass
+class Backend:
+    name: str
+    client: Any
+    model: str
+    tags: set[str] = field(default_factory=set)
+    limiter: RateLimiter | None = None
+
+    # Rolling statistics
+    latency: float | None = None
+    outcomes: deque = field(default_factory=lambda: deque(maxlen=50), repr=False)
+    failures: int = 0
+    down_until: float = 0.0
+
+    def serves(self, model: str) -> bool:
+        return model == self.model or model in self.tags
+
+    def error_rate(self) -> float:
+        return sum(self.outcomes) / len(self.outcomes) if self.outcomes else 0.0
+
+    def score(self) -> float:
+        # Backends without samples go first so they get measured
+        return (self.latency or 0.0) / max(0.05, 1 - self.error_rate())
+
+
+def load_backends(path: str, client_class=OpenAI) -> list[Backend]:
+    with open(path) as f:
+        config = json.load(f)
+
+    # All the backends share the connection pool
+    if issubclass(client_class, AsyncOpenAI):
+        http_client = async_http()
+    else:
+        http_client = http()
+
+    backends = []
+    for entry in config:
+        api_key = entry.get("api_key") or os.getenv(
+            entry.get("api_key_env", "OPENAI_API_KEY")
+        )
+        limiter = None
+        if entry.get("rpm") or entry.get("tpm"):
+            limiter = RateLimiter(rpm=entry.get("rpm"), tpm=entry.get("tpm"))
+
+        backends.append(
+            Backend(
+                name=entry["name"],
+                client=client_class(
+                    base_url=entry.get("base_url"),
+                    api_key=api_key,
+                    max_retries=0,
+                    http_client=http_client,
+                ),
+                model=entry["model"],
+                tags=set(entry.get("tags", [])),
+                limiter=limiter,
+            )
+        )
+    return backends
+
+
+@dataclass
+class Router:
+    backends: list[Backend] = field(default_factory=list)
+    client: Any = None
+    limiter: RateLimiter | None = None
+    alpha: float = 0.2
+    cooldown: float = 5.0
+    max_cooldown: float = 300.0
+    explore: float = 0.05
+
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    @classmethod
+    def from_env(
+        cls, client=None, limiter: RateLimiter | None = None, client_class=OpenAI
+    ) -> "Router":
+        """
+        Use `client_class=AsyncOpenAI` (and an async `client`) for
+        `create_async`.
+        """
+        path = os.getenv("LLM_BACKENDS")
+        backends = load_backends(path, client_class) if path else []
+        return cls(backends=backends, client=client, limiter=limiter)
+
+    def select(self, model: str) -> Backend:
+        with self._lock:
+            candidates = [b for b in self.backends if b.serves(model)]
+            if not candidates:
+                if self.client is None:
+                    raise ValueError(f"No backend serves {model!r}")
+                backend = Backend(
+                    name=f"default:{model}",
+                    client=self.client,
+                    model=model,
+                    limiter=self.limiter,
+                )
+                self.backends.append(backend)
+                return backend
+
+            now = time.monotonic()
+            healthy = [b for b in candidates if b.down_until <= now]
+            if not healthy:
+                return min(candidates, key=lambda b: b.down_until)
+
+            if len(healthy) > 1 and random.random() < self.explore:
+                return random.choice(healthy)
+            return min(healthy, key=Backend.score)
+
+    def record(self, backend: Backend, latency: float | None):
+        """
+        Updates the statistics of `backend` with a call that took `latency`
+        seconds or failed (`None`).
+        """
+        with self._lock:
+            backend.outcomes.append(latency is None)
+            if latency is None:
+                backend.failures += 1
+                cooldown = self.cooldown * 2 ** (backend.failures - 1)
+                backend.down_until = time.monotonic() + min(cooldown, self.max_cooldown)
+                return
+
+            backend.failures = 0
+            if backend.latency is None:
+                backend.latency = latency
+            else:
+                backend.latency += self.alpha * (latency - backend.latency)
+
+    def create(self, model: str, **kwargs) -> Any:
+        """
+        Same as `client.chat.completions.create` but `model` can also be a tag.
+        """
+        backend = self.select(model)
+        create = backend.client.chat.completions.create
+
+        start = time.monotonic()
+        try:
+            if backend.limiter is not None:
+                response = backend.limiter(create, model=backend.model, **kwargs)
+            else:
+                response = create(model=backend.model, **kwargs)
+        except Exception as e:
+            if is_retryable(e):
+                self.record(backend, None)
+            raise
+
+        self.record(backend, time.monotonic() - start)
+        return response
+
+    async def create_async(self, model: str, **kwargs) -> Any:
+        """
+        Same as `create` for async clients.
+        """
+        backend = self.select(model)
+        create = backend.client.chat.completions.create
+
+        start = time.monotonic()
+        try:
+            if backend.limiter is not None:
+                response = await backend.limiter.call_async(
+                    create, model=backend.model, **kwargs
+                )
+            else:
+                response = await create(model=backend.model, **kwargs)
+        except Exception as e:
+            if is_retryable(e):
+                self.record(backend, None)
+            raise
+
+        self.record(backend, time.monotonic() - start)
+        return response
+
+    def stats(self) -> list[dict[str, Any]]:
+        now = time.monotonic()
+        with self._lock:
+            return [
+                {
+                    "name": b.name,
+                    "model": b.model,
+                    "latency": b.latency,
+                    "error_rate": b.error_rate(),
+                    "healthy": b.down_until <= now,
+                }
+                for b in self.backends
+            ]
@@ -0,0 +1,89 @@
+"""
+Prompt templates split once into their static text and their fields.
+
+The prompts of `solved/` are f-strings: every call formats the whole text
+again, and a prompt built from another one (`merge_prompt` from
+`critique_prompt` from `idea_prompt`) copies the static text at each level.
+A `Template` is still an f-string, only without expressions (`{name}`
+fields, like `str.format`):
+
+```python
+IDEA = Template("Question: {question}\\nAnswer:")
+CRITIQUE = IDEA + Template("\\n{ideas}\\nList the flaws of each idea.")
+
+CRITIQUE.render(question=question, ideas=ideas)  # One `"".join`
+CRITIQUE.partial(question=question)  # Template with the question joined once
+```
+
+Rendering copies the precomputed segments into a list and joins it: the
+template is never parsed again. The values must be strings, like the result
+of the f-string (`str(value)` for anything else).
+"""
+
+from string import Formatter
+from typing import NamedTuple
+
+
+class Slot(NamedTuple):
+    name: str
+
+
+class Template:
+    def __init__(self, source: str = ""):
+        segments = []
+        for literal, name, spec, conversion in Formatter().parse(source):
+            segments.append(literal)
+            if name is None:
+                continue
+            if not name.isidentifier() or spec or conversion:
+                raise ValueError(f"Only plain `{{name}}` fields, not {{{name}}}")
+            segments.append(Slot(name))
+        self.compile(segments)
+
+    @classmethod
+    def from_segments(cls, segments: list[str | Slot]) -> "Template":
+        template = cls.__new__(cls)
+        template.compile(segments)
+        return template
+
+    def compile(self, segments: list[str | Slot]):
+        # Static text between two fields is one segment
+        self.segments: list[str | Slot] = []
+        for segment in segments:
+            if isinstance(segment, Slot):
+                self.segments.append(segment)
+            elif self.segments and not isinstance(self.segments[-1], Slot):
+                self.segments[-1] += segment
+            elif segment:
+                self.segments.append(segment)
+
+        # What `render` copies: the static text and an empty slot per field
+        self.parts = ["" if isinstance(s, Slot) else s for s in self.segments]
+        self.slots = [
+            (i, s.name) for i, s in enumerate(self.segments) if isinstance(s, Slot)
+        ]
+
+    @property
+    def fields(self) -> set[str]:
+        return {name for _, name in self.slots}
+
+    def render(self, **values: str) -> str:
+        parts = self.parts.copy()
+        for index, name in self.slots:
+            parts[index] = values[name]
+        return "".join(parts)
+
+    def partial(self, **values: str) -> "Template":
+        """
+        Template with the fields of `values` rendered and merged into the
+        static text around them.
+        """
+        return Template.from_segments(
+            [
+                values.get(s.name, s) if isinstance(s, Slot) else s
+                for s in self.segments
+            ]
+        )
+
+    def __add__(self, other: "Template") -> "Template":
+        return Template.from_segments(self.segments + other.segments)
@@ -0,0 +1,7 @@
+"""
+Bulk runs of the pipelines in `solved/` over many documents: state that
+survives the process, resuming and streaming results to disk.
+
+Like `gateway` and `retrieval`, each one is a small module that can be read in
+one sitting.
+"""
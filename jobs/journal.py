@@ -0,0 +1,168 @@
+"""
+Checkpointed extraction jobs. The state of each document is kept in a SQLite
+journal, so a job that dies resumes where it stopped instead of starting
+again:
+
+- `pending`: sent to the extractor, without result yet.
+- `extracted`: valid result, saved in the journal but not in the output.
+- `failed`: didn't validate after the retries (with the errors).
+- `done`: result written to the output file.
+
+```python
+journal = Journal("talks.journal")
+docs = ((url, http().get(url).text) for url in urls)  # Read lazily
+stats = run_job(journal, docs, extract_many, "talks.jsonl")
+```
+
+`extract_many` receives the texts of a chunk of documents and returns
+`(result, errors)` for each one (`result` is `None` if it failed). A document
+whose content hash didn't change since it was `done` is skipped, so running
+the same job again only extracts the new and changed documents (and retries
+the failed ones).
+
+Results are appended to the output (JSON lines with `id`, `hash` and
+`result`) chunk by chunk, nothing is kept in memory. The output is written
+before the document is marked `done`: if the process dies between both, the
+document is written again when resuming (at least once, the last line of
+an `id` wins).
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from itertools import batched
+from typing import Any, Callable, Iterable
+
+STATES = ("pending", "extracted", "failed", "done")
+
+Extraction = tuple[dict[str, Any] | None, list[tuple[str, Any]]]
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+class Journal:
+    def __init__(self, path: str):
+        self._db = sqlite3.connect(path)
+        # WAL: a commit per chunk doesn't rewrite the database
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            "id TEXT PRIMARY KEY, hash TEXT, state TEXT, result TEXT, "
+            "errors TEXT, attempts INTEGER DEFAULT 0, updated REAL"
+            ") WITHOUT ROWID"
+        )
+
+    def unchanged(self, chunk: list[tuple[str, str]]) -> set[str]:
+        """
+        Ids of the `(id, hash)` of `chunk` that are `done` with that hash.
+        """
+        placeholders = ", ".join("?" * len(chunk))
+        rows = self._db.execute(
+            f"SELECT id, hash FROM documents WHERE state = 'done' "
+            f"AND id IN ({placeholders})",
+            [id for id, _ in chunk],
+        )
+        hashes = dict(chunk)
+        return {id for id, digest in rows if hashes[id] == digest}
+
+    def start(self, chunk: list[tuple[str, str]]):
+        with self._db:
+            self._db.executemany(
+                "INSERT INTO documents (id, hash, state, attempts, updated) "
+                "VALUES (?, ?, 'pending', 1, ?) ON CONFLICT (id) DO UPDATE SET "
+                "hash = excluded.hash, state = 'pending', result = NULL, "
+                "errors = NULL, attempts = attempts + 1, updated = excluded.updated",
+                [(id, digest, time.time()) for id, digest in chunk],
+            )
+
+    def finish(self, ids: list[str], extractions: list[Extraction]):
+        rows = []
+        for id, (result, errors) in zip(ids, extractions):
+            if result is not None and not errors:
+                rows.append(("extracted", json.dumps(result), None, time.time(), id))
+            else:
+                errors = json.dumps(errors, default=str)
+                rows.append(("failed", None, errors, time.time(), id))
+        with self._db:
+            self._db.executemany(
+                "UPDATE documents SET state = ?, result = ?, errors = ?, "
+                "updated = ? WHERE id = ?",
+                rows,
+            )
+
+    def flush(self, output) -> int:
+        """
+        Appends the `extracted` documents to `output` and marks them `done`
+        (their result is only kept in the output).
+        """
+        rows = self._db.execute(
+            "SELECT id, hash, result FROM documents WHERE state = 'extracted'"
+        ).fetchall()
+        if not rows:
+            return 0
+        for id, digest, result in rows:
+            line = {"id": id, "hash": digest, "result": json.loads(result)}
+            output.write(json.dumps(line) + "\n")
+        output.flush()
+        os.fsync(output.fileno())
+
+        with self._db:
+            self._db.executemany(
+                "UPDATE documents SET state = 'done', result = NULL WHERE id = ?",
+                [(id,) for id, _, _ in rows],
+            )
+        return len(rows)
+
+    def failures(self) -> Iterable[tuple[str, list]]:
+        rows = self._db.execute(
+            "SELECT id, errors FROM documents WHERE state = 'failed' ORDER BY id"
+        )
+        for id, errors in rows:
+            yield id, json.loads(errors)
+
+    def counts(self) -> dict[str, int]:
+        rows = self._db.execute(
+            "SELECT state, COUNT(*) FROM documents GROUP BY state"
+        ).fetchall()
+        return {state: 0 for state in STATES} | dict(rows)
+
+    def close(self):
+        self._db.close()
+
+
+def run_job(
+    journal: Journal,
+    docs: Iterable[tuple[str, str]],
+    extract_many: Callable[[list[str]], list[Extraction]],
+    output: str,
+    chunk_size: int = 32,
+) -> dict[str, int]:
+    """
+    Extracts the `(id, text)` of `docs` in chunks of `chunk_size`,
+    checkpointing each chunk. Returns the documents per state in the journal
+    and the ones `skipped` in this run.
+    """
+    skipped = 0
+    with open(output, "a") as out:
+        # Extracted by a previous run that died before writing them
+        journal.flush(out)
+
+        for chunk in batched(docs, chunk_size):
+            texts = dict(chunk)
+            hashes = [(id, content_hash(text)) for id, text in texts.items()]
+            unchanged = journal.unchanged(hashes)
+            skipped += len(unchanged)
+            todo = [(id, digest) for id, digest in hashes if id not in unchanged]
+            if not todo:
+                continue
+
+            journal.start(todo)
+            ids = [id for id, _ in todo]
+            journal.finish(ids, extract_many([texts[id] for id in ids]))
+            journal.flush(out)
+
+    return {**journal.counts(), "skipped": skipped}
@@ -0,0 +1,342 @@
+"""
+Record and replay of the calls to the API (and of the downloaded pages)
+with `observability.patch`: the pipelines run without network and always
+get the same answers, so their performance can be compared between commits
+and the Python-side overhead measured without the noise of the API.
+
+```bash
+python -m observability.cassette record calls.db solved.rag.v5 "What is RAG?"
+python -m observability.cassette replay --speed 0 calls.db solved.rag.v5 "What is RAG?"
+```
+
+`--speed 1` waits the recorded time of each call (and of each chunk of a
+stream), `--speed 10` ten times less and `--speed 0` nothing.
+
+Intercepted: `chat.completions.create` and `embeddings.create` of `OpenAI`
+and `AsyncOpenAI` and `get` of the clients of `gateway.http`. The patches
+apply to the modules imported afterwards, so `use` must be called before
+importing `openai` (the runner above does it). `openai.OpenAI` becomes a
+function, so `LLM_BACKENDS` (which needs the classes) isn't supported.
+
+The cassette is a SQLite table indexed by the hash of the request (without
+`timeout`) and the number of the repetition; the responses are compressed
+JSON. A request that isn't in the cassette raises `CassetteMiss`.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import runpy
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+from collections import defaultdict
+from functools import wraps
+from time import perf_counter
+from typing import Any
+
+from .patch import patch
+
+# Endpoint -> intercepted method of the clients
+ENDPOINTS = {
+    "chat": "chat.completions.create",
+    "embeddings": "embeddings.create",
+}
+
+
+class CassetteMiss(KeyError):
+    pass
+
+
+def request_key(endpoint: str, args: tuple, kwargs: dict[str, Any]) -> bytes:
+    kwargs = {k: v for k, v in kwargs.items() if k != "timeout"}
+    request = json.dumps([endpoint, args, kwargs], sort_keys=True, default=str)
+    return hashlib.sha256(request.encode()).digest()
+
+
+class Cassette:
+    def __init__(self, path: str, mode: str = "replay", speed: float = 1.0):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown mode: {mode!r}")
+        self.mode = mode
+        self.speed = speed
+
+        self.calls = 0
+        self.seconds = 0.0  # Time inside the intercepted calls
+        self._seq = defaultdict(int)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS calls ("
+            "key BLOB, seq INTEGER, endpoint TEXT, seconds REAL, response BLOB, "
+            "PRIMARY KEY (key, seq)) WITHOUT ROWID"
+        )
+        if mode == "record":
+            with self._db:
+                self._db.execute("DELETE FROM calls")
+
+    def next_seq(self, key: bytes) -> int:
+        with self._lock:
+            seq = self._seq[key]
+            self._seq[key] += 1
+            return seq
+
+    def save(self, key: bytes, endpoint: str, seconds: float, response: Any):
+        blob = zlib.compress(json.dumps(response).encode())
+        seq = self.next_seq(key)
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO calls VALUES (?, ?, ?, ?, ?)",
+                (key, seq, endpoint, seconds, blob),
+            )
+
+    def load(self, key: bytes, endpoint: str) -> tuple[float, Any]:
+        """
+        Recorded time and response of the next repetition of a request (the
+        repetitions cycle if there are more calls than recorded).
+        """
+        seq = self.next_seq(key)
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT seconds, response FROM calls WHERE key = ? ORDER BY seq",
+                (key,),
+            ).fetchall()
+        if not rows:
+            raise CassetteMiss(f"Request to {endpoint} not in the cassette")
+        seconds, blob = rows[seq % len(rows)]
+        return seconds, json.loads(zlib.decompress(blob))
+
+    def wait(self, seconds: float) -> float:
+        return seconds / self.speed if self.speed else 0.0
+
+    def count(self, seconds: float):
+        with self._lock:
+            self.calls += 1
+            self.seconds += seconds
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {"mode": self.mode, "calls": self.calls, "seconds": self.seconds}
+
+
+def dump(response) -> Any:
+    return response.model_dump(mode="json")
+
+
+def response_type(endpoint: str, stream: bool = False):
+    # Imported here: `openai` must be imported after the patches
+    from openai.types import CreateEmbeddingResponse
+    from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+    if endpoint == "embeddings":
+        return CreateEmbeddingResponse
+    return ChatCompletionChunk if stream else ChatCompletion
+
+
+def intercept(cassette: Cassette, endpoint: str, is_async: bool):
+    """
+    Patch for the `create` method of `endpoint`. The methods of `AsyncOpenAI`
+    return coroutines but aren't coroutine functions, so `is_async` comes
+    from the client.
+    """
+
+    def patch_create(fn, _):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            key = request_key(endpoint, args, kwargs)
+            stream = kwargs.get("stream", False)
+            start = perf_counter()
+
+            if cassette.mode == "replay":
+                seconds, response = cassette.load(key, endpoint)
+                if stream:
+                    return replay_stream(cassette, endpoint, response, start)
+                time.sleep(cassette.wait(seconds))
+                cassette.count(perf_counter() - start)
+                return response_type(endpoint).model_validate(response)
+
+            result = fn(*args, **kwargs)
+            if stream:
+                return record_stream(cassette, key, endpoint, result, start)
+            seconds = perf_counter() - start
+            cassette.save(key, endpoint, seconds, dump(result))
+            cassette.count(seconds)
+            return result
+
+        @wraps(fn)
+        async def async_wrapper(*args, **kwargs):
+            key = request_key(endpoint, args, kwargs)
+            stream = kwargs.get("stream", False)
+            start = perf_counter()
+
+            if cassette.mode == "replay":
+                seconds, response = cassette.load(key, endpoint)
+                if stream:
+                    return replay_stream_async(cassette, endpoint, response, start)
+                await asyncio.sleep(cassette.wait(seconds))
+                cassette.count(perf_counter() - start)
+                return response_type(endpoint).model_validate(response)
+
+            result = await fn(*args, **kwargs)
+            if stream:
+                return record_stream_async(cassette, key, endpoint, result, start)
+            seconds = perf_counter() - start
+            cassette.save(key, endpoint, seconds, dump(result))
+            cassette.count(seconds)
+            return result
+
+        return async_wrapper if is_async else wrapper
+
+    return patch_create
+
+
+def record_stream(cassette, key, endpoint, stream, start):
+    chunks, offsets = [], []
+    for chunk in stream:
+        offsets.append(perf_counter() - start)
+        chunks.append(dump(chunk))
+        yield chunk
+    seconds = perf_counter() - start
+    cassette.save(key, endpoint, seconds, {"chunks": chunks, "offsets": offsets})
+    cassette.count(seconds)
+
+
+async def record_stream_async(cassette, key, endpoint, stream, start):
+    chunks, offsets = [], []
+    async for chunk in stream:
+        offsets.append(perf_counter() - start)
+        chunks.append(dump(chunk))
+        yield chunk
+    seconds = perf_counter() - start
+    cassette.save(key, endpoint, seconds, {"chunks": chunks, "offsets": offsets})
+    cassette.count(seconds)
+
+
+def replay_stream(cassette, endpoint, recorded, start):
+    chunk_type = response_type(endpoint, stream=True)
+    previous = 0.0
+    for chunk, offset in zip(recorded["chunks"], recorded["offsets"]):
+        time.sleep(cassette.wait(offset - previous))
+        previous = offset
+        yield chunk_type.model_validate(chunk)
+    cassette.count(perf_counter() - start)
+
+
+async def replay_stream_async(cassette, endpoint, recorded, start):
+    chunk_type = response_type(endpoint, stream=True)
+    previous = 0.0
+    for chunk, offset in zip(recorded["chunks"], recorded["offsets"]):
+        await asyncio.sleep(cassette.wait(offset - previous))
+        previous = offset
+        yield chunk_type.model_validate(chunk)
+    cassette.count(perf_counter() - start)
+
+
+def dump_page(response) -> dict[str, Any]:
+    return {
+        "url": str(response.url),
+        "status_code": response.status_code,
+        "headers": {"content-type": response.headers.get("content-type", "")},
+        "text": response.text,
+    }
+
+
+def load_page(page: dict[str, Any]):
+    import httpx
+
+    return httpx.Response(
+        page["status_code"],
+        headers=page["headers"],
+        text=page["text"],
+        request=httpx.Request("GET", page["url"]),
+    )
+
+
+def intercept_get(cassette: Cassette, is_async: bool):
+    def patch_get(fn, _):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            key = request_key("get", args, kwargs)
+            start = perf_counter()
+            if cassette.mode == "replay":
+                seconds, page = cassette.load(key, "get")
+                time.sleep(cassette.wait(seconds))
+                cassette.count(perf_counter() - start)
+                return load_page(page)
+
+            response = fn(*args, **kwargs)
+            seconds = perf_counter() - start
+            cassette.save(key, "get", seconds, dump_page(response))
+            cassette.count(seconds)
+            return response
+
+        @wraps(fn)
+        async def async_wrapper(*args, **kwargs):
+            key = request_key("get", args, kwargs)
+            start = perf_counter()
+            if cassette.mode == "replay":
+                seconds, page = cassette.load(key, "get")
+                await asyncio.sleep(cassette.wait(seconds))
+                cassette.count(perf_counter() - start)
+                return load_page(page)
+
+            response = await fn(*args, **kwargs)
+            seconds = perf_counter() - start
+            cassette.save(key, "get", seconds, dump_page(response))
+            cassette.count(seconds)
+            return response
+
+        return async_wrapper if is_async else wrapper
+
+    return patch_get
+
+
+def use(path: str, mode: str = "replay", speed: float = 1.0) -> Cassette:
+    cassette = Cassette(path, mode, speed)
+    patches = {
+        "gateway.http:http().get": intercept_get(cassette, is_async=False),
+        "gateway.http:async_http().get": intercept_get(cassette, is_async=True),
+    }
+    for client, is_async in [("OpenAI", False), ("AsyncOpenAI", True)]:
+        for endpoint, method in ENDPOINTS.items():
+            patches[f"openai:{client}().{method}"] = intercept(
+                cassette, endpoint, is_async
+            )
+    patch(patches)
+    return cassette
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Runs a module recording or replaying its calls to the API"
+    )
+    parser.add_argument("mode", choices=["record", "replay"])
+    parser.add_argument("path", help="Cassette (SQLite file)")
+    parser.add_argument("--speed", type=float, default=1.0)
+    parser.add_argument("module", help="Module to run, like `python -m`")
+    parser.add_argument("args", nargs=argparse.REMAINDER)
+    args = parser.parse_args()
+
+    cassette = use(args.path, args.mode, args.speed)
+    sys.argv = [args.module, *args.args]
+    start = perf_counter()
+    try:
+        runpy.run_module(args.module, run_name="__main__", alter_sys=True)
+    finally:
+        wall = perf_counter() - start
+        stats = cassette.stats()
+        # With concurrent calls the time in calls overlaps: the overhead is
+        # a lower bound
+        print(
+            f"\n{stats['mode']}: {stats['calls']} calls, "
+            f"{stats['seconds']:.3f}s in calls, {wall:.3f}s wall (with imports), "
+            f"{max(0.0, wall - stats['seconds']):.3f}s outside the calls",
+            file=sys.stderr,
+        )
+
+
+if __name__ == "__main__":
+    main()
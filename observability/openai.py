@@ -1,24 +1,54 @@
 from functools import wraps
+from time import perf_counter
 
 from termcolor import colored
 
 from .patch import patch
+from .sampling import Sampler
 
+sampler = Sampler.from_env()
 
-def logged_competion(fn, _):
-    @wraps(fn)
-    def wrapper(*args, **kwargs):
-        for msg in kwargs.get("messages", []):
-            lines = msg["content"].split("\n")
-            for line in lines:
-                print(colored(f"> {line}", "green"))
 
-        result = fn(*args, **kwargs)
-        lines = result.choices[0].message.content.split("\n")
+def print_messages(messages):
+    for msg in messages:
+        lines = sampler.payload(msg["content"]).split("\n")
         for line in lines:
-            print(colored(f"< {line}", "blue", attrs=["bold"]))
+            print(colored(f"> {line}", "green"))
+
 
-        print("\n\n\n")
+def logged_competion(fn, openai):
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        # Head sampling: the prompt is printed before the call, as it happens
+        head = sampler.head()
+        if head:
+            print_messages(kwargs.get("messages", []))
+
+        start = perf_counter()
+        result, error = None, None
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:  # Also `KeyboardInterrupt`
+            error = e
+            raise
+        finally:
+            seconds = perf_counter() - start
+            # Tail sampling: slow or failed calls are printed anyway
+            if sampler.tail(seconds, error) or head:
+                if not head:
+                    print(colored(f"(sampled: {seconds:.2f}s)", "yellow"))
+                    print_messages(kwargs.get("messages", []))
+                if error is not None:
+                    print(colored(f"! {type(error).__name__}: {error}", "red"))
+                elif isinstance(result, openai.types.chat.ChatCompletion):
+                    content = result.choices[0].message.content or ""
+                    for line in sampler.payload(content).split("\n"):
+                        print(colored(f"< {line}", "blue", attrs=["bold"]))
+                else:
+                    # `stream=True`: the chunks arrive after the call
+                    print(colored("< <stream>", "blue", attrs=["bold"]))
+
+                print("\n\n\n")
 
         return result
 
@@ -0,0 +1,113 @@
+"""
+What the interception logger (`observability/openai.py`) prints and how.
+
+- Head sampling: a fraction `rate` of the calls is chosen before the call.
+- Tail sampling: after the call, the slow ones (above the `quantile` of the
+  recent latencies) and the failed ones are kept too.
+- Redaction: a single precompiled regular expression with every pattern
+  (API keys, tokens, emails...) replaces secrets with `[name]`.
+- Truncation: long payloads keep their first `max_chars` characters and a
+  hash of the full text, to match repeated prompts without storing them.
+
+A call that isn't sampled only costs a random number and a latency sample:
+the payloads are formatted only for the calls that are printed.
+
+Configuration (see `.env.example`): `LOG_SAMPLE_RATE`, `LOG_SLOW_QUANTILE`,
+`LOG_MAX_CHARS` and `LOG_REDACT`.
+"""
+
+import hashlib
+import os
+import random
+import re
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+
+PATTERNS = {
+    "api_key": r"\bsk-[A-Za-z0-9_\-]{16,}",
+    "bearer": r"\b(?i:bearer)\s+[A-Za-z0-9._\-]{16,}",
+    "email": r"\b[\w.+\-]+@[\w\-]+\.[\w.\-]+\b",
+    "card": r"\b(?:\d[ \-]?){13,16}\b",
+}
+
+
+class Redactor:
+    def __init__(self, patterns: dict[str, str] = PATTERNS):
+        # One pass over the text whatever the number of patterns
+        self.regex = re.compile(
+            "|".join(f"(?P<{name}>{pattern})" for name, pattern in patterns.items())
+        )
+
+    def __call__(self, text: str) -> str:
+        return self.regex.sub(lambda match: f"[{match.lastgroup}]", text)
+
+
+def truncate(text: str, max_chars: int | None) -> str:
+    if max_chars is None or len(text) <= max_chars:
+        return text
+    digest = hashlib.sha256(text.encode()).hexdigest()[:12]
+    return f"{text[:max_chars]}… [{len(text)} chars, sha256 {digest}]"
+
+
+@dataclass
+class Sampler:
+    rate: float = 1.0
+    quantile: float | None = 0.99
+    max_chars: int | None = None
+    redactor: Redactor = field(default_factory=Redactor)
+
+    # The threshold is recomputed every `refresh` calls, not on each one
+    window: int = 1000
+    refresh: int = 100
+    min_samples: int = 100
+
+    latencies: deque = field(default_factory=deque, repr=False)
+    threshold: float | None = field(default=None, repr=False)
+    _calls: int = field(default=0, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def __post_init__(self):
+        self.latencies = deque(maxlen=self.window)
+
+    @classmethod
+    def from_env(cls) -> "Sampler":
+        patterns = dict(PATTERNS)
+        if custom := os.getenv("LOG_REDACT"):
+            patterns["redacted"] = custom
+        quantile = os.getenv("LOG_SLOW_QUANTILE", "0.99")
+        max_chars = os.getenv("LOG_MAX_CHARS")
+        return cls(
+            rate=float(os.getenv("LOG_SAMPLE_RATE", "1")),
+            quantile=float(quantile) if quantile else None,
+            max_chars=int(max_chars) if max_chars else None,
+            redactor=Redactor(patterns),
+        )
+
+    def head(self) -> bool:
+        """
+        Whether to print a call before making it.
+        """
+        return self.rate >= 1 or random.random() < self.rate
+
+    def tail(self, seconds: float, error: Exception | None = None) -> bool:
+        """
+        Records the latency of a call and whether to print it anyway: it
+        failed or it was slow.
+        """
+        with self._lock:
+            self.latencies.append(seconds)
+            self._calls += 1
+            if (
+                self.quantile is not None
+                and self._calls % self.refresh == 0
+                and len(self.latencies) >= self.min_samples
+            ):
+                ordered = sorted(self.latencies)
+                self.threshold = ordered[int(self.quantile * (len(ordered) - 1))]
+        if error is not None:
+            return True
+        return self.threshold is not None and seconds > self.threshold
+
+    def payload(self, text: str) -> str:
+        return truncate(self.redactor(text), self.max_chars)
@@ -0,0 +1,277 @@
+"""
+Spans of the stages of the pipelines: where the time (and the tokens) of a
+request goes, not only the calls to the API.
+
+```python
+with span("retrieve", n_results=5) as s:
+    documents = collection.query(...)
+    s.set(documents=len(documents))
+
+
+@traced("scrape")
+def scrape_web(url): ...
+```
+
+Spans opened inside another one are its children (also in `asyncio` tasks;
+to keep the parent in a thread pool submit `contextvars.copy_context().run`).
+An exception marks the span as failed and propagates.
+
+With `TRACES=traces.jsonl` each finished span is written as a line in the
+OTLP/JSON format (the one of the file exporter of the OpenTelemetry
+Collector), so it can be loaded by any OpenTelemetry tool. Without it
+spans cost almost nothing.
+
+`python -m observability.tracing traces.jsonl` prints the folded stacks of
+the spans (self time in microseconds), the input of `flamegraph.pl` or
+speedscope.
+"""
+
+import functools
+import inspect
+import json
+import os
+import secrets
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterator
+
+SCOPE = "observability.tracing"
+
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: str | None = None
+    start: int = field(default_factory=time.time_ns)
+    end: int | None = None
+    attributes: dict[str, Any] = field(default_factory=dict)
+    error: Exception | None = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def set_usage(self, usage):
+        """
+        Tokens of an API response (`response.usage`, `None` if unknown).
+        """
+        if usage is not None:
+            self.set(
+                prompt_tokens=usage.prompt_tokens,
+                completion_tokens=usage.completion_tokens,
+            )
+
+    def to_otlp(self) -> dict[str, Any]:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,  # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(self.start),
+            "endTimeUnixNano": str(self.end),
+            "attributes": otlp_attributes(self.attributes),
+            "status": {"code": 1},  # STATUS_CODE_OK
+        }
+        if self.parent_id is not None:
+            span["parentSpanId"] = self.parent_id
+        if self.error is not None:
+            message = str(self.error)
+            span["status"] = {"code": 2, "message": message}  # STATUS_CODE_ERROR
+            span["events"] = [
+                {
+                    "name": "exception",
+                    "timeUnixNano": str(self.end),
+                    "attributes": otlp_attributes(
+                        {
+                            "exception.type": type(self.error).__name__,
+                            "exception.message": message,
+                        }
+                    ),
+                }
+            ]
+        return span
+
+
+class NoSpan:
+    """
+    What `span` returns when tracing is disabled.
+    """
+
+    def set(self, **attributes):
+        pass
+
+    def set_usage(self, usage):
+        pass
+
+
+NO_SPAN = NoSpan()
+
+
+def otlp_value(value: Any) -> dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}  # int64 are strings in OTLP/JSON
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    if isinstance(value, (list, tuple)):
+        return {"arrayValue": {"values": [otlp_value(v) for v in value]}}
+    return {"stringValue": str(value)}
+
+
+def otlp_attributes(attributes: dict[str, Any]) -> list[dict[str, Any]]:
+    return [
+        {"key": key, "value": otlp_value(value)}
+        for key, value in attributes.items()
+        if value is not None
+    ]
+
+
+class FileExporter:
+    """
+    Appends one `ExportTraceServiceRequest` per span to a JSON lines file.
+    """
+
+    def __init__(self, path: str, service: str = "genai"):
+        self.path = path
+        self.resource = {"attributes": otlp_attributes({"service.name": service})}
+        self._lock = threading.Lock()
+
+    def export(self, span: Span):
+        request = {
+            "resourceSpans": [
+                {
+                    "resource": self.resource,
+                    "scopeSpans": [
+                        {"scope": {"name": SCOPE}, "spans": [span.to_otlp()]}
+                    ],
+                }
+            ]
+        }
+        line = json.dumps(request, default=str) + "\n"
+        with self._lock, open(self.path, "a") as f:
+            f.write(line)
+
+
+_current: ContextVar[Span | None] = ContextVar("span", default=None)
+
+
+class Tracer:
+    def __init__(self, exporters: list | None = None):
+        self.exporters = exporters or []
+
+    @classmethod
+    def from_env(cls) -> "Tracer":
+        if path := os.getenv("TRACES"):
+            service = os.getenv("OTEL_SERVICE_NAME", "genai")
+            return cls([FileExporter(path, service)])
+        return cls()
+
+    @contextmanager
+    def span(self, name: str, **attributes) -> Iterator[Span | NoSpan]:
+        if not self.exporters:
+            yield NO_SPAN
+            return
+
+        parent = _current.get()
+        span = Span(
+            name,
+            trace_id=parent.trace_id if parent else secrets.token_hex(16),
+            span_id=secrets.token_hex(8),
+            parent_id=parent.span_id if parent else None,
+            attributes=attributes,
+        )
+        token = _current.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = e
+            raise
+        finally:
+            span.end = time.time_ns()
+            _current.reset(token)
+            for exporter in self.exporters:
+                exporter.export(span)
+
+
+@functools.cache
+def default_tracer() -> Tracer:
+    # Created on the first span, after the pipelines load `.env`
+    return Tracer.from_env()
+
+
+def span(name: str, **attributes):
+    """
+    Span of the default tracer (the one of `TRACES`).
+    """
+    return default_tracer().span(name, **attributes)
+
+
+def traced(name: str | None = None) -> Callable:
+    """
+    Decorator: each call of the function (sync or async) is a span.
+    """
+
+    def decorator(fn):
+        span_name = name or fn.__name__
+
+        if inspect.iscoroutinefunction(fn):
+
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(span_name):
+                    return await fn(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def folded(path: str) -> dict[str, int]:
+    """
+    Self time in microseconds of each stack of span names
+    (`chatbot;retrieve`) of a file written by `FileExporter`.
+    """
+    spans = {}
+    with open(path) as f:
+        for line in f:
+            for resource in json.loads(line)["resourceSpans"]:
+                for scope in resource["scopeSpans"]:
+                    for s in scope["spans"]:
+                        spans[s["spanId"]] = s
+
+    children = defaultdict(int)
+    for s in spans.values():
+        duration = int(s["endTimeUnixNano"]) - int(s["startTimeUnixNano"])
+        if parent := s.get("parentSpanId"):
+            children[parent] += duration
+
+    stacks = defaultdict(int)
+    for s in spans.values():
+        names, parent = [s["name"]], s.get("parentSpanId")
+        while parent in spans:
+            names.append(spans[parent]["name"])
+            parent = spans[parent].get("parentSpanId")
+        duration = int(s["endTimeUnixNano"]) - int(s["startTimeUnixNano"])
+        # Concurrent children can add up to more than their parent
+        own = max(0, duration - children[s["spanId"]])
+        stacks[";".join(reversed(names))] += own // 1000
+    return dict(stacks)
+
+
+if __name__ == "__main__":
+    for stack, microseconds in sorted(folded(sys.argv[1]).items()):
+        print(stack, microseconds)
@@ -0,0 +1,6 @@
+"""
+Building blocks of the retrieval side of the RAG pipelines (embeddings,
+indexes...) that `solved/rag` leaves as simple as possible on purpose.
+
+Like `gateway`, each one is a small module that can be read in one sitting.
+"""
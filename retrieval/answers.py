@@ -0,0 +1,147 @@
+"""
+Cache of answers for questions already asked, with two levels:
+
+1. Exact: the normalised text of the question (case, punctuation and spaces
+   don't count).
+2. Semantic: the embedding of the question against the ones of the cached
+   questions. A paraphrase with cosine similarity `>= threshold` gets the
+   cached answer.
+
+```python
+if (answer := answers.exact(question)) is not None:
+    return answer
+if (answer := answers.similar(vector)) is not None:
+    return answer
+...
+answers.store(question, answer, vector, seconds)
+```
+
+At most `capacity` questions are kept, the least recently used are evicted.
+With a few thousand vectors a brute-force scan of a contiguous matrix is
+faster than an ANN index, so that is what the semantic level does.
+
+The answers depend on the indexed documents: call `invalidate()` after
+re-indexing. `metrics()` returns the hit rates and the seconds saved (the
+time it took to compute the answers that were served from the cache).
+"""
+
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import numpy as np
+
+WORD_RE = re.compile(r"\w+")
+
+
+def normalise(question: str) -> str:
+    return " ".join(WORD_RE.findall(question.lower()))
+
+
+@dataclass
+class Entry:
+    answer: str
+    slot: int | None
+    seconds: float
+
+
+class AnswerCache:
+    def __init__(self, capacity: int = 1000, threshold: float = 0.95):
+        self.capacity = capacity
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self.invalidate()
+
+        self.lookups = 0
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.seconds_saved = 0.0
+
+    def invalidate(self):
+        with self._lock:
+            # Normalised question -> entry, from least to most recently used
+            self.entries: OrderedDict[str, Entry] = OrderedDict()
+            # Row `i` is the (normalised) vector of the entry in slot `i`
+            self.vectors: np.ndarray | None = None
+            self.slots: list[str | None] = [None] * self.capacity
+            self.free = list(range(self.capacity - 1, -1, -1))
+
+    def hit(self, key: str) -> str:
+        entry = self.entries[key]
+        self.entries.move_to_end(key)
+        self.seconds_saved += entry.seconds
+        return entry.answer
+
+    def exact(self, question: str) -> str | None:
+        """
+        First level. Every question is looked up here first, so it counts
+        the lookups.
+        """
+        key = normalise(question)
+        with self._lock:
+            self.lookups += 1
+            if key in self.entries:
+                self.exact_hits += 1
+                return self.hit(key)
+        return None
+
+    def similar(self, vector) -> str | None:
+        """
+        Second level: answer of the most similar cached question if it's
+        similar enough.
+        """
+        vector = unit(vector)
+        with self._lock:
+            if self.vectors is None or not self.entries:
+                return None
+            scores = self.vectors @ vector
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold or self.slots[best] is None:
+                return None
+            self.semantic_hits += 1
+            return self.hit(self.slots[best])
+
+    def store(self, question: str, answer: str, vector=None, seconds: float = 0.0):
+        key = normalise(question)
+        with self._lock:
+            if key in self.entries:
+                self.remove(key)
+            if len(self.entries) >= self.capacity:
+                self.remove(next(iter(self.entries)))
+
+            slot = None
+            if vector is not None:
+                vector = unit(vector)
+                if self.vectors is None:
+                    self.vectors = np.zeros((self.capacity, len(vector)), np.float32)
+                slot = self.free.pop()
+                self.vectors[slot] = vector
+                self.slots[slot] = key
+            self.entries[key] = Entry(answer, slot, seconds)
+
+    def remove(self, key: str):
+        entry = self.entries.pop(key)
+        if entry.slot is not None:
+            # A zero vector never reaches the threshold
+            self.vectors[entry.slot] = 0
+            self.slots[entry.slot] = None
+            self.free.append(entry.slot)
+
+    def metrics(self) -> dict[str, float]:
+        with self._lock:
+            lookups = max(1, self.lookups)
+            return {
+                "lookups": self.lookups,
+                "entries": len(self.entries),
+                "exact_hit_rate": self.exact_hits / lookups,
+                "semantic_hit_rate": self.semantic_hits / lookups,
+                "hit_rate": (self.exact_hits + self.semantic_hits) / lookups,
+                "seconds_saved": self.seconds_saved,
+            }
+
+
+def unit(vector) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
@@ -0,0 +1,166 @@
+"""
+Chunks as offsets into their source text instead of copies of it.
+
+A `Chunk` is a record with `__slots__` (source, start and end offsets and a
+hash of its bytes): about 150 bytes with its integers whatever its size,
+against a `str` with the text of each chunk (plus the overlap, copied into
+two chunks). The texts of the sources are stored once, as UTF-8, in a
+`SourceStore`: an append-only file that is memory-mapped, so the pages of
+the corpus are read by the OS only when a chunk is materialised.
+
+```python
+sources = SourceStore("./ragsources")
+sources.add(url, text.encode())
+chunks = [Chunk(url, start, end, chunk_hash(...)) for start, end in spans]
+collection.add(ids=[chunk.id for chunk in chunks], embeddings=...)
+...
+context = sources.texts(Chunk.from_id(id) for id in result["ids"][0])
+```
+
+The id of a chunk encodes the record, so the vector store only keeps ids
+and vectors. A chunk of an older version of a source (its hash doesn't
+match the stored bytes anymore) isn't materialised.
+
+Several processes can share a store (an `ingest` while the chatbot
+answers): appends are serialised with `flock`, and a source that is
+missing or changed is looked up again in the index written by the others.
+"""
+
+import fcntl
+import hashlib
+import json
+import mmap
+import os
+import threading
+from contextlib import contextmanager
+from typing import Iterable
+
+
+def chunk_hash(data: bytes | memoryview) -> int:
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest())
+
+
+class Chunk:
+    __slots__ = ("end", "hash", "source", "start")
+
+    def __init__(self, source: str, start: int, end: int, hash: int):
+        self.source = source
+        # Offsets of the UTF-8 bytes of the source text
+        self.start = start
+        self.end = end
+        self.hash = hash
+
+    @property
+    def id(self) -> str:
+        # Stable: indexing the same page again doesn't duplicate its chunks
+        return f"{self.source}#{self.start}:{self.end}:{self.hash:016x}"
+
+    @classmethod
+    def from_id(cls, id: str) -> "Chunk":
+        source, _, span = id.rpartition("#")
+        start, end, digest = span.split(":")
+        return cls(source, int(start), int(end), int(digest, 16))
+
+    def __reduce__(self):
+        # Sent between processes without a `__dict__`
+        return Chunk, (self.source, self.start, self.end, self.hash)
+
+    def __repr__(self) -> str:
+        return f"Chunk({self.source!r}, {self.start}, {self.end})"
+
+
+class SourceStore:
+    """
+    Texts of the sources in `path.bin` and where each one starts in
+    `path.idx` (JSON lines). Adding a source again with another text appends
+    it, the last one wins.
+    """
+
+    def __init__(self, path: str):
+        self.data_path = f"{path}.bin"
+        self.index_path = f"{path}.idx"
+        self.lock_path = f"{path}.lock"
+        # Source -> (offset, length) in the data file
+        self.index: dict[str, tuple[int, int]] = {}
+        self.index_read = 0  # Bytes of the index file already read
+        self.data: mmap.mmap | None = None
+        self._lock = threading.Lock()
+        self.reload()
+
+    def reload(self):
+        """
+        Reads the sources added to the index (by this or other processes)
+        since the last time.
+        """
+        if not os.path.exists(self.index_path):
+            return
+        with open(self.index_path, "rb") as f:
+            f.seek(self.index_read)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # Still being written
+                source, offset, length = json.loads(line)
+                self.index[source] = (offset, length)
+                self.index_read += len(line)
+        self.open()
+
+    def open(self):
+        # The views of the previous map keep it alive until they are released
+        size = os.path.getsize(self.data_path) if os.path.exists(self.data_path) else 0
+        if size and (self.data is None or len(self.data) != size):
+            with open(self.data_path, "rb") as f:
+                self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    @contextmanager
+    def locked(self):
+        """
+        Exclusive access to the files, between threads and processes.
+        """
+        os.makedirs(os.path.dirname(self.data_path) or ".", exist_ok=True)
+        with self._lock:
+            fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                yield
+            finally:
+                os.close(fd)  # Also releases the lock
+
+    def add(self, source: str, text: bytes):
+        with self.locked():
+            self.reload()
+            if source in self.index and self.view(source) == text:
+                return  # Same text, the chunks already point to it
+            with open(self.data_path, "ab") as data:
+                offset = data.seek(0, os.SEEK_END)
+                data.write(text)
+            line = json.dumps([source, offset, len(text)]) + "\n"
+            with open(self.index_path, "a") as index:
+                index.write(line)
+            self.reload()
+
+    def view(self, source: str) -> memoryview:
+        """
+        Bytes of the text of `source`, without copying them.
+        """
+        offset, length = self.index[source]
+        if self.data is None:
+            return memoryview(b"")
+        return memoryview(self.data)[offset : offset + length]
+
+    def text(self, chunk: Chunk) -> str | None:
+        """
+        The text of `chunk`, or `None` if its source changed or is missing
+        (also after reading what other processes added since).
+        """
+        for attempt in range(2):
+            if chunk.source in self.index:
+                data = self.view(chunk.source)[chunk.start : chunk.end]
+                if chunk_hash(data) == chunk.hash:
+                    return bytes(data).decode()
+            if not attempt:
+                with self._lock:
+                    self.reload()
+        return None
+
+    def texts(self, chunks: Iterable[Chunk]) -> list[str]:
+        return [text for chunk in chunks if (text := self.text(chunk)) is not None]
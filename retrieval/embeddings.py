@@ -0,0 +1,250 @@
+"""
+Embedding backends with the same interface: `embed(texts)` returns one vector
+per text and `model` identifies the vectors (two backends with the same
+`model` must return the same vectors).
+
+- `OpenAIEmbedder`: the API, in batches, through the limiter and retries of
+  `gateway`.
+- `LocalEmbedder`: a `sentence-transformers` model on the CPU (optionally
+  exported to ONNX), batches run in a thread pool. No network after the first
+  download of the model.
+- `HashingEmbedder`: hashed bag of words, no dependencies. Worse retrieval,
+  but deterministic and offline (tests, benchmarks, demos without API key).
+
+`CachedEmbedder` wraps any of them with a persistent cache (SQLite) keyed by
+`(model, hash of the text)`, so re-indexing a document only embeds the
+chunks that changed. `EmbeddingFunction` adapts an embedder to `chromadb`.
+
+```python
+embedder = CachedEmbedder(LocalEmbedder("all-MiniLM-L6-v2"), ".embeddings.sqlite")
+ef = EmbeddingFunction(embedder)
+collection = db.get_or_create_collection("rag", embedding_function=ef)
+```
+
+`embedder_from_env` chooses the backend with `EMBEDDINGS` (see `.env.example`).
+"""
+
+import hashlib
+import math
+import os
+import re
+import sqlite3
+import threading
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Any, Protocol
+
+DEFAULT_OPENAI_MODEL = "text-embedding-ada-002"
+DEFAULT_LOCAL_MODEL = "all-MiniLM-L6-v2"
+
+
+class Embedder(Protocol):
+    model: str
+
+    def embed(self, texts: list[str]) -> list[list[float]]: ...
+
+
+def batched(items: list, size: int) -> list[list]:
+    return [items[i : i + size] for i in range(0, len(items), size)]
+
+
+@dataclass
+class OpenAIEmbedder:
+    client: Any
+    model: str = DEFAULT_OPENAI_MODEL
+    limiter: Any = None
+    retry: Any = None
+    # The API accepts up to 2048 inputs per request
+    batch_size: int = 1000
+
+    def embed(self, texts: list[str]) -> list[list[float]]:
+        create = self.client.embeddings.create
+        if self.limiter is not None:
+            create = partial(self.limiter, create)
+
+        vectors = []
+        for batch in batched(texts, self.batch_size):
+            if self.retry is not None:
+                response = self.retry(create, model=self.model, input=batch)
+            else:
+                response = create(model=self.model, input=batch)
+            data = sorted(response.data, key=lambda item: item.index)
+            vectors.extend(item.embedding for item in data)
+        return vectors
+
+
+@dataclass
+class LocalEmbedder:
+    """
+    `name` is a `sentence-transformers` model. `backend="onnx"` runs it with
+    ONNX Runtime (`pip install sentence-transformers[onnx]`), usually faster
+    on CPU than `torch`.
+    """
+
+    name: str = DEFAULT_LOCAL_MODEL
+    backend: str = "torch"
+    batch_size: int = 32
+    workers: int = field(default_factory=lambda: os.cpu_count() or 1)
+
+    _model: Any = field(default=None, repr=False)
+    _executor: ThreadPoolExecutor | None = field(default=None, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    @property
+    def model(self) -> str:
+        return f"local:{self.name}"
+
+    def load(self):
+        with self._lock:
+            if self._model is None:
+                try:
+                    from sentence_transformers import SentenceTransformer
+                except ImportError as e:
+                    raise ImportError(
+                        "LocalEmbedder needs `pip install sentence-transformers`"
+                    ) from e
+
+                kwargs = {"backend": self.backend} if self.backend != "torch" else {}
+                self._model = SentenceTransformer(self.name, device="cpu", **kwargs)
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="embed"
+                )
+        return self._model
+
+    def encode(self, batch: list[str]) -> list[list[float]]:
+        vectors = self._model.encode(
+            batch, batch_size=len(batch), normalize_embeddings=True
+        )
+        return vectors.tolist()
+
+    def embed(self, texts: list[str]) -> list[list[float]]:
+        self.load()
+        # The inference releases the GIL, so the batches use several cores
+        batches = self._executor.map(self.encode, batched(texts, self.batch_size))
+        return [vector for batch in batches for vector in batch]
+
+
+WORD_RE = re.compile(r"\w+")
+
+
+@dataclass
+class HashingEmbedder:
+    dimensions: int = 256
+
+    @property
+    def model(self) -> str:
+        return f"hashing:{self.dimensions}"
+
+    def embed_one(self, text: str) -> list[float]:
+        vector = [0.0] * self.dimensions
+        for word in WORD_RE.findall(text.lower()):
+            digest = hashlib.blake2b(word.encode(), digest_size=8).digest()
+            bucket = int.from_bytes(digest)
+            # The sign spreads the collisions instead of piling them up
+            vector[bucket % self.dimensions] += 1.0 if bucket >> 63 else -1.0
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def embed(self, texts: list[str]) -> list[list[float]]:
+        return [self.embed_one(text) for text in texts]
+
+
+def text_hash(text: str) -> bytes:
+    return hashlib.sha256(text.encode()).digest()
+
+
+class CachedEmbedder:
+    """
+    Vectors are stored as `float32`, enough for retrieval and half the size.
+    `path=":memory:"` keeps the cache in memory.
+    """
+
+    def __init__(self, embedder: Embedder, path: str = ".embeddings.sqlite"):
+        self.embedder = embedder
+        self.model = embedder.model
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "model TEXT, hash BLOB, vector BLOB, PRIMARY KEY (model, hash)"
+            ") WITHOUT ROWID"
+        )
+
+    def lookup(self, hashes: list[bytes]) -> dict[bytes, list[float]]:
+        found = {}
+        # SQLite limits the number of parameters of a query
+        for batch in batched(hashes, 500):
+            rows = self._db.execute(
+                "SELECT hash, vector FROM embeddings WHERE model = ? AND hash IN "
+                f"({', '.join('?' * len(batch))})",
+                [self.model, *batch],
+            )
+            for key, blob in rows:
+                found[key] = array("f", blob).tolist()
+        return found
+
+    def embed(self, texts: list[str]) -> list[list[float]]:
+        hashes = [text_hash(text) for text in texts]
+        with self._lock:
+            vectors = self.lookup(list(set(hashes)))
+
+        missing = {key: text for key, text in zip(hashes, texts) if key not in vectors}
+        if missing:
+            new = self.embedder.embed(list(missing.values()))
+            vectors.update(zip(missing, new))
+            with self._lock, self._db:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)",
+                    [
+                        (self.model, key, array("f", vector).tobytes())
+                        for key, vector in zip(missing, new)
+                    ],
+                )
+
+        with self._lock:
+            self.misses += len(missing)
+            self.hits += len(texts) - len(missing)
+        return [vectors[key] for key in hashes]
+
+
+class EmbeddingFunction:
+    """
+    Adapts an embedder to the embedding functions of `chromadb`.
+    """
+
+    def __init__(self, embedder: Embedder):
+        self.embedder = embedder
+
+    def __call__(self, input: list[str]) -> list[list[float]]:
+        return self.embedder.embed(list(input))
+
+
+def embedder_from_env(client=None, limiter=None, retry=None) -> Embedder:
+    """
+    `EMBEDDINGS` is `openai[:model]` (default), `local[:model]`,
+    `local-onnx[:model]` (`LocalEmbedder` with ONNX Runtime) or
+    `hashing[:dimensions]`. With `EMBEDDINGS_CACHE` the vectors are cached in
+    that file.
+    """
+    kind, _, name = os.getenv("EMBEDDINGS", "openai").partition(":")
+    if kind == "openai":
+        embedder = OpenAIEmbedder(
+            client, name or DEFAULT_OPENAI_MODEL, limiter=limiter, retry=retry
+        )
+    elif kind == "local":
+        embedder = LocalEmbedder(name or DEFAULT_LOCAL_MODEL)
+    elif kind == "local-onnx":
+        embedder = LocalEmbedder(name or DEFAULT_LOCAL_MODEL, backend="onnx")
+    elif kind == "hashing":
+        embedder = HashingEmbedder(int(name) if name else 256)
+    else:
+        raise ValueError(f"Unknown embeddings backend: {kind!r}")
+
+    if path := os.getenv("EMBEDDINGS_CACHE"):
+        return CachedEmbedder(embedder, path)
+    return embedder
@@ -0,0 +1,81 @@
+"""
+Parallel ingestion of many pages. Parsing the HTML and splitting the text
+into chunks is pure Python: it holds the GIL and, in the same process, it
+competes with the downloads. Here it runs in a pool of processes, which
+receive the raw HTML and return the text and the chunks. Downloading,
+embedding and writing to the database stay in the parent process.
+
+```python
+pages = ((url, http().get(url).text) for url in urls)
+for source, text, chunks in chunk_pages(pages, "structured:256:32"):
+    sources.add(source, text)
+    collection.add(ids=[chunk.id for chunk in chunks], ...)
+```
+
+The pages are parsed with `parse_post` and split with the splitter of
+`retrieval.splitting.make_splitter`, which returns the `(start, end)`
+offsets of the chunks in the UTF-8 text. The chunks are
+`retrieval.chunks.Chunk` records: the text of each page travels once, not
+once per chunk.
+
+The processes only receive plain values (the spec of the splitter, the
+pages) and only import `retrieval`, also with the `spawn` and `forkserver`
+start methods, which import the modules of the task again in each process.
+With `workers=1` everything runs in this process, without a pool.
+"""
+
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator
+
+import bs4
+
+from .chunks import Chunk, chunk_hash
+from .splitting import make_splitter
+
+Page = tuple[str, bytes, list[Chunk]]
+
+
+def parse_post(html: str) -> str:
+    soup = bs4.BeautifulSoup(html, "html.parser")
+    elements = [soup.find(class_="post-title"), soup.find(class_="post-content")]
+    return " ".join([element.get_text() for element in elements])
+
+
+def chunk_page(splitter: str, source: str, html: str) -> Page:
+    text = parse_post(html).encode()
+    view = memoryview(text)
+    chunks = [
+        Chunk(source, start, end, chunk_hash(view[start:end]))
+        for start, end in make_splitter(splitter)(text)
+    ]
+    return source, text, chunks
+
+
+def chunk_pages(
+    pages: Iterable[tuple[str, str]],
+    splitter: str = "",
+    workers: int | None = None,
+) -> Iterator[Page]:
+    """
+    `(source, text, chunks)` of each `(source, html)` page, in the order of
+    `pages`. `splitter` is the spec of `make_splitter`.
+
+    Pages are sent to the processes while `pages` is consumed (the downloads
+    overlap with the parsing), with at most `2 * workers` pages in flight.
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        for source, html in pages:
+            yield chunk_page(splitter, source, html)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for source, html in pages:
+            pending.append(executor.submit(chunk_page, splitter, source, html))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
@@ -0,0 +1,338 @@
+"""
+Vector storage quantised to `int8` in memory-mapped files.
+
+The search scans the `int8` codes (a quarter of the size of `float32`
+vectors) and re-ranks the best `candidates` with the full-precision vectors,
+which stay on disk: only the rows of the candidates are read. Opening an
+index maps the files, nothing is loaded, so it's instant whatever its size.
+
+```python
+db = QuantizedClient("./ragindex")
+collection = db.get_or_create_collection("rag", embedding_function=ef)
+collection.add(ids=ids, documents=chunks)
+collection.query(query_texts=[question], n_results=5)
+```
+
+`QuantizedClient` and `QuantizedCollection` implement the subset of the
+`chromadb` API that the pipelines use. Vectors are normalised: the scores
+are cosine similarities and the distances `1 - cosine`.
+
+Files of an index (a directory):
+
+- `codes.i8`: `int8` codes, one row per vector.
+- `vectors.f32`: `float32` vectors, read only to re-rank.
+- `scales.f32`: scale of each vector (its maximum absolute value), so each
+  row uses the 255 levels of `int8` and vectors can be appended.
+- `ids.*` and `documents.*`: texts (`.bin`) and their end offsets (`.idx`).
+- `meta.json`: dimensions and number of vectors.
+"""
+
+import json
+import os
+import shutil
+import threading
+from typing import Any, NamedTuple
+from weakref import WeakValueDictionary
+
+import numpy as np
+
+# Rows of codes converted to `float32` at a time while searching (small
+# blocks stay in the CPU cache)
+BLOCK = 1024
+
+
+def mapped(path: str, dtype, shape: tuple[int, ...]) -> np.ndarray:
+    if not shape[0]:
+        return np.empty(shape, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", shape=shape)
+
+
+class Strings:
+    """
+    Append-only list of strings: the UTF-8 bytes in `path.bin` and the end
+    offset of each one in `path.idx`.
+    """
+
+    def __init__(self, path: str, count: int = 0):
+        self.data_path = f"{path}.bin"
+        self.offsets_path = f"{path}.idx"
+        self.open(count)
+
+    def open(self, count: int):
+        offsets = mapped(self.offsets_path, np.int64, (count,))
+        size = int(offsets[-1]) if count else 0
+        # The new strings are readable once the longer data is mapped
+        self.data = mapped(self.data_path, np.uint8, (size,))
+        self.offsets = offsets
+
+    def truncate(self, count: int):
+        """
+        Drops the strings after the first `count` (left by an interrupted
+        `extend`) so the next ones are appended in line with the vectors.
+        """
+        size = int(self.offsets[count - 1]) if count else 0
+        for path, length in [(self.data_path, size), (self.offsets_path, 8 * count)]:
+            if os.path.exists(path) and os.path.getsize(path) > length:
+                os.truncate(path, length)
+
+    def extend(self, strings: list[str]):
+        with open(self.data_path, "ab") as data:
+            position = data.tell()
+            ends = []
+            for string in strings:
+                position += data.write(string.encode())
+                ends.append(position)
+        with open(self.offsets_path, "ab") as offsets:
+            offsets.write(np.array(ends, dtype=np.int64).tobytes())
+
+    def __getitem__(self, i: int) -> str:
+        start = int(self.offsets[i - 1]) if i else 0
+        return self.data[start : int(self.offsets[i])].tobytes().decode()
+
+
+class Rows(NamedTuple):
+    """
+    The maps of the first `count` vectors. `add` replaces them at once, so
+    a search reads a consistent snapshot while rows are being added.
+    """
+
+    count: int
+    codes: np.ndarray
+    vectors: np.ndarray
+    scales: np.ndarray
+
+
+class QuantizedIndex:
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+        self.dim, self.count = 0, 0
+        if os.path.exists(self.file("meta.json")):
+            with open(self.file("meta.json")) as f:
+                meta = json.load(f)
+            self.dim, self.count = meta["dim"], meta["count"]
+
+        self.ids = Strings(self.file("ids"))
+        self.documents = Strings(self.file("documents"))
+        self.known: set[str] | None = None  # Ids already added, read lazily
+        self._lock = threading.Lock()
+        self.open()
+
+    def file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def open(self):
+        """
+        Maps the first `count` vectors: rows written by an interrupted `add`
+        are ignored, and dropped by the next `add`. The ids and documents
+        are mapped first: a search never returns a row without its id.
+        """
+        count, shape = self.count, (self.count, self.dim)
+        self.ids.open(count)
+        self.documents.open(count)
+        self.rows = Rows(
+            count,
+            mapped(self.file("codes.i8"), np.int8, shape),
+            mapped(self.file("vectors.f32"), np.float32, shape),
+            mapped(self.file("scales.f32"), np.float32, (count,)),
+        )
+
+    @property
+    def codes(self) -> np.ndarray:
+        return self.rows.codes
+
+    @property
+    def vectors(self) -> np.ndarray:
+        return self.rows.vectors
+
+    @staticmethod
+    def quantize(vectors: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        scales = np.abs(vectors).max(axis=1)
+        scales[scales == 0] = 1.0
+        codes = np.rint(vectors / scales[:, None] * 127).astype(np.int8)
+        return codes, scales.astype(np.float32)
+
+    def truncate(self):
+        """
+        Drops the rows after `count` so the ones appended next are in line
+        with their ids and documents.
+        """
+        for name, row_bytes in [
+            ("codes.i8", self.dim),
+            ("scales.f32", 4),
+            ("vectors.f32", 4 * self.dim),
+        ]:
+            path, length = self.file(name), self.count * row_bytes
+            if os.path.exists(path) and os.path.getsize(path) > length:
+                os.truncate(path, length)
+        self.ids.truncate(self.count)
+        self.documents.truncate(self.count)
+
+    def add(self, vectors, ids: list[str], documents: list[str]):
+        """
+        Adds the vectors whose id isn't in the index yet, like `chromadb`
+        (the same page indexed again doesn't duplicate its chunks).
+        """
+        with self._lock:
+            if self.known is None:
+                self.known = {self.ids[i] for i in range(self.count)}
+            new, seen = [], set()
+            for i, id in enumerate(ids):
+                if id not in self.known and id not in seen:
+                    seen.add(id)
+                    new.append(i)
+            if not new:
+                return
+            vectors = np.asarray(vectors, dtype=np.float32)[new]
+            ids = [ids[i] for i in new]
+            documents = [documents[i] for i in new]
+
+            self.truncate()
+            vectors = normalise(vectors)
+            self.dim = vectors.shape[1]
+            codes, scales = self.quantize(vectors)
+            for name, array in [
+                ("codes.i8", codes),
+                ("scales.f32", scales),
+                ("vectors.f32", vectors),
+            ]:
+                with open(self.file(name), "ab") as f:
+                    array.tofile(f)
+            self.ids.extend(ids)
+            self.documents.extend(documents)
+
+            # The new rows are visible once the count is saved
+            self.count += len(vectors)
+            with open(self.file("meta.json"), "w") as f:
+                json.dump({"dim": self.dim, "count": self.count}, f)
+            self.known |= seen
+            self.open()
+
+    def scores(self, query: np.ndarray, rows: Rows | None = None) -> np.ndarray:
+        """
+        Approximate cosine similarity of `query` with every vector of `rows`
+        (by default the current ones).
+        """
+        rows = rows or self.rows
+        scores = np.empty(rows.count, dtype=np.float32)
+        for start in range(0, rows.count, BLOCK):
+            block = rows.codes[start : start + BLOCK].astype(np.float32) @ query
+            end = start + len(block)
+            scores[start:end] = block * rows.scales[start:end] / 127
+        return scores
+
+    def search(
+        self, query, n_results: int = 10, candidates: int | None = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Positions and cosine similarity of the `n_results` nearest vectors,
+        re-ranking `candidates` (by default `max(50, 4 * n_results)`) with
+        the full-precision vectors.
+        """
+        query = normalise(np.asarray(query, dtype=np.float32))
+        rows = self.rows  # Rows added meanwhile aren't searched
+        if not rows.count:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        k = min(rows.count, candidates or max(50, 4 * n_results))
+        scores = self.scores(query, rows)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top.sort()  # The rows are read in the order of the file
+
+        exact = rows.vectors[top] @ query
+        order = np.argsort(-exact)[:n_results]
+        return top[order], exact[order]
+
+    def exact_search(
+        self, query, n_results: int = 10
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Search over the full-precision vectors, to measure the recall.
+        """
+        query = normalise(np.asarray(query, dtype=np.float32))
+        rows = self.rows
+        scores = np.empty(rows.count, dtype=np.float32)
+        for start in range(0, rows.count, BLOCK):
+            block = rows.vectors[start : start + BLOCK]
+            scores[start : start + len(block)] = block @ query
+        top = np.argsort(-scores)[:n_results]
+        return top, scores[top]
+
+
+def normalise(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1.0, norms)
+
+
+class QuantizedCollection:
+    def __init__(
+        self, path: str, embedding_function=None, candidates: int | None = None
+    ):
+        self.index = QuantizedIndex(path)
+        self.embedding_function = embedding_function
+        self.candidates = candidates
+
+    def count(self) -> int:
+        return self.index.count
+
+    def add(
+        self,
+        ids: str | list[str],
+        documents: str | list[str] | None = None,
+        embeddings: list[list[float]] | None = None,
+    ):
+        ids = [ids] if isinstance(ids, str) else ids
+        documents = [documents] if isinstance(documents, str) else documents
+        if embeddings is None:
+            embeddings = self.embedding_function(documents)
+        self.index.add(embeddings, ids, documents or [""] * len(ids))
+
+    def query(
+        self,
+        query_texts: list[str] | None = None,
+        query_embeddings: list[list[float]] | None = None,
+        n_results: int = 10,
+    ) -> dict[str, list[list[Any]]]:
+        if query_embeddings is None:
+            query_embeddings = self.embedding_function(query_texts)
+
+        result = {"ids": [], "documents": [], "distances": []}
+        for query in query_embeddings:
+            positions, scores = self.index.search(query, n_results, self.candidates)
+            result["ids"].append([self.index.ids[i] for i in positions])
+            result["documents"].append([self.index.documents[i] for i in positions])
+            result["distances"].append([1 - float(score) for score in scores])
+        return result
+
+
+class QuantizedClient:
+    """
+    A directory with one index per collection.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        # One index (one lock and one map of its files) per collection while
+        # it's in use: an evicted tenant releases its maps
+        self.collections: WeakValueDictionary[str, QuantizedCollection] = (
+            WeakValueDictionary()
+        )
+        self._lock = threading.Lock()
+
+    def get_or_create_collection(
+        self, name: str, embedding_function=None
+    ) -> QuantizedCollection:
+        with self._lock:
+            if (collection := self.collections.get(name)) is None:
+                path = os.path.join(self.path, name)
+                collection = QuantizedCollection(path, embedding_function)
+                self.collections[name] = collection
+            elif embedding_function is not None:
+                collection.embedding_function = embedding_function
+            return collection
+
+    def delete_collection(self, name: str):
+        with self._lock:
+            self.collections.pop(name, None)
+            shutil.rmtree(os.path.join(self.path, name))
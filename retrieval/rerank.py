@@ -0,0 +1,135 @@
+"""
+Re-ranking of the chunks retrieved by the vector index: we ask the index for
+many candidates (cheap) and only the best few, according to a more precise
+scorer, go to the prompt (expensive).
+
+- `CrossEncoderReranker`: a `sentence-transformers` cross-encoder on the CPU
+  that reads the question and each chunk together. Batches run in a thread
+  pool.
+- `BM25Reranker`: BM25 over the candidates, no dependencies. The exact words
+  of the question complement the similarity of the embeddings.
+
+```python
+result = collection.query(query_texts=[question], n_results=50)
+context = reranker.rerank(question, result["documents"][0], top_n=3)
+```
+
+`reranker_from_env` chooses one with `RERANKER` (see `.env.example`).
+"""
+
+import math
+import os
+import re
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Protocol
+
+DEFAULT_CROSS_ENCODER = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+
+class Reranker(Protocol):
+    def rerank(self, query: str, documents: list[str], top_n: int) -> list[str]: ...
+
+
+def best(documents: list[str], scores: list[float], top_n: int) -> list[str]:
+    order = sorted(range(len(documents)), key=lambda i: -scores[i])
+    return [documents[i] for i in order[:top_n]]
+
+
+@dataclass
+class CrossEncoderReranker:
+    name: str = DEFAULT_CROSS_ENCODER
+    batch_size: int = 16
+    workers: int = field(default_factory=lambda: os.cpu_count() or 1)
+
+    _model: Any = field(default=None, repr=False)
+    _executor: ThreadPoolExecutor | None = field(default=None, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def load(self):
+        with self._lock:
+            if self._model is None:
+                try:
+                    from sentence_transformers import CrossEncoder
+                except ImportError as e:
+                    raise ImportError(
+                        "CrossEncoderReranker needs `sentence-transformers`"
+                    ) from e
+
+                self._model = CrossEncoder(self.name, device="cpu")
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="rerank"
+                )
+        return self._model
+
+    def predict(self, pairs: list[tuple[str, str]]) -> list[float]:
+        return self._model.predict(pairs, batch_size=len(pairs)).tolist()
+
+    def rerank(self, query: str, documents: list[str], top_n: int) -> list[str]:
+        self.load()
+        pairs = [(query, document) for document in documents]
+        size = self.batch_size
+        batches = [pairs[i : i + size] for i in range(0, len(pairs), size)]
+        # The inference releases the GIL, so the batches use several cores
+        scores = []
+        for batch in self._executor.map(self.predict, batches):
+            scores.extend(batch)
+        return best(documents, scores, top_n)
+
+
+WORD_RE = re.compile(r"\w+")
+
+
+@dataclass
+class BM25Reranker:
+    k1: float = 1.5
+    b: float = 0.75
+
+    def scores(self, query: str, documents: list[str]) -> list[float]:
+        """
+        BM25 with the candidates as the corpus (for the document frequency
+        and the mean length).
+        """
+        docs = [WORD_RE.findall(document.lower()) for document in documents]
+        if not docs:
+            return []
+        mean_length = sum(len(doc) for doc in docs) / len(docs) or 1.0
+        frequency = Counter(word for doc in docs for word in set(doc))
+        idf = {
+            word: math.log(1 + (len(docs) - n + 0.5) / (n + 0.5))
+            for word, n in frequency.items()
+        }
+
+        terms = set(WORD_RE.findall(query.lower()))
+        scores = []
+        for doc in docs:
+            counts = Counter(doc)
+            norm = self.k1 * (1 - self.b + self.b * len(doc) / mean_length)
+            scores.append(
+                sum(
+                    idf[term] * counts[term] * (self.k1 + 1) / (counts[term] + norm)
+                    for term in terms
+                    if term in counts
+                )
+            )
+        return scores
+
+    def rerank(self, query: str, documents: list[str], top_n: int) -> list[str]:
+        return best(documents, self.scores(query, documents), top_n)
+
+
+def reranker_from_env() -> Reranker | None:
+    """
+    `RERANKER` is `cross-encoder[:model]` or `bm25`. Without it there is no
+    re-ranking (`None`).
+    """
+    kind, _, name = os.getenv("RERANKER", "").partition(":")
+    if not kind:
+        return None
+    if kind == "cross-encoder":
+        return CrossEncoderReranker(name or DEFAULT_CROSS_ENCODER)
+    if kind == "bm25":
+        return BM25Reranker()
+    raise ValueError(f"Unknown reranker: {kind!r}")
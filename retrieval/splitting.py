@@ -0,0 +1,226 @@
+"""
+Splitters that return `(start, end)` offsets of the UTF-8 bytes of a text.
+
+`span_splitter` (like `text_splitter` of `solved/rag/v2.py`) cuts every
+`chunk_size` characters wherever the words fall and repeats
+`chunk_overlap` characters in the next chunk (about 20% more to index).
+`StructuredSplitter` follows the structure of the text instead, sized in
+tokens:
+
+1. Each line is a block: a heading (short, without final punctuation, or
+   starting with `#`) or a paragraph.
+2. A heading always starts a new chunk: a chunk never mixes two sections.
+3. Paragraphs are packed into chunks of up to `chunk_tokens` tokens. A
+   paragraph that doesn't fit alone is split into sentences, and a sentence
+   that doesn't fit into words.
+4. With `overlap_tokens`, a chunk starts with the last whole paragraphs or
+   sentences of the previous one of the same section (none by default).
+
+The offsets are for `retrieval/ingest.py` and `retrieval/chunks.py`.
+Tokens are counted with `tiktoken` when it's installed and its encoding can
+be loaded (it's downloaded on first use; offline, cache it beforehand with
+`TIKTOKEN_CACHE_DIR`), otherwise estimated (4 bytes per token).
+
+`make_splitter` builds a splitter from a plain string (`span:1000:200`,
+`structured:256:32`), which is what the ingestion processes receive, and
+`splitter_from_env` reads it from `SPLITTER` (see `.env.example`).
+"""
+
+import functools
+import os
+import re
+import warnings
+from dataclasses import dataclass
+from typing import Callable, Iterator, NamedTuple
+
+SPAN_WORD_RE = re.compile(rb"[^\s\.,;:]+")
+BLOCK_RE = re.compile(rb"[^\n]+")
+SENTENCE_RE = re.compile(rb"[^.!?]+(?:[.!?]+|$)")
+WORD_RE = re.compile(rb"\S+")
+HEADING_MAX_BYTES = 80
+
+
+def span_splitter(doc: bytes, chunk_size: int = 1000, chunk_overlap: int = 200):
+    """
+    Chunks of up to `chunk_size` bytes as slices of the text (with its
+    punctuation) that start with the last `chunk_overlap` bytes of the
+    previous chunk. The offsets are always at the start or end of a word,
+    never inside a character.
+    """
+    starts = []  # Words of the current chunk
+    previous = []  # Words of the previous chunk
+    end = 0
+    for word in SPAN_WORD_RE.finditer(doc):
+        if starts and word.end() - starts[0] > chunk_size:
+            yield overlap_start(previous, starts[0], chunk_overlap), end
+            previous, starts = starts, []
+        starts.append(word.start())
+        end = word.end()
+    if starts:
+        yield overlap_start(previous, starts[0], chunk_overlap), end
+
+
+def overlap_start(previous: list[int], start: int, chunk_overlap: int) -> int:
+    # First word of the previous chunk within `chunk_overlap` of `start`
+    for word_start in previous:
+        if word_start >= start - chunk_overlap:
+            return word_start
+    return start
+
+
+def estimate_tokens(text: bytes) -> int:
+    return max(1, len(text) // 4)
+
+
+@functools.cache
+def token_counter(encoding: str) -> Callable[[bytes], int]:
+    # Cached per process: the splitter is sent to the ingestion processes
+    try:
+        import tiktoken
+    except ImportError:
+        return estimate_tokens
+    try:
+        # Downloads the BPE file on first use (cached in `TIKTOKEN_CACHE_DIR`)
+        encoder = tiktoken.get_encoding(encoding)
+    except (OSError, ValueError, KeyError) as e:
+        # Offline (`requests` errors are `OSError`) or unknown encoding. Once
+        # per process and encoding, like the counter
+        warnings.warn(
+            f"Tokens of `{encoding}` estimated ({type(e).__name__}: {e})",
+            RuntimeWarning,
+            stacklevel=2,
+        )
+        return estimate_tokens
+    return lambda text: len(encoder.encode(text.decode(errors="ignore")))
+
+
+class Piece(NamedTuple):
+    start: int
+    end: int
+    tokens: int
+    heading: bool
+
+
+def strip(doc: bytes, start: int, end: int) -> tuple[int, int]:
+    while start < end and doc[start] in b" \t\r":
+        start += 1
+    while end > start and doc[end - 1] in b" \t\r":
+        end -= 1
+    return start, end
+
+
+def is_heading(block: bytes) -> bool:
+    if block.startswith(b"#"):
+        return True
+    return len(block) <= HEADING_MAX_BYTES and not block.rstrip().endswith(
+        (b".", b"!", b"?", b":", b",", b";")
+    )
+
+
+@dataclass(frozen=True)
+class StructuredSplitter:
+    chunk_tokens: int = 256
+    overlap_tokens: int = 0
+    encoding: str = "cl100k_base"
+
+    def pieces(self, doc: bytes) -> Iterator[Piece]:
+        """
+        Headings, paragraphs and, when a paragraph doesn't fit in a chunk,
+        its sentences (or words).
+        """
+        count = token_counter(self.encoding)
+        for block in BLOCK_RE.finditer(doc):
+            start, end = strip(doc, *block.span())
+            if start == end:
+                continue
+            text = doc[start:end]
+            if is_heading(text):
+                yield Piece(start, end, count(text), heading=True)
+                continue
+            if (tokens := count(text)) <= self.chunk_tokens:
+                yield Piece(start, end, tokens, heading=False)
+                continue
+            for sentence in SENTENCE_RE.finditer(doc, start, end):
+                yield from self.fit(doc, *strip(doc, *sentence.span()))
+
+    def fit(self, doc: bytes, start: int, end: int) -> Iterator[Piece]:
+        count = token_counter(self.encoding)
+        if start == end:
+            return
+        if (tokens := count(doc[start:end])) <= self.chunk_tokens:
+            yield Piece(start, end, tokens, heading=False)
+            return
+        # A sentence longer than a chunk: its words
+        for word in WORD_RE.finditer(doc, start, end):
+            yield Piece(*word.span(), count(word.group()), heading=False)
+
+    def __call__(self, doc: bytes) -> Iterator[tuple[int, int]]:
+        chunk: list[Piece] = []
+        tokens = 0
+        for piece in self.pieces(doc):
+            only_headings = all(p.heading for p in chunk)
+            new_section = piece.heading and not only_headings
+            if chunk and (new_section or tokens + piece.tokens > self.chunk_tokens):
+                yield chunk[0].start, chunk[-1].end
+                chunk = [] if new_section else self.overlap(doc, chunk, piece.tokens)
+                tokens = sum(p.tokens for p in chunk)
+            chunk.append(piece)
+            tokens += piece.tokens
+        if chunk:
+            yield chunk[0].start, chunk[-1].end
+
+    def overlap(
+        self, doc: bytes, chunk: list[Piece], next_tokens: int
+    ) -> list[Piece]:
+        """
+        Last pieces of `chunk` that fit in `overlap_tokens` and leave room
+        for the next piece: whole paragraphs, or the last sentences of one.
+        """
+        budget = min(self.overlap_tokens, self.chunk_tokens - next_tokens)
+        kept, tokens = [], 0
+        for piece in reversed(chunk):
+            if piece.heading:
+                break
+            if tokens + piece.tokens <= budget:
+                kept.append(piece)
+                tokens += piece.tokens
+                continue
+            count = token_counter(self.encoding)
+            sentences = SENTENCE_RE.finditer(doc, piece.start, piece.end)
+            for sentence in reversed(list(sentences)):
+                start, end = strip(doc, *sentence.span())
+                sentence_tokens = count(doc[start:end])
+                if start == end or tokens + sentence_tokens > budget:
+                    break
+                kept.append(Piece(start, end, sentence_tokens, heading=False))
+                tokens += sentence_tokens
+            break
+        return kept[::-1]
+
+
+Splitter = Callable[[bytes], Iterator[tuple[int, int]]]
+
+
+@functools.cache
+def make_splitter(spec: str = "") -> Splitter:
+    """
+    `span[:chunk_size[:chunk_overlap]]` (the default, without `spec`) or
+    `structured[:chunk_tokens[:overlap_tokens]]`. Cached per process.
+    """
+    kind, _, params = spec.partition(":")
+    values = [int(value) for value in params.split(":") if value]
+    if kind in ("", "span"):
+        return lambda doc: span_splitter(doc, *values)
+    if kind == "structured":
+        return StructuredSplitter(*values)
+    raise ValueError(f"Unknown splitter: {kind!r}")
+
+
+def splitter_from_env() -> str:
+    """
+    `SPLITTER`, the spec of `make_splitter`. Validated here: the ingestion
+    processes would only fail on the first page.
+    """
+    spec = os.getenv("SPLITTER", "")
+    make_splitter(spec)
+    return spec
@@ -0,0 +1,140 @@
+"""
+One index per tenant: each customer has its own collection, its own store
+of texts (`retrieval/chunks.py`) and its own cache of answers, so nothing
+retrieved or cached for one tenant reaches another.
+
+```python
+tenants = Tenants(db, EmbeddingFunction(embedder), "./ragtenants")
+tenant = tenants.get("acme")  # Opened on first use, then kept warm
+result = tenant.collection.query(query_embeddings=[vector], n_results=5)
+```
+
+The client (`db`) is opened once and shared. The collection of a tenant is
+opened lazily on its first request and kept open, least recently used
+first: when the estimated memory of the open indexes exceeds
+`memory_budget`, the coldest ones are closed (the one in use never is). A
+hot tenant always finds its index open; a cold one pays for opening it
+again, and starts with an empty cache of answers (it's closed with the
+index).
+
+The memory of an index is estimated from its number of vectors
+(`item_bytes` each, by default `float32` vectors of 1536 dimensions).
+The maps of an evicted `QuantizedCollection` are released once the
+requests still using it end. `chromadb` keeps the indexes it loads in its
+own cache: give the client the same budget with `chroma_settings` so it
+evicts them too.
+"""
+
+import os
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any
+
+from .answers import AnswerCache
+from .chunks import SourceStore
+
+# Up to 48 characters, starting and ending with a letter or digit:
+# `rag-{name}` must be a valid name of a `chromadb` collection
+TENANT_RE = re.compile(r"[A-Za-z0-9](?:[A-Za-z0-9_\-]{0,46}[A-Za-z0-9])?")
+
+
+@dataclass
+class Tenant:
+    name: str
+    collection: Any
+    sources: SourceStore
+    answers: AnswerCache = field(default_factory=AnswerCache)
+    size: int = 0  # Estimated bytes of the index in memory
+
+
+def chroma_settings(memory_budget: int | None) -> dict[str, Any]:
+    """
+    Settings of `chromadb.PersistentClient` to evict loaded indexes with the
+    same budget.
+    """
+    if not memory_budget:
+        return {}
+    return {
+        "chroma_segment_cache_policy": "LRU",
+        "chroma_memory_limit_bytes": memory_budget,
+    }
+
+
+class Tenants:
+    def __init__(
+        self,
+        db,
+        embedding_function,
+        path: str = "./ragtenants",
+        memory_budget: int | None = None,
+        item_bytes: int = 4 * 1536,
+    ):
+        self.db = db
+        self.embedding_function = embedding_function
+        self.path = path
+        self.memory_budget = memory_budget
+        self.item_bytes = item_bytes
+
+        # Open tenants, from least to most recently used
+        self.open: OrderedDict[str, Tenant] = OrderedDict()
+        self.hits = 0
+        self.loads = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def budget_from_env() -> int | None:
+        megabytes = os.getenv("RAG_TENANT_MEMORY_MB")
+        return int(float(megabytes) * 2**20) if megabytes else None
+
+    def get(self, name: str) -> Tenant:
+        if not TENANT_RE.fullmatch(name):
+            raise ValueError(f"Invalid tenant: {name!r}")
+        with self._lock:
+            if (tenant := self.open.get(name)) is not None:
+                self.open.move_to_end(name)
+                self.hits += 1
+                return tenant
+
+            collection = self.db.get_or_create_collection(
+                f"rag-{name}", embedding_function=self.embedding_function
+            )
+            sources = SourceStore(os.path.join(self.path, name))
+            tenant = Tenant(name, collection, sources)
+            tenant.size = collection.count() * self.item_bytes
+            self.open[name] = tenant
+            self.loads += 1
+            self.evict()
+            return tenant
+
+    def resize(self, name: str):
+        """
+        Estimates again the memory of a tenant after adding documents.
+        """
+        with self._lock:
+            if (tenant := self.open.get(name)) is not None:
+                tenant.size = tenant.collection.count() * self.item_bytes
+                self.evict()
+
+    def evict(self):
+        if self.memory_budget is None:
+            return
+        while len(self.open) > 1 and self.memory() > self.memory_budget:
+            self.open.popitem(last=False)
+            self.evictions += 1
+
+    def memory(self) -> int:
+        return sum(tenant.size for tenant in self.open.values())
+
+    def metrics(self) -> dict[str, Any]:
+        with self._lock:
+            requests = max(1, self.hits + self.loads)
+            return {
+                "open": len(self.open),
+                "memory_bytes": self.memory(),
+                "hit_rate": self.hits / requests,
+                "loads": self.loads,
+                "evictions": self.evictions,
+            }
@@ -4,26 +4,74 @@ v5: Validation of the `technologies` field.
 Now we'll use an LLM to validate the `technologies` field with criteria
 that require processing natural language and reasoning about the content (see
 `validate_techs`).
+
+Calls to the API are retried on transient errors (see `gateway.retry`), so
+a 429 or a stuck connection is not a fatal error of the extraction.
+
+With `TRACES` each extraction, attempt, validator and call to the LLM is a
+span (see `observability.tracing`). The tokens are accounted per stage
+(`extract`, `fix` and `validate`) and limited by the budgets of
+`gateway.accounting`.
+
+`extract_batch` is an offline mode for many documents with the Batch API
+(see `gateway.batch`): each attempt is one batch with the pending documents
+instead of a round trip per document.
+
+The prompts are templates precompiled once (see `gateway.templates`): the
+fields of a model are formatted once, not on every call.
+
+`python -m solved.extractor.v5 --job` runs a resumable job over many
+documents, with their state in a journal (see `jobs.journal`).
 """
 
 import json
+import os
 import re
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
 from dataclasses import dataclass
+from functools import cached_property, partial
 from pprint import pprint
 from typing import Callable
 
 from dotenv import load_dotenv
-from openai import OpenAI
-from requests import get
+from openai import APIError
+
+from gateway.accounting import BATCH_DISCOUNT, BudgetExceeded, default_ledger
+from gateway.batch import BatchError, LocalBatches, OpenAIBatches, run_batch
+from gateway.http import http, openai_client
+from gateway.ratelimit import RateLimiter
+from gateway.retry import Retry
+from gateway.router import Router
+from gateway.templates import Template
+from jobs.journal import Journal, run_job
+from observability.tracing import span, traced
 
 load_dotenv()
-client = OpenAI()
+client = openai_client()  # Shared connection pool, retries by `retry`
+# Shared quota of all the threads (and processes, see `.env.example`)
+limiter = RateLimiter.from_env()
+# Backends from `LLM_BACKENDS`, the rest of models go to `client`
+router = Router.from_env(client, limiter)
+# Hedging cuts the tail latency of batch runs caused by a few stuck calls
+retry = Retry(hedge=True)
+# Tokens and cost per stage, budgets of `.env.example` (one per process)
+ledger = default_ledger()
 
 
 def llm(prompt: str, model: str = "gpt-4o-mini") -> str:
-    response = client.chat.completions.create(
-        model=model, messages=[{"role": "user", "content": prompt}]
-    )
+    # A cheaper model (or `BudgetExceeded`) once the budget is spent
+    model = ledger.model(model)
+    with span("llm", model=model) as s:
+        response = retry(
+            router.create,
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+        )
+        s.set_usage(response.usage)
+    ledger.record(model, response.usage)
     return response.choices[0].message.content
 
 
@@ -48,13 +96,17 @@ class Field:
 class Model:
     fields: list[Field]
 
+    @cached_property
+    def schema(self) -> str:
+        # Formatted once per model: the fields don't change after creating it
+        return f"{self.fields}"
 
-def extract_fields_prompt(model: Model, doc: str) -> dict[str, any]:
-    """
-    Generates a prompt (perhaps excessively ironic) to extract fields from
-    a document.
-    """
-    return f"""You are an expert information extractor. As a child, you dreamed of
+    @cached_property
+    def extract_template(self) -> Template:
+        return EXTRACT_FIELDS.partial(fields=self.schema)
+
+
+EXTRACT_FIELDS = Template("""You are an expert information extractor. As a child, you dreamed of
 this job. Now you can make it a reality. The future of humanity depends on it.
 Plus, if you do it well, you'll get a tip of 100k€.
 
@@ -65,19 +117,21 @@ Plus, if you do it well, you'll get a tip of 100k€.
 
 # Fields
 
-Fields to extract: {model.fields}.
+Fields to extract: {fields}.
 
 Use a "```json" block to return the fields.
-"""
+""")
 
 
-def fix_fields_prompt(
-    model: Model,
-    doc: str,
-    parsed: dict[str, any],
-    validation_errors: list[tuple[str, Exception]],
-) -> str:
-    return f"""You are an expert information extractor. You need to correct the
+def extract_fields_prompt(model: Model, doc: str) -> dict[str, any]:
+    """
+    Generates a prompt (perhaps excessively ironic) to extract fields from
+    a document. The template of each model is precompiled with its fields.
+    """
+    return model.extract_template.render(doc=doc)
+
+
+FIX_FIELDS = Template("""You are an expert information extractor. You need to correct the
 extraction errors that occurred in the following document:
 
 # Document
@@ -90,12 +144,22 @@ extraction errors that occurred in the following document:
 
 # Extraction errors
 
-{'\n'.join(f"- {field}: {e}" for field, e in validation_errors)}
+{errors}
 
 # Corrected extraction
 
 ```json
-"""
+""")
+
+
+def fix_fields_prompt(
+    model: Model,
+    doc: str,
+    parsed: dict[str, any],
+    validation_errors: list[tuple[str, Exception]],
+) -> str:
+    errors = "\n".join(f"- {field}: {e}" for field, e in validation_errors)
+    return FIX_FIELDS.render(doc=doc, parsed=str(parsed), errors=errors)
 
 
 JSON_BLOCK_RE = re.compile(r"```json\s*([\s\S]*)\s*```")
@@ -122,33 +186,201 @@ def validate_output(
     We parse and validate the LLM output.
 
     Returns a tuple with the parsed dictionary and a list of validation
-    errors if any.
+    errors if any. `BudgetExceeded` and the errors of the API in validators
+    that call the LLM aren't errors of the fields: they propagate.
     """
     parsed = parse_json_block(output)
     validation_errors = []
 
     for field in model.fields:
         try:
-            field.validator(parsed[field.name])
+            with span("validate", field=field.name), ledger.stage("validate"):
+                field.validator(parsed[field.name])
+        except (BudgetExceeded, APIError):
+            raise
         except Exception as e:
+            # Also a `null` or a value of another type (`TypeError`)
             validation_errors.append((field.name, e.args[0]))
 
     return parsed, validation_errors
 
 
 def extractor(model: Model, doc: str, max_retries: int = 3) -> dict[str, any] | None:
-    parsed, validation_errors = None, []
-    for _ in range(max_retries):
-        if validation_errors:
-            prompt = fix_fields_prompt(model, doc, parsed, validation_errors)
-        else:
-            prompt = extract_fields_prompt(model, doc)
+    parsed, validation_errors = extract_with_errors(model, doc, max_retries)
+    return None if validation_errors else parsed
 
-        output = llm(prompt)
-        parsed, validation_errors = validate_output(output, model)
+
+@traced("extractor")
+@ledger.request("extractor")
+def extract_with_errors(
+    model: Model, doc: str, max_retries: int = 3
+) -> tuple[dict[str, any] | None, list[tuple[str, Exception]]]:
+    """
+    Like `extractor`, but also returns the validation errors of the last
+    attempt (empty if the extraction is valid).
+    """
+    parsed, validation_errors = None, []
+    for attempt in range(max_retries):
+        stage = "fix" if validation_errors else "extract"
+        with span("extraction", attempt=attempt + 1) as s, ledger.stage(stage):
+            if validation_errors:
+                prompt = fix_fields_prompt(model, doc, parsed, validation_errors)
+            else:
+                prompt = extract_fields_prompt(model, doc)
+
+            output = llm(prompt)
+            parsed, validation_errors = validate_output(output, model)
+            s.set(errors=len(validation_errors))
         if not validation_errors:
-            return parsed
-    return None
+            break
+    return parsed, validation_errors
+
+
+def extract_many(
+    model: Model, docs: list[str], workers: int = 16
+) -> list[tuple[dict[str, any] | None, list[tuple[str, Exception]]]]:
+    """
+    `extract_with_errors` of each document in a pool of threads, for
+    `jobs.journal.run_job`. An error of one document (a parse error,
+    `BudgetExceeded`...) fails that document, not the whole chunk.
+    """
+
+    def extract(doc: str):
+        try:
+            return extract_with_errors(model, doc)
+        except Exception as e:
+            return None, [("extraction", f"{type(e).__name__}: {e}")]
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(lambda doc: copy_context().run(extract, doc), docs))
+
+
+def checked_output(
+    output: str, model: Model
+) -> tuple[dict[str, any] | None, list[tuple[str, Exception]]]:
+    """
+    Like `validate_output`, but an output without JSON is one more error to
+    fix instead of stopping the whole batch.
+    """
+    try:
+        return validate_output(output, model)
+    except ValueError as e:
+        return None, [("output", e.args[0])]
+
+
+@traced()
+def extract_batch(
+    model: Model,
+    docs: list[str],
+    batches: OpenAIBatches | LocalBatches,
+    max_retries: int = 3,
+    workdir: str | None = None,
+    workers: int = 16,
+) -> list[dict[str, any] | None]:
+    """
+    `extractor` for many documents with the Batch API (see
+    `extract_batch_with_errors`). Returns the extraction of each document
+    (`None` if it never validated).
+    """
+    extractions = extract_batch_with_errors(
+        model, docs, batches, max_retries, workdir, workers
+    )
+    return [None if errors else parsed for parsed, errors in extractions]
+
+
+def extract_batch_with_errors(
+    model: Model,
+    docs: list[str],
+    batches: OpenAIBatches | LocalBatches,
+    max_retries: int = 3,
+    workdir: str | None = None,
+    workers: int = 16,
+) -> list[tuple[dict[str, any] | None, list[tuple[str, Exception]]]]:
+    """
+    The first batch has the extraction prompts of every document; the
+    outputs are validated together (`workers` at a time) and the next batch
+    only has the repair prompts (`fix_fields_prompt`) of the documents that
+    failed. Requests that failed in the batch are sent again. Large jobs are
+    split into several batches (see `gateway.batch.run_batch`).
+
+    The validation isn't batched: the validators that call the LLM
+    (`validate_techs`) do it online, at the full price, in every round.
+
+    The request budget of `gateway.accounting` applies to each document: a
+    document that spends it (or whose validation fails with an error of the
+    API) stops with that error and the rest go on. Once the job budget is
+    spent, no more batches are sent.
+
+    Returns the extraction of each document and the errors of its last
+    attempt, like `extract_with_errors`.
+    """
+    workdir = workdir or tempfile.mkdtemp(prefix="extractor-")
+    results = [None] * len(docs)
+    # Document -> previous extraction and its errors
+    pending = {i: (None, []) for i in range(len(docs))}
+    budgets = {i: ledger.new_request("extractor") for i in range(len(docs))}
+
+    def stop(i: int, e: Exception):
+        parsed, errors = pending.pop(i)
+        results[i] = (parsed, [*errors, ("extraction", f"{type(e).__name__}: {e}")])
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for attempt in range(max_retries):
+            requests = {}
+            for i, (parsed, errors) in list(pending.items()):
+                try:
+                    with ledger.request("extractor", resume=budgets[i]):
+                        llm_model = ledger.model("gpt-4o-mini")
+                except BudgetExceeded as e:
+                    stop(i, e)
+                    continue
+                if errors:
+                    prompt = fix_fields_prompt(model, docs[i], parsed, errors)
+                else:
+                    prompt = extract_fields_prompt(model, docs[i])
+                requests[str(i)] = {
+                    "model": llm_model,
+                    "messages": [{"role": "user", "content": prompt}],
+                }
+            if not requests:
+                break
+
+            path = os.path.join(workdir, f"attempt-{attempt + 1}.jsonl")
+            with span("batch", attempt=attempt + 1, requests=len(requests)) as s:
+                outputs = run_batch(batches, requests, path)
+
+                checks = {}
+                for custom_id, response in outputs.items():
+                    i = int(custom_id)
+                    if isinstance(response, BatchError):
+                        continue  # Same prompt in the next batch
+                    stage = "fix" if pending[i][1] else "extract"
+                    model_name = requests[custom_id]["model"]
+                    with ledger.request("extractor", resume=budgets[i]):
+                        with ledger.stage(stage):
+                            ledger.record(model_name, response.usage, BATCH_DISCOUNT)
+                        output = response.choices[0].message.content
+                        checks[i] = executor.submit(
+                            copy_context().run, checked_output, output, model
+                        )
+
+                for i, check in checks.items():
+                    try:
+                        parsed, validation_errors = check.result()
+                    except Exception as e:  # `BudgetExceeded` or a failed call
+                        stop(i, e)
+                        continue
+                    if validation_errors:
+                        pending[i] = (parsed, validation_errors)
+                    else:
+                        results[i] = (parsed, [])
+                        del pending[i]
+                s.set(failed=len(requests) - len(checks), pending=len(pending))
+
+    # Still invalid (or failed in the batch) after the last attempt
+    for i, (parsed, errors) in pending.items():
+        results[i] = (parsed, errors or [("batch", "Failed in every batch")])
+    return results
 
 
 def validate_links(links: list[dict[str, str]]) -> None:
@@ -208,5 +440,34 @@ talk = Model(
 )
 
 if __name__ == "__main__":
-    doc = get("https://pretalx.com/pycones-2024/talk/SKZFHY.ics").text
+    if sys.argv[1:2] == ["--batch"]:
+        # python -m solved.extractor.v5 --batch [--local] URL [URL ...]
+        urls = sys.argv[2:]
+        if urls[:1] == ["--local"]:
+            # Stand-in for the Batch API with the usual calls
+            batches = LocalBatches(partial(retry, router.create))
+            urls = urls[1:]
+        else:
+            batches = OpenAIBatches(client)
+        docs = [http().get(url).text for url in urls]
+        extractions = extract_batch_with_errors(talk, docs, batches)
+        for url, (extraction, errors) in zip(urls, extractions):
+            print(url)
+            pprint(errors if errors else extraction)
+        sys.exit()
+
+    if sys.argv[1:2] == ["--job"]:
+        # python -m solved.extractor.v5 --job JOURNAL OUTPUT URLS_FILE
+        # Run it again with the same arguments to resume
+        journal_path, output, urls_file = sys.argv[2:5]
+        with open(urls_file) as f:
+            urls = [line.strip() for line in f if line.strip()]
+        docs = ((url, http().get(url).text) for url in urls)
+        journal = Journal(journal_path)
+        print(run_job(journal, docs, partial(extract_many, talk), output))
+        for url, errors in journal.failures():
+            print(f"{url}: {errors}")
+        sys.exit()
+
+    doc = http().get("https://pretalx.com/pycones-2024/talk/SKZFHY.ics").text
     pprint(extractor(talk, doc))
@@ -0,0 +1,262 @@
+"""
+v6: async.
+
+Changes:
+
+- `extractor` is a coroutine. `extract_all` extracts many documents
+  concurrently from one process, with `concurrency` requests in flight.
+- Validators can be sync or async. They run concurrently, so the LLM
+  validation of `technologies` doesn't wait for the rest.
+- The calls to the API use `AsyncOpenAI` over the connection pool of
+  `gateway.http`.
+"""
+
+import asyncio
+import inspect
+import json
+import re
+from dataclasses import dataclass
+from pprint import pprint
+from typing import Any, Callable
+
+from dotenv import load_dotenv
+from openai import APIError, AsyncOpenAI
+
+from gateway.http import async_http, async_openai
+from gateway.ratelimit import RateLimiter
+from gateway.retry import Retry
+from gateway.router import Router
+
+load_dotenv()
+client = async_openai()
+# Shared quota of all the requests (and processes, see `.env.example`)
+limiter = RateLimiter.from_env()
+# Backends from `LLM_BACKENDS`, the rest of models go to `client`
+router = Router.from_env(client, limiter, client_class=AsyncOpenAI)
+# Hedging cuts the tail latency of batch runs caused by a few stuck calls
+retry = Retry(hedge=True)
+
+
+async def llm(prompt: str, model: str = "gpt-4o-mini") -> str:
+    response = await retry.call_async(
+        router.create_async,
+        model=model,
+        messages=[{"role": "user", "content": prompt}],
+    )
+    return response.choices[0].message.content
+
+
+@dataclass
+class Field:
+    """
+    A field to extract from a document.
+
+    `validator` is a function (or coroutine function) that validates the
+    field and raises an exception if it's not valid.
+    """
+
+    name: str
+    description: str
+    validator: Callable[[any], Any] = lambda _: None
+
+    def __str__(self) -> str:
+        return f"'{self.name}': '{self.description}'"
+
+
+@dataclass
+class Model:
+    fields: list[Field]
+
+
+def extract_fields_prompt(model: Model, doc: str) -> dict[str, any]:
+    """
+    Generates a prompt (perhaps excessively ironic) to extract fields from
+    a document.
+    """
+    return f"""You are an expert information extractor. As a child, you dreamed of
+this job. Now you can make it a reality. The future of humanity depends on it.
+Plus, if you do it well, you'll get a tip of 100k€.
+
+# Document
+
+{doc}
+
+
+# Fields
+
+Fields to extract: {model.fields}.
+
+Use a "```json" block to return the fields.
+"""
+
+
+def fix_fields_prompt(
+    model: Model,
+    doc: str,
+    parsed: dict[str, any],
+    validation_errors: list[tuple[str, Exception]],
+) -> str:
+    return f"""You are an expert information extractor. You need to correct the
+extraction errors that occurred in the following document:
+
+# Document
+
+{doc}
+
+# Previous extraction
+
+{parsed}
+
+# Extraction errors
+
+{'\n'.join(f"- {field}: {e}" for field, e in validation_errors)}
+
+# Corrected extraction
+
+```json
+"""
+
+
+JSON_BLOCK_RE = re.compile(r"```json\s*([\s\S]*)\s*```")
+
+
+def parse_json_block(output: str) -> dict[str, any]:
+    """
+    We process the LLM output by looking for a JSON markdown block.
+    """
+    match = JSON_BLOCK_RE.search(output)
+    if not match:
+        raise ValueError("No JSON block found")
+    return json.loads(match.group(1))
+
+
+async def validate_field(field: Field, parsed: dict[str, any]) -> tuple | None:
+    """
+    Returns `(name, error)` if the field is not valid (also a `null` or a
+    value of another type). The errors of the API in validators that call
+    the LLM aren't errors of the field: they propagate.
+    """
+    try:
+        result = field.validator(parsed[field.name])
+        if inspect.isawaitable(result):
+            await result
+    except APIError:
+        raise
+    except Exception as e:
+        return field.name, e.args[0]
+    return None
+
+
+async def validate_output(
+    output: str, model: Model
+) -> tuple[dict[str, any], list[tuple[str, Exception]]]:
+    """
+    We parse and validate the LLM output.
+
+    Returns a tuple with the parsed dictionary and a list of validation
+    errors if any.
+    """
+    parsed = parse_json_block(output)
+    results = await asyncio.gather(
+        *(validate_field(field, parsed) for field in model.fields)
+    )
+    return parsed, [error for error in results if error is not None]
+
+
+async def extractor(
+    model: Model, doc: str, max_retries: int = 3
+) -> dict[str, any] | None:
+    parsed, validation_errors = None, []
+    for _ in range(max_retries):
+        if validation_errors:
+            prompt = fix_fields_prompt(model, doc, parsed, validation_errors)
+        else:
+            prompt = extract_fields_prompt(model, doc)
+
+        output = await llm(prompt)
+        parsed, validation_errors = await validate_output(output, model)
+        if not validation_errors:
+            return parsed
+    return None
+
+
+async def extract_all(
+    model: Model, docs: list[str], concurrency: int = 100, max_retries: int = 3
+) -> list[dict[str, any] | None]:
+    """
+    Extracts `docs` (in the same order) with at most `concurrency`
+    extractions at the same time.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def extract(doc: str) -> dict[str, any] | None:
+        async with semaphore:
+            return await extractor(model, doc, max_retries)
+
+    return await asyncio.gather(*(extract(doc) for doc in docs))
+
+
+def validate_links(links: list[dict[str, str]]) -> None:
+    for link in links:
+        if not isinstance(link, dict):
+            raise ValueError(
+                "Links must be a dictionary with the following structure: {{'url': str, 'description': str}}"
+            )
+        if not link.get("url"):
+            raise ValueError(f"No link (`url`) provided in {link}")
+        if not link.get("description"):
+            raise ValueError(f"No description (`description`) provided in {link}")
+
+
+async def validate_techs(techs: list[str]) -> None:
+    output = parse_json_block(
+        await llm(f"""From the following list of tags: {techs} verify that the following conditions are met:
+- Acronyms are described in parentheses, for example: `IPv6 (Internet Protocol Version 6)`
+- They are written in English
+
+Show the errors in a list formatted as a JSON array with the following format:
+
+```json
+[
+    "Not in English: Programación en Python, ...",
+    ...
+]
+```
+
+If there are no errors, return an empty list.
+
+# Errors
+
+```json
+[""")
+    )
+
+    if output:
+        raise ValueError(output)
+
+
+talk = Model(
+    fields=[
+        Field(name="title", description="The title of the talk"),
+        Field(name="speaker", description="The name of the speaker"),
+        Field(
+            name="links",
+            description="The links mentioned in the talk",
+            validator=validate_links,
+        ),
+        Field(
+            name="technologies",
+            description="The technologies mentioned in the talk",
+            validator=validate_techs,
+        ),
+    ]
+)
+
+
+async def main():
+    response = await async_http().get("https://pretalx.com/pycones-2024/talk/SKZFHY.ics")
+    pprint(await extractor(talk, response.text))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,175 @@
+"""
+v3: async.
+
+Changes:
+
+- `chatbot` is a coroutine, so a web server can answer hundreds of questions
+  at once from one process instead of using one thread per request.
+- The calls to the API use `AsyncOpenAI` and the scraping uses `httpx`, both
+  over the connection pool of `gateway.http`.
+- We compute the embeddings with the async client and pass the vectors to
+  chroma. Chroma is synchronous, so its calls run in a thread
+  (`asyncio.to_thread`) and don't block the event loop.
+- The collection is opened (and filled if it's empty) once, not in each
+  question.
+"""
+
+import asyncio
+import re
+import sys
+from uuid import uuid4
+
+import bs4
+import chromadb
+from dotenv import load_dotenv
+from openai import AsyncOpenAI
+
+from gateway.http import async_http, async_openai
+from gateway.ratelimit import RateLimiter
+from gateway.retry import Retry
+from gateway.router import Router
+
+load_dotenv()
+
+client = async_openai()
+# Shared quota of all the requests (and processes, see `.env.example`)
+limiter = RateLimiter.from_env()
+# Backends from `LLM_BACKENDS`, the rest of models go to `client`
+router = Router.from_env(client, limiter, client_class=AsyncOpenAI)
+retry = Retry()
+db = chromadb.PersistentClient(path="./ragdatabase")
+
+EMBEDDING_MODEL = "text-embedding-ada-002"
+URLS = ["https://lilianweng.github.io/posts/2023-06-23-agent/"]
+
+
+async def llm(prompt: str, model: str = "gpt-4o-mini") -> str:
+    response = await retry.call_async(
+        router.create_async,
+        model=model,
+        messages=[{"role": "user", "content": prompt}],
+    )
+    return response.choices[0].message.content
+
+
+async def embed(texts: list[str]) -> list[list[float]]:
+    response = await retry.call_async(
+        limiter.call_async,
+        client.embeddings.create,
+        model=EMBEDDING_MODEL,
+        input=texts,
+    )
+    return [item.embedding for item in response.data]
+
+
+def prompt(docs: list[str], question: str) -> str:
+    return f"""HUMAN
+
+You are an assistant for question-answering tasks. Use the following pieces of retrieved context to answer the question. If you don't know the answer, just say that you don't know. Use three sentences maximum and keep the answer concise.
+
+Question: {question}
+
+Context: {'\n\n'.join(docs)}
+
+Answer:"""
+
+
+def parse_post(html: str) -> str:
+    soup = bs4.BeautifulSoup(html, "html.parser")
+    elements = [soup.find(class_="post-title"), soup.find(class_="post-content")]
+    return " ".join([element.get_text() for element in elements])
+
+
+async def scrape_web(url: str) -> str:
+    response = await async_http().get(url)
+    # Parsing is CPU work, we don't want to stop the rest of requests
+    return await asyncio.to_thread(parse_post, response.text)
+
+
+def text_splitter(doc: str, chunk_size: int = 1000, chunk_overlap: int = 200):
+    """
+    Same splitter as in v2.
+    """
+    splits = re.split(r"[\s\.,;:]+", doc)
+
+    prev_chunk = ""
+    chunk = ""
+    for subchunk in splits:
+        length = len(chunk) + len(subchunk)
+        if length > chunk_size:
+            yield prev_chunk[-chunk_overlap:] + chunk
+            prev_chunk = chunk
+            chunk = ""
+        else:
+            chunk += " " + subchunk
+    if chunk:
+        yield chunk
+
+
+async def fill_db(urls: list[str], batch_size: int = 64):
+    """
+    Opens the collection and, if it's empty, scrapes `urls` and indexes
+    them. Pages and batches of embeddings are fetched concurrently.
+    """
+    # We pass our own embeddings, so chroma doesn't need an embedding function
+    collection = await asyncio.to_thread(
+        db.get_or_create_collection, "rag", embedding_function=None
+    )
+    if await asyncio.to_thread(collection.count) > 0:
+        return collection
+
+    docs = await asyncio.gather(*(scrape_web(url) for url in urls))
+    chunks = [chunk for doc in docs for chunk in text_splitter(doc)]
+    batches = [chunks[i : i + batch_size] for i in range(0, len(chunks), batch_size)]
+
+    embeddings = await asyncio.gather(*(embed(batch) for batch in batches))
+    for batch, vectors in zip(batches, embeddings):
+        await asyncio.to_thread(
+            collection.add,
+            ids=[uuid4().hex for _ in batch],
+            documents=batch,
+            embeddings=vectors,
+        )
+    return collection
+
+
+_collection = None
+_collection_lock = asyncio.Lock()
+
+
+async def get_collection():
+    """
+    The first question fills the database, the rest wait for it.
+    """
+    global _collection
+    async with _collection_lock:
+        if _collection is None:
+            _collection = await fill_db(URLS)
+    return _collection
+
+
+async def retrieve(question: str, n_results: int = 5) -> list[str]:
+    collection = await get_collection()
+    [vector] = await embed([question])
+    result = await asyncio.to_thread(
+        collection.query, query_embeddings=[vector], n_results=n_results
+    )
+    return result["documents"][0]
+
+
+async def chatbot(question: str):
+    """
+    Central function of our chatbot. Equivalent to the LangChain pipeline.
+    """
+    context = await retrieve(question)
+    return await llm(prompt(context, question))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        question = sys.argv[1]
+    else:
+        question = "What is Task Decomposition?"
+
+    print(f"Human: {question}")
+    print(f"Chatbot: {asyncio.run(chatbot(question))}")
@@ -0,0 +1,295 @@
+"""
+v4: lazy startup and daemon mode.
+
+Changes:
+
+- The heavy dependencies (`chromadb`, `openai`, `bs4`...) are imported and
+  the clients created on first use, after parsing the arguments. `--help` or
+  asking a running daemon doesn't pay for them.
+- `--serve` starts a daemon that keeps the database and the clients warm and
+  answers questions over a Unix socket. Without `--serve` the question goes
+  to the daemon if it's running and is answered in-process otherwise. The
+  socket is only accessible to its user (mode `0600`, in `$XDG_RUNTIME_DIR`
+  or a private directory of the temporary directory).
+
+```bash
+python -m solved.rag.v4 --serve &
+python -m solved.rag.v4 "What is Task Decomposition?"
+```
+
+The start times are measured by `python -m benchmarks.startup`.
+
+This version is the async v3 with a lazy startup. The features of
+`solved/rag/v5.py` aren't here: embedding backends, quantized index,
+re-ranking, answer cache, parallel ingestion into an offset store, tenants,
+structured splitting and templates. Use v5 for them; v4 only shows the lazy
+startup and the daemon.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import socket
+from dataclasses import dataclass
+from functools import cache
+from typing import Any
+from uuid import uuid4
+
+EMBEDDING_MODEL = "text-embedding-ada-002"
+URLS = ["https://lilianweng.github.io/posts/2023-06-23-agent/"]
+
+
+@dataclass
+class Clients:
+    client: Any
+    limiter: Any
+    router: Any
+    retry: Any
+    db: Any
+    http: Any
+
+    @classmethod
+    def create(cls) -> "Clients":
+        import chromadb
+        from dotenv import load_dotenv
+        from openai import AsyncOpenAI
+
+        from gateway.http import async_http, async_openai
+        from gateway.ratelimit import RateLimiter
+        from gateway.retry import Retry
+        from gateway.router import Router
+
+        load_dotenv()
+        client = async_openai()
+        # Shared quota of all the requests (and processes, see `.env.example`)
+        limiter = RateLimiter.from_env()
+        return cls(
+            client=client,
+            limiter=limiter,
+            # Backends from `LLM_BACKENDS`, the rest of models go to `client`
+            router=Router.from_env(client, limiter, client_class=AsyncOpenAI),
+            retry=Retry(),
+            db=chromadb.PersistentClient(path="./ragdatabase"),
+            http=async_http(),
+        )
+
+
+@cache
+def clients() -> Clients:
+    """
+    Created on the first call: the imports are most of the start time.
+    """
+    return Clients.create()
+
+
+async def llm(prompt: str, model: str = "gpt-4o-mini") -> str:
+    response = await clients().retry.call_async(
+        clients().router.create_async,
+        model=model,
+        messages=[{"role": "user", "content": prompt}],
+    )
+    return response.choices[0].message.content
+
+
+async def embed(texts: list[str]) -> list[list[float]]:
+    response = await clients().retry.call_async(
+        clients().limiter.call_async,
+        clients().client.embeddings.create,
+        model=EMBEDDING_MODEL,
+        input=texts,
+    )
+    return [item.embedding for item in response.data]
+
+
+def prompt(docs: list[str], question: str) -> str:
+    return f"""HUMAN
+
+You are an assistant for question-answering tasks. Use the following pieces of retrieved context to answer the question. If you don't know the answer, just say that you don't know. Use three sentences maximum and keep the answer concise.
+
+Question: {question}
+
+Context: {'\n\n'.join(docs)}
+
+Answer:"""
+
+
+def parse_post(html: str) -> str:
+    import bs4
+
+    soup = bs4.BeautifulSoup(html, "html.parser")
+    elements = [soup.find(class_="post-title"), soup.find(class_="post-content")]
+    return " ".join([element.get_text() for element in elements])
+
+
+async def scrape_web(url: str) -> str:
+    response = await clients().http.get(url)
+    # Parsing is CPU work, we don't want to stop the rest of requests
+    return await asyncio.to_thread(parse_post, response.text)
+
+
+def text_splitter(doc: str, chunk_size: int = 1000, chunk_overlap: int = 200):
+    """
+    Same splitter as in v2.
+    """
+    splits = re.split(r"[\s\.,;:]+", doc)
+
+    prev_chunk = ""
+    chunk = ""
+    for subchunk in splits:
+        length = len(chunk) + len(subchunk)
+        if length > chunk_size:
+            yield prev_chunk[-chunk_overlap:] + chunk
+            prev_chunk = chunk
+            chunk = ""
+        else:
+            chunk += " " + subchunk
+    if chunk:
+        yield chunk
+
+
+async def fill_db(urls: list[str], batch_size: int = 64):
+    """
+    Same as in v3.
+    """
+    collection = await asyncio.to_thread(
+        clients().db.get_or_create_collection, "rag", embedding_function=None
+    )
+    if await asyncio.to_thread(collection.count) > 0:
+        return collection
+
+    docs = await asyncio.gather(*(scrape_web(url) for url in urls))
+    chunks = [chunk for doc in docs for chunk in text_splitter(doc)]
+    batches = [chunks[i : i + batch_size] for i in range(0, len(chunks), batch_size)]
+
+    embeddings = await asyncio.gather(*(embed(batch) for batch in batches))
+    for batch, vectors in zip(batches, embeddings):
+        await asyncio.to_thread(
+            collection.add,
+            ids=[uuid4().hex for _ in batch],
+            documents=batch,
+            embeddings=vectors,
+        )
+    return collection
+
+
+_collection = None
+_collection_lock = asyncio.Lock()
+
+
+async def get_collection():
+    global _collection
+    async with _collection_lock:
+        if _collection is None:
+            _collection = await fill_db(URLS)
+    return _collection
+
+
+async def retrieve(question: str, n_results: int = 5) -> list[str]:
+    collection = await get_collection()
+    [vector] = await embed([question])
+    result = await asyncio.to_thread(
+        collection.query, query_embeddings=[vector], n_results=n_results
+    )
+    return result["documents"][0]
+
+
+async def chatbot(question: str):
+    """
+    Central function of our chatbot. Equivalent to the LangChain pipeline.
+    """
+    context = await retrieve(question)
+    return await llm(prompt(context, question))
+
+
+async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    """
+    One JSON line per question (`{"question": ...}`) and one per answer
+    (`{"answer": ...}` or `{"error": ...}`).
+    """
+    try:
+        while line := await reader.readline():
+            try:
+                response = {"answer": await chatbot(json.loads(line)["question"])}
+            except Exception as e:
+                response = {"error": f"{type(e).__name__}: {e}"}
+            writer.write(json.dumps(response).encode() + b"\n")
+            await writer.drain()
+    finally:
+        writer.close()
+
+
+def default_socket() -> str:
+    """
+    `rag.sock` in a directory that only the user can access, created if
+    needed. Another user's directory with the same name is refused.
+    """
+    runtime = os.getenv("XDG_RUNTIME_DIR")
+    if runtime:
+        directory = os.path.join(runtime, "pycon-rag")
+    else:
+        tmp = os.getenv("TMPDIR", "/tmp")
+        directory = os.path.join(tmp, f"pycon-rag-{os.getuid()}")
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    info = os.stat(directory, follow_symlinks=False)
+    if info.st_uid != os.getuid() or info.st_mode & 0o077:
+        raise PermissionError(f"{directory} is accessible to other users")
+    return os.path.join(directory, "rag.sock")
+
+
+async def serve(path: str):
+    # Imports, clients and database are ready before the first question
+    await get_collection()
+
+    if os.path.exists(path):
+        os.unlink(path)  # Left by a previous daemon
+    server = await asyncio.start_unix_server(handle, path=path)
+    os.chmod(path, 0o600)
+    print(f"Listening on {path}", flush=True)
+    async with server:
+        await server.serve_forever()
+
+
+def ask(question: str, path: str) -> str | None:
+    """
+    Answer of the daemon listening on `path` or `None` if there is none (or
+    it closed the connection without answering).
+    """
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(path)
+            sock.sendall(json.dumps({"question": question}).encode() + b"\n")
+            line = sock.makefile("rb").readline()
+    except (FileNotFoundError, ConnectionRefusedError, ConnectionResetError):
+        return None
+    if not line.endswith(b"\n"):
+        return None  # The daemon stopped while answering
+
+    response = json.loads(line)
+    if "error" in response:
+        raise RuntimeError(response["error"])
+    return response["answer"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RAG chatbot")
+    parser.add_argument("question", nargs="?", default="What is Task Decomposition?")
+    parser.add_argument("--serve", action="store_true", help="Start the daemon")
+    parser.add_argument("--socket", help="Path of the daemon socket")
+    args = parser.parse_args()
+    args.socket = args.socket or default_socket()
+
+    if args.serve:
+        asyncio.run(serve(args.socket))
+        return
+
+    print(f"Human: {args.question}")
+    answer = ask(args.question, args.socket)
+    if answer is None:
+        answer = asyncio.run(chatbot(args.question))
+    print(f"Chatbot: {answer}")
+
+
+if __name__ == "__main__":
+    main()
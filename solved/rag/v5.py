@@ -0,0 +1,356 @@
+"""
+v5: the synchronous v2 with the building blocks of `gateway`, `retrieval`
+and `observability`.
+
+Changes:
+
+- Calls to the API are retried (`gateway.retry`), rate limited
+  (`gateway.ratelimit`), routed across backends (`gateway.router`) and
+  accounted per stage with budgets (`gateway.accounting`), over a shared
+  connection pool (`gateway.http`).
+- Embeddings come from `EMBEDDINGS` (API, local model or hashing, see
+  `retrieval.embeddings`) and `VECTOR_STORE=quantized` keeps `int8` vectors
+  in memory-mapped files (see `retrieval.quantized`).
+- `ingest` parses and splits many pages in a pool of processes
+  (`retrieval.ingest`), stores each page once and indexes its chunks as
+  offsets into it (`retrieval.chunks`). `SPLITTER=structured` splits by
+  sections, paragraphs and sentences sized in tokens (`retrieval.splitting`).
+- With `RERANKER` many chunks are retrieved and the best ones kept
+  (`retrieval.rerank`), and questions already asked or paraphrased are
+  answered from a cache (`retrieval.answers`).
+- `ingest` and `chatbot` accept a `tenant`: one index per customer, opened
+  lazily and evicted when cold (`retrieval.tenants`).
+- With `TRACES` each stage is a span (`observability.tracing`) and the
+  prompt is a template precompiled once (`gateway.templates`).
+
+The clients, stores and caches are created on first use (`clients`), not on
+import: importing the module doesn't read the configuration nor create any
+file.
+
+```bash
+python -m solved.rag.v5 "What is Task Decomposition?"
+python -m solved.rag.v5 --tenant acme --ingest URL [URL ...]
+python -m solved.rag.v5 --tenant acme "What is RAG?"
+```
+"""
+
+import argparse
+import os
+import re
+from dataclasses import dataclass
+from functools import cache
+from time import perf_counter
+from typing import Any, Generator
+from uuid import uuid4
+
+from dotenv import load_dotenv
+
+from gateway.accounting import default_ledger
+from gateway.http import http, openai_client
+from gateway.ratelimit import RateLimiter
+from gateway.retry import Retry
+from gateway.router import Router
+from gateway.templates import Template
+from observability.tracing import span, traced
+from retrieval.answers import AnswerCache
+from retrieval.chunks import Chunk, SourceStore
+from retrieval.embeddings import EmbeddingFunction, embedder_from_env
+from retrieval.ingest import chunk_pages, parse_post
+from retrieval.quantized import QuantizedClient
+from retrieval.rerank import reranker_from_env
+from retrieval.splitting import splitter_from_env
+from retrieval.tenants import Tenants, chroma_settings
+
+URL = "https://lilianweng.github.io/posts/2023-06-23-agent/"
+
+
+@dataclass
+class Clients:
+    client: Any
+    limiter: Any
+    router: Any
+    retry: Any
+    ledger: Any
+    embedder: Any
+    db: Any
+    sources: Any
+    tenants: Any
+    reranker: Any
+    answers: Any
+    splitter: str
+
+    @classmethod
+    def create(cls, **overrides) -> "Clients":
+        """
+        Clients of `.env`. The ones in `overrides` (fakes of the benchmarks,
+        stores in other paths...) are used instead and not created.
+        """
+        load_dotenv()
+        values = dict(overrides)
+
+        def build(name: str, factory):
+            if name not in values:
+                values[name] = factory()
+            return values[name]
+
+        client = build("client", openai_client)
+        # Shared quota of all the threads (and processes, see `.env.example`)
+        limiter = build("limiter", RateLimiter.from_env)
+        # Backends from `LLM_BACKENDS`, the rest of models go to `client`
+        build("router", lambda: Router.from_env(client, limiter))
+        retry = build("retry", Retry)
+        # Tokens and cost per stage, budgets of `.env.example` (one per process)
+        build("ledger", default_ledger)
+        # OpenAI by default, `EMBEDDINGS=local` computes them on the CPU
+        embedder = build("embedder", lambda: embedder_from_env(client, limiter, retry))
+        # Memory of the open indexes of the tenants (`RAG_TENANT_MEMORY_MB`)
+        tenant_budget = Tenants.budget_from_env()
+        db = build("db", lambda: open_db(tenant_budget))
+        # Texts of the pages of `ingest`, the chunks are offsets into them
+        build("sources", lambda: SourceStore("./ragsources"))
+        # One collection, store of texts and cache of answers per tenant
+        build(
+            "tenants",
+            lambda: Tenants(
+                db,
+                EmbeddingFunction(embedder),
+                "./ragtenants",
+                memory_budget=tenant_budget,
+            ),
+        )
+        # With `RERANKER` we retrieve many chunks and the re-ranker keeps the
+        # best ones
+        build("reranker", reranker_from_env)
+        # Answers to questions already asked or paraphrased
+        build("answers", lambda: AnswerCache(threshold=0.95))
+        # `span_splitter` or, with `SPLITTER=structured`, sections, paragraphs
+        # and sentences packed by tokens
+        build("splitter", splitter_from_env)
+        return cls(**values)
+
+
+def open_db(tenant_budget: int | None):
+    if os.getenv("VECTOR_STORE") == "quantized":
+        # `int8` vectors in memory-mapped files, for indexes that don't fit in RAM
+        return QuantizedClient("./ragindex")
+
+    # Note: We don't use `langchain_chroma` but `chromadb`
+    import chromadb
+    from chromadb.config import Settings
+
+    return chromadb.PersistentClient(
+        path="./ragdatabase", settings=Settings(**chroma_settings(tenant_budget))
+    )
+
+
+@cache
+def clients() -> Clients:
+    """
+    Created on the first call, after `.env` is loaded.
+    """
+    return Clients.create()
+
+
+def llm(prompt: str, model: str = "gpt-4o-mini") -> str:
+    ledger = clients().ledger
+    # A cheaper model (or `BudgetExceeded`) once the budget is spent
+    model = ledger.model(model)
+    with span("llm", model=model) as s:
+        response = clients().retry(
+            clients().router.create,
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+        )
+        s.set_usage(response.usage)
+    ledger.record(model, response.usage)
+    return response.choices[0].message.content
+
+
+PROMPT = Template("""HUMAN
+
+You are an assistant for question-answering tasks. Use the following pieces of retrieved context to answer the question. If you don't know the answer, just say that you don't know. Use three sentences maximum and keep the answer concise.
+
+Question: {question}
+
+Context: {context}
+
+Answer:""")
+
+
+def prompt(docs: list[str], question: str) -> str:
+    return PROMPT.render(question=question, context="\n\n".join(docs))
+
+
+@traced("scrape")
+def scrape_web(url: str) -> str:
+    return parse_post(http().get(url).text)
+
+
+def text_splitter(doc: str, chunk_size: int = 1000, chunk_overlap: int = 200):
+    """
+    Same splitter as in v2.
+    """
+    splits = re.split(r"[\s\.,;:]+", doc)
+
+    prev_chunk = ""
+    chunk = ""
+    for subchunk in splits:
+        length = len(chunk) + len(subchunk)
+        if length > chunk_size:
+            yield prev_chunk[-chunk_overlap:] + chunk
+            prev_chunk = chunk
+            chunk = ""
+        else:
+            chunk += " " + subchunk
+    if chunk:
+        yield chunk
+
+
+@traced()
+def fill_db(docs: Generator[str, None, None]):
+    """
+    Same as in v2, with the embeddings of `EMBEDDINGS`.
+    """
+    # Vectors of different models can't be mixed: if you change `EMBEDDINGS`
+    # delete `./ragdatabase`
+    collection = clients().db.get_or_create_collection(
+        "rag", embedding_function=EmbeddingFunction(clients().embedder)
+    )
+
+    if collection.count() > 0:
+        return collection
+
+    for doc in docs:
+        for chunk in text_splitter(doc):
+            collection.add(documents=chunk, ids=[uuid4().hex])
+
+    # The cached answers were computed with other documents
+    clients().answers.invalidate()
+    return collection
+
+
+def ingest(
+    urls: list[str],
+    workers: int | None = None,
+    batch_size: int = 256,
+    tenant: str | None = None,
+):
+    """
+    Indexes many pages. A pool of `workers` processes (by default one per
+    core) parses and splits them, this process downloads the pages, embeds
+    the chunks and writes them to the database.
+
+    The texts are stored once in `sources` and the chunks are offsets into
+    them (see `retrieval/chunks.py`), materialised when building the prompt.
+    With `tenant`, the pages go to the index of that tenant.
+    """
+    embedder = clients().embedder
+    if tenant is None:
+        collection = clients().db.get_or_create_collection(
+            "rag", embedding_function=EmbeddingFunction(embedder)
+        )
+        store, cache = clients().sources, clients().answers
+    else:
+        index = clients().tenants.get(tenant)
+        collection, store, cache = index.collection, index.sources, index.answers
+
+    def write(chunks):
+        # The texts only exist while they are embedded: the collection keeps
+        # the ids, which are the offsets in `store`
+        collection.add(
+            ids=[chunk.id for chunk in chunks],
+            embeddings=embedder.embed(store.texts(chunks)),
+        )
+
+    pages = ((url, http().get(url).text) for url in urls)
+    batch = []
+    for source, text, chunks in chunk_pages(pages, clients().splitter, workers):
+        store.add(source, text)
+        batch.extend(chunks)
+        if len(batch) >= batch_size:
+            write(batch)
+            batch = []
+    if batch:
+        write(batch)
+
+    cache.invalidate()
+    if tenant is not None:
+        clients().tenants.resize(tenant)
+    return collection
+
+
+def documents(result, store: SourceStore) -> list[str]:
+    """
+    Texts of the chunks of a query: stored in the collection (`fill_db`) or
+    materialised from `store` (`ingest`).
+    """
+    texts = []
+    for id, document in zip(result["ids"][0], result["documents"][0]):
+        if document:
+            texts.append(document)
+        elif (text := store.text(Chunk.from_id(id))) is not None:
+            texts.append(text)
+    return texts
+
+
+@traced()
+def chatbot(question: str, tenant: str | None = None):
+    """
+    Central function of our chatbot. Equivalent to the LangChain pipeline.
+
+    With `tenant`, the question is answered with the pages indexed for that
+    tenant (`ingest`) and its own cache of answers.
+    """
+    with clients().ledger.request("chatbot"):
+        start = perf_counter()
+        if tenant is None:
+            store, cache = clients().sources, clients().answers
+        else:
+            index = clients().tenants.get(tenant)
+            store, cache = index.sources, index.answers
+        if (answer := cache.exact(question)) is not None:
+            return answer
+
+        if tenant is None:
+            collection = fill_db([scrape_web(URL)])
+        else:
+            collection = index.collection
+        # We embed the question once for the cache and the query
+        with span("embed"):
+            [vector] = clients().embedder.embed([question])
+        if (answer := cache.similar(vector)) is not None:
+            return answer
+
+        reranker = clients().reranker
+        if reranker is None:
+            with span("retrieve", n_results=5):
+                result = collection.query(query_embeddings=[vector], n_results=5)
+            context = documents(result, store)
+        else:
+            with span("retrieve", n_results=50):
+                result = collection.query(query_embeddings=[vector], n_results=50)
+            with span("rerank", top_n=3):
+                context = reranker.rerank(question, documents(result, store), top_n=3)
+        with clients().ledger.stage("answer"):
+            answer = llm(prompt(context, question))
+        cache.store(question, answer, vector, perf_counter() - start)
+        return answer
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RAG chatbot")
+    parser.add_argument("question", nargs="?", default="What is Task Decomposition?")
+    parser.add_argument("--tenant", help="Index of a customer")
+    parser.add_argument("--ingest", nargs="+", metavar="URL", help="Index pages")
+    args = parser.parse_args()
+
+    if args.ingest:
+        ingest(args.ingest, tenant=args.tenant)
+        return
+
+    print(f"Human: {args.question}")
+    print(f"Chatbot: {chatbot(args.question, args.tenant)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -10,18 +10,29 @@ components:
 import sys
 
 from dotenv import load_dotenv
-from openai import OpenAI
+
+from gateway.http import openai_client
+from gateway.ratelimit import RateLimiter
+from gateway.retry import Retry
+from gateway.router import Router
 
 load_dotenv()
 
-client = OpenAI()
+client = openai_client()  # Shared connection pool, retries by `retry`
+# Shared quota of all the threads (and processes, see `.env.example`)
+limiter = RateLimiter.from_env()
+# Backends from `LLM_BACKENDS`, the rest of models go to `client`
+router = Router.from_env(client, limiter)
+retry = Retry()
 
 DEFAULT = """What is the meaning of life?"""
 
 
 def llm(prompt: str, model: str = "gpt-3.5-turbo") -> str:
-    response = client.chat.completions.create(
-        model=model, messages=[{"role": "user", "content": prompt}]
+    response = retry(
+        router.create,
+        model=model,
+        messages=[{"role": "user", "content": prompt}],
     )
     return response.choices[0].message.content
 
@@ -0,0 +1,168 @@
+"""
+v3: model tiering and usage per stage.
+
+Changes:
+
+- Each stage has its own model (`Models`): a cheap and fast model generates
+  the ideas and a stronger one critiques them and resolves. With the router
+  (see `gateway.router`) the models can also be tags like `fast`/`strong`.
+- Compact merge (`compact=True`): in v2 `merge_prompt` nests `critique_prompt`
+  that nests `idea_prompt`, so the resolver reads the whole transcript again.
+  Now the researcher ends the critique choosing the best idea and the
+  resolver only receives the question, that idea and the critique.
+- `smartllm` returns the tokens and seconds spent by each stage.
+"""
+
+import re
+import sys
+from dataclasses import dataclass
+from time import perf_counter
+
+from dotenv import load_dotenv
+
+from gateway.http import openai_client
+from gateway.ratelimit import RateLimiter
+from gateway.retry import Retry
+from gateway.router import Router
+
+load_dotenv()
+
+client = openai_client()  # Shared connection pool, retries by `retry`
+# Shared quota of all the threads (and processes, see `.env.example`)
+limiter = RateLimiter.from_env()
+# Backends from `LLM_BACKENDS`, the rest of models go to `client`
+router = Router.from_env(client, limiter)
+retry = Retry()
+
+DEFAULT = """What is the meaning of life?"""
+
+
+@dataclass
+class Models:
+    idea: str = "gpt-4o-mini"
+    critique: str = "gpt-4o"
+    merge: str = "gpt-4o"
+
+
+@dataclass
+class Usage:
+    calls: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    seconds: float = 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"{self.calls} calls, {self.prompt_tokens} prompt tokens, "
+            f"{self.completion_tokens} completion tokens, {self.seconds:.2f}s"
+        )
+
+
+def llm(prompt: str, model: str = "gpt-4o-mini", usage: Usage | None = None) -> str:
+    start = perf_counter()
+    response = retry(
+        router.create,
+        model=model,
+        messages=[{"role": "user", "content": prompt}],
+    )
+
+    if usage is not None:
+        usage.calls += 1
+        usage.seconds += perf_counter() - start
+        if response.usage is not None:
+            usage.prompt_tokens += response.usage.prompt_tokens
+            usage.completion_tokens += response.usage.completion_tokens
+
+    return response.choices[0].message.content
+
+
+def idea_prompt(question: str) -> str:
+    return f"""Question: {question}
+Answer: Let's work this out in a step by step way to be sure we have the right answer:
+"""
+
+
+def critique_prompt(question: str, ideas: list[str]) -> str:
+    return f"""{idea_prompt(question)}
+{'\n'.join(f"> Idea {i+1}: {idea}" for i, idea in enumerate(ideas))}
+You are a researcher tasked with investigating the {len(ideas)} response options provided.
+List the flaws and faulty logic of each answer option. Let's work this out in a
+step by step way to be sure we have all the errors. Finish with a line with the
+number of the best option, for example: `Best idea: 1`
+"""
+
+
+def merge_prompt(question: str, ideas: list[str], critique: str) -> str:
+    return f"""{critique_prompt(question, ideas)}
+{critique}
+You are a resolver tasked with 1) finding which of the {len(ideas)} answer
+options the researcher thought was best, 2) improving that answer and
+3) printing the answer in full. Don't output anything for step 1 or 2,
+only the full answer in 3. Let's work this out in a step by step way to be
+sure we have the right answer:
+"""
+
+
+def compact_merge_prompt(question: str, idea: str, critique: str) -> str:
+    return f"""Question: {question}
+
+# Answer
+
+{idea}
+
+# Critique of the answer and the alternatives
+
+{critique}
+
+You are a resolver tasked with improving the answer using the critique and
+printing the answer in full. Only output the improved answer:
+"""
+
+
+BEST_IDEA_RE = re.compile(r"Best idea:\s*(\d+)", re.IGNORECASE)
+
+
+def best_idea(critique: str, ideas: list[str]) -> str | None:
+    """
+    Idea chosen by the researcher or `None` if we can't find it.
+    """
+    match = BEST_IDEA_RE.search(critique)
+    if not match or not 1 <= int(match.group(1)) <= len(ideas):
+        return None
+    return ideas[int(match.group(1)) - 1]
+
+
+def smartllm(
+    question: str = DEFAULT,
+    n_ideas: int = 2,
+    models: Models | None = None,
+    compact: bool = True,
+) -> tuple[str, dict[str, Usage]]:
+    """
+    Returns the answer and the usage of each stage (`idea`, `critique` and
+    `merge`).
+    """
+    usage = {"idea": Usage(), "critique": Usage(), "merge": Usage()}
+    models = models or Models()
+
+    ideas = [
+        llm(idea_prompt(question), models.idea, usage["idea"]) for _ in range(n_ideas)
+    ]
+    critique = llm(critique_prompt(question, ideas), models.critique, usage["critique"])
+
+    idea = best_idea(critique, ideas) if compact else None
+    if idea is not None:
+        prompt = compact_merge_prompt(question, idea, critique)
+    else:
+        prompt = merge_prompt(question, ideas, critique)
+
+    return llm(prompt, models.merge, usage["merge"]), usage
+
+
+if __name__ == "__main__":
+    question = sys.argv[1] if len(sys.argv) > 1 else DEFAULT
+    answer, usage = smartllm(question)
+    print(answer)
+    print()
+    for stage, stage_usage in usage.items():
+        print(f"{stage}: {stage_usage}")
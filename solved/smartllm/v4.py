@@ -0,0 +1,259 @@
+"""
+v4: early exit by consensus.
+
+Changes:
+
+- Ideas are generated concurrently: the stage takes the time of the slowest
+  idea instead of the sum of all of them.
+- If the ideas agree (`consensus`), we return the consensus answer and skip
+  the critique and the merge. Easy questions cost one round trip instead of
+  three. Only when the ideas diverge we run the full pipeline of v3.
+
+Agreement is measured locally, without calling the API: the ideas end with
+the same conclusion (their normalised last line) and their normalised texts
+are equal or the cosine similarity of their word counts is above
+`consensus_threshold`. Word counts alone would take two long reasonings that
+only differ in the conclusion for the same answer.
+
+Compare it with v3 using `python -m benchmarks.consensus`.
+"""
+
+import math
+import re
+import sys
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from time import perf_counter
+
+from dotenv import load_dotenv
+
+from gateway.http import openai_client
+from gateway.ratelimit import RateLimiter
+from gateway.retry import Retry
+from gateway.router import Router
+
+load_dotenv()
+
+client = openai_client()  # Shared connection pool, retries by `retry`
+# Shared quota of all the threads (and processes, see `.env.example`)
+limiter = RateLimiter.from_env()
+# Backends from `LLM_BACKENDS`, the rest of models go to `client`
+router = Router.from_env(client, limiter)
+retry = Retry()
+
+DEFAULT = """What is the meaning of life?"""
+
+
+@dataclass
+class Models:
+    idea: str = "gpt-4o-mini"
+    critique: str = "gpt-4o"
+    merge: str = "gpt-4o"
+
+
+@dataclass
+class Usage:
+    calls: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    seconds: float = 0.0
+
+    # The ideas are generated in several threads
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def add(self, response):
+        with self._lock:
+            self.calls += 1
+            if response.usage is not None:
+                self.prompt_tokens += response.usage.prompt_tokens
+                self.completion_tokens += response.usage.completion_tokens
+
+    @contextmanager
+    def timed(self):
+        """
+        Wall time of the stage (with concurrent calls it's not the sum of
+        the time of each call).
+        """
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds += perf_counter() - start
+
+    def __str__(self) -> str:
+        return (
+            f"{self.calls} calls, {self.prompt_tokens} prompt tokens, "
+            f"{self.completion_tokens} completion tokens, {self.seconds:.2f}s"
+        )
+
+
+def llm(prompt: str, model: str = "gpt-4o-mini", usage: Usage | None = None) -> str:
+    response = retry(
+        router.create,
+        model=model,
+        messages=[{"role": "user", "content": prompt}],
+    )
+    if usage is not None:
+        usage.add(response)
+    return response.choices[0].message.content
+
+
+def idea_prompt(question: str) -> str:
+    return f"""Question: {question}
+Answer: Let's work this out in a step by step way to be sure we have the right answer:
+"""
+
+
+def critique_prompt(question: str, ideas: list[str]) -> str:
+    return f"""{idea_prompt(question)}
+{'\n'.join(f"> Idea {i+1}: {idea}" for i, idea in enumerate(ideas))}
+You are a researcher tasked with investigating the {len(ideas)} response options provided.
+List the flaws and faulty logic of each answer option. Let's work this out in a
+step by step way to be sure we have all the errors. Finish with a line with the
+number of the best option, for example: `Best idea: 1`
+"""
+
+
+def merge_prompt(question: str, ideas: list[str], critique: str) -> str:
+    return f"""{critique_prompt(question, ideas)}
+{critique}
+You are a resolver tasked with 1) finding which of the {len(ideas)} answer
+options the researcher thought was best, 2) improving that answer and
+3) printing the answer in full. Don't output anything for step 1 or 2,
+only the full answer in 3. Let's work this out in a step by step way to be
+sure we have the right answer:
+"""
+
+
+def compact_merge_prompt(question: str, idea: str, critique: str) -> str:
+    return f"""Question: {question}
+
+# Answer
+
+{idea}
+
+# Critique of the answer and the alternatives
+
+{critique}
+
+You are a resolver tasked with improving the answer using the critique and
+printing the answer in full. Only output the improved answer:
+"""
+
+
+BEST_IDEA_RE = re.compile(r"Best idea:\s*(\d+)", re.IGNORECASE)
+
+
+def best_idea(critique: str, ideas: list[str]) -> str | None:
+    """
+    Idea chosen by the researcher or `None` if we can't find it.
+    """
+    match = BEST_IDEA_RE.search(critique)
+    if not match or not 1 <= int(match.group(1)) <= len(ideas):
+        return None
+    return ideas[int(match.group(1)) - 1]
+
+
+WORD_RE = re.compile(r"\w+")
+
+
+def normalise(text: str) -> str:
+    return " ".join(WORD_RE.findall(text.lower()))
+
+
+def similarity(a: str, b: str) -> float:
+    """
+    Cosine similarity of the word counts of `a` and `b`.
+    """
+    if normalise(a) == normalise(b):
+        return 1.0
+
+    count_a = Counter(WORD_RE.findall(a.lower()))
+    count_b = Counter(WORD_RE.findall(b.lower()))
+    dot = sum(n * count_b[word] for word, n in count_a.items())
+    norm = math.sqrt(sum(n * n for n in count_a.values())) * math.sqrt(
+        sum(n * n for n in count_b.values())
+    )
+    return dot / norm if norm else 0.0
+
+
+def final_answer(text: str) -> str:
+    """
+    Normalised last line of `text`: the conclusion of a step by step answer.
+    """
+    lines = [line for line in text.splitlines() if line.strip()]
+    return normalise(lines[-1]) if lines else ""
+
+
+def consensus(ideas: list[str], threshold: float) -> str | None:
+    """
+    If every idea ends with the same conclusion and every pair of ideas is
+    similar enough, returns the most central one (the most similar to the
+    rest). Otherwise `None`.
+    """
+    # Long answers that only differ in the conclusion ("18 dollars" and "16
+    # dollars", "so yes" and "so no") are similar word by word
+    if len({final_answer(idea) for idea in ideas}) > 1:
+        return None
+
+    scores = [0.0] * len(ideas)
+    for i in range(len(ideas)):
+        for j in range(i + 1, len(ideas)):
+            score = similarity(ideas[i], ideas[j])
+            if score < threshold:
+                return None
+            scores[i] += score
+            scores[j] += score
+    return ideas[scores.index(max(scores))]
+
+
+def smartllm(
+    question: str = DEFAULT,
+    n_ideas: int = 2,
+    models: Models | None = None,
+    compact: bool = True,
+    consensus_threshold: float | None = 0.9,
+) -> tuple[str, dict[str, Usage]]:
+    """
+    Returns the answer and the usage of each stage (`idea`, `critique` and
+    `merge`). Use `consensus_threshold=None` to always run the full pipeline.
+    """
+    usage = {"idea": Usage(), "critique": Usage(), "merge": Usage()}
+    models = models or Models()
+
+    def generate(_) -> str:
+        return llm(idea_prompt(question), models.idea, usage["idea"])
+
+    with usage["idea"].timed(), ThreadPoolExecutor(n_ideas) as executor:
+        ideas = list(executor.map(generate, range(n_ideas)))
+
+    if (
+        consensus_threshold is not None
+        and (answer := consensus(ideas, consensus_threshold)) is not None
+    ):
+        return answer, usage
+
+    with usage["critique"].timed():
+        prompt = critique_prompt(question, ideas)
+        critique = llm(prompt, models.critique, usage["critique"])
+
+    idea = best_idea(critique, ideas) if compact else None
+    if idea is not None:
+        prompt = compact_merge_prompt(question, idea, critique)
+    else:
+        prompt = merge_prompt(question, ideas, critique)
+
+    with usage["merge"].timed():
+        return llm(prompt, models.merge, usage["merge"]), usage
+
+
+if __name__ == "__main__":
+    question = sys.argv[1] if len(sys.argv) > 1 else DEFAULT
+    answer, usage = smartllm(question)
+    print(answer)
+    print()
+    for stage, stage_usage in usage.items():
+        print(f"{stage}: {stage_usage}")
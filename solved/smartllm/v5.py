@@ -0,0 +1,433 @@
+"""
+v5: streamed ideas and critical path.
+
+Changes:
+
+- Ideas are streamed (`stream_llm`) with a token budget (`max_tokens`) and
+  stop sequences, so one rambling idea can't dominate the latency of the
+  stage.
+- The ideas run in a thread pool shared by all the calls instead of a pool
+  created and joined for each question: the critique is sent as soon as the
+  last idea ends.
+- `smartllm` also returns a `Timeline` with the start, first token and end of
+  each call. The critical path (slowest idea, critique and merge) shows where
+  the wall clock goes.
+- With `TRACES` each stage and call is a span (see `observability.tracing`).
+- The ledger of `gateway.accounting` adds up the tokens and cost of every
+  question and enforces the budgets.
+- The prompts are templates precompiled once (see `gateway.templates`), each
+  one built from the previous one instead of rendering it again.
+"""
+
+import math
+import re
+import sys
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import copy_context
+from dataclasses import dataclass, field
+from itertools import pairwise
+from time import perf_counter
+
+from dotenv import load_dotenv
+
+from gateway.accounting import default_ledger
+from gateway.http import openai_client
+from gateway.ratelimit import RateLimiter
+from gateway.retry import Retry
+from gateway.router import Router
+from gateway.templates import Template
+from observability import tracing
+
+load_dotenv()
+
+client = openai_client()  # Shared connection pool, retries by `retry`
+# Shared quota of all the threads (and processes, see `.env.example`)
+limiter = RateLimiter.from_env()
+# Backends from `LLM_BACKENDS`, the rest of models go to `client`
+router = Router.from_env(client, limiter)
+retry = Retry()
+# Tokens and cost per stage, budgets of `.env.example` (one per process)
+ledger = default_ledger()
+executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="idea")
+
+DEFAULT = """What is the meaning of life?"""
+
+# An idea is over if the model starts another question
+IDEA_STOP = ["\nQuestion:"]
+
+
+@dataclass
+class Models:
+    idea: str = "gpt-4o-mini"
+    critique: str = "gpt-4o"
+    merge: str = "gpt-4o"
+
+
+@dataclass
+class Usage:
+    calls: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    seconds: float = 0.0
+
+    # The ideas are generated in several threads
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def add(self, response):
+        self.add_call()
+        if response.usage is not None:
+            self.add_tokens(response.usage)
+
+    def add_call(self):
+        with self._lock:
+            self.calls += 1
+
+    def add_tokens(self, usage):
+        # Apart from the call: a stream only has them if the backend reports
+        # them (`include_usage`)
+        with self._lock:
+            self.prompt_tokens += usage.prompt_tokens
+            self.completion_tokens += usage.completion_tokens
+
+    @contextmanager
+    def timed(self):
+        """
+        Wall time of the stage (with concurrent calls it's not the sum of
+        the time of each call).
+        """
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds += perf_counter() - start
+
+    def __str__(self) -> str:
+        return (
+            f"{self.calls} calls, {self.prompt_tokens} prompt tokens, "
+            f"{self.completion_tokens} completion tokens, {self.seconds:.2f}s"
+        )
+
+
+@dataclass(eq=False)
+class Span:
+    stage: str
+    name: str
+    start: float
+    first_token: float | None = None
+    end: float | None = None
+
+
+class Timeline:
+    def __init__(self):
+        self.origin = perf_counter()
+        self.spans: list[Span] = []
+
+    @contextmanager
+    def span(self, stage: str, name: str | None = None):
+        span = Span(stage, name or stage, perf_counter())
+        self.spans.append(span)
+        try:
+            yield span
+        finally:
+            span.end = perf_counter()
+
+    def critical_path(self) -> list[Span]:
+        """
+        The span that ends last in each stage: the stages are sequential so
+        the next one can't start before.
+        """
+        last = {}
+        for span in self.spans:
+            if span.stage not in last or span.end > last[span.stage].end:
+                last[span.stage] = span
+        return list(last.values())
+
+    def waiting(self) -> float:
+        """
+        Seconds of the critical path not spent in any call.
+        """
+        path = self.critical_path()
+        return sum(b.start - a.end for a, b in pairwise(path))
+
+    def __str__(self) -> str:
+        critical = self.critical_path()
+        lines = []
+        for span in self.spans:
+            mark = "*" if span in critical else " "
+            first = ""
+            if span.first_token is not None:
+                first = f" (first token {span.first_token - self.origin:.2f}s)"
+            lines.append(
+                f"{mark} {span.name:<10} {span.start - self.origin:6.2f}s"
+                f" -> {span.end - self.origin:6.2f}s{first}"
+            )
+        return "\n".join(lines)
+
+
+def llm(prompt: str, model: str = "gpt-4o-mini", usage: Usage | None = None) -> str:
+    model = ledger.model(model)
+    with tracing.span("llm", model=model) as s:
+        response = retry(
+            router.create,
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+        )
+        s.set_usage(response.usage)
+    ledger.record(model, response.usage)
+    if usage is not None:
+        usage.add(response)
+    return response.choices[0].message.content
+
+
+def stream_llm(
+    prompt: str,
+    model: str = "gpt-4o-mini",
+    usage: Usage | None = None,
+    span: Span | None = None,
+    **kwargs,
+) -> str:
+    """
+    Like `llm` but streaming the answer. `kwargs` are passed to the API
+    (`max_tokens`, `stop`...).
+    """
+    model = ledger.model(model)
+    with tracing.span("llm", model=model, stream=True) as s:
+        stream = retry(
+            router.create,
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+            stream=True,
+            stream_options={"include_usage": True},
+            **kwargs,
+        )
+
+        if usage is not None:
+            usage.add_call()
+        parts = []
+        for chunk in stream:
+            if chunk.usage is not None:
+                s.set_usage(chunk.usage)
+                ledger.record(model, chunk.usage)
+                if usage is not None:
+                    usage.add_tokens(chunk.usage)
+            if chunk.choices and chunk.choices[0].delta.content:
+                if span is not None and span.first_token is None:
+                    span.first_token = perf_counter()
+                parts.append(chunk.choices[0].delta.content)
+    return "".join(parts)
+
+
+IDEA = Template("""Question: {question}
+Answer: Let's work this out in a step by step way to be sure we have the right answer:
+""")
+
+# Each prompt extends the previous one: the static text is joined once here
+CRITIQUE = IDEA + Template("""
+{ideas}
+You are a researcher tasked with investigating the {n_ideas} response options provided.
+List the flaws and faulty logic of each answer option. Let's work this out in a
+step by step way to be sure we have all the errors. Finish with a line with the
+number of the best option, for example: `Best idea: 1`
+""")
+
+MERGE = CRITIQUE + Template("""
+{critique}
+You are a resolver tasked with 1) finding which of the {n_ideas} answer
+options the researcher thought was best, 2) improving that answer and
+3) printing the answer in full. Don't output anything for step 1 or 2,
+only the full answer in 3. Let's work this out in a step by step way to be
+sure we have the right answer:
+""")
+
+COMPACT_MERGE = Template("""Question: {question}
+
+# Answer
+
+{idea}
+
+# Critique of the answer and the alternatives
+
+{critique}
+
+You are a resolver tasked with improving the answer using the critique and
+printing the answer in full. Only output the improved answer:
+""")
+
+
+def idea_prompt(question: str) -> str:
+    return IDEA.render(question=question)
+
+
+def format_ideas(ideas: list[str]) -> str:
+    return "\n".join(f"> Idea {i+1}: {idea}" for i, idea in enumerate(ideas))
+
+
+def critique_prompt(question: str, ideas: list[str]) -> str:
+    return CRITIQUE.render(
+        question=question, ideas=format_ideas(ideas), n_ideas=str(len(ideas))
+    )
+
+
+def merge_prompt(question: str, ideas: list[str], critique: str) -> str:
+    return MERGE.render(
+        question=question,
+        ideas=format_ideas(ideas),
+        n_ideas=str(len(ideas)),
+        critique=critique,
+    )
+
+
+def compact_merge_prompt(question: str, idea: str, critique: str) -> str:
+    return COMPACT_MERGE.render(question=question, idea=idea, critique=critique)
+
+
+BEST_IDEA_RE = re.compile(r"Best idea:\s*(\d+)", re.IGNORECASE)
+
+
+def best_idea(critique: str, ideas: list[str]) -> str | None:
+    """
+    Idea chosen by the researcher or `None` if we can't find it.
+    """
+    match = BEST_IDEA_RE.search(critique)
+    if not match or not 1 <= int(match.group(1)) <= len(ideas):
+        return None
+    return ideas[int(match.group(1)) - 1]
+
+
+WORD_RE = re.compile(r"\w+")
+
+
+def normalise(text: str) -> str:
+    return " ".join(WORD_RE.findall(text.lower()))
+
+
+def similarity(a: str, b: str) -> float:
+    """
+    Cosine similarity of the word counts of `a` and `b`.
+    """
+    if normalise(a) == normalise(b):
+        return 1.0
+
+    count_a = Counter(WORD_RE.findall(a.lower()))
+    count_b = Counter(WORD_RE.findall(b.lower()))
+    dot = sum(n * count_b[word] for word, n in count_a.items())
+    norm = math.sqrt(sum(n * n for n in count_a.values())) * math.sqrt(
+        sum(n * n for n in count_b.values())
+    )
+    return dot / norm if norm else 0.0
+
+
+def final_answer(text: str) -> str:
+    """
+    Normalised last line of `text`: the conclusion of a step by step answer.
+    """
+    lines = [line for line in text.splitlines() if line.strip()]
+    return normalise(lines[-1]) if lines else ""
+
+
+def consensus(ideas: list[str], threshold: float) -> str | None:
+    """
+    If every idea ends with the same conclusion and every pair of ideas is
+    similar enough, returns the most central one (the most similar to the
+    rest). Otherwise `None`.
+    """
+    # Long answers that only differ in the conclusion ("18 dollars" and "16
+    # dollars", "so yes" and "so no") are similar word by word
+    if len({final_answer(idea) for idea in ideas}) > 1:
+        return None
+
+    scores = [0.0] * len(ideas)
+    for i in range(len(ideas)):
+        for j in range(i + 1, len(ideas)):
+            score = similarity(ideas[i], ideas[j])
+            if score < threshold:
+                return None
+            scores[i] += score
+            scores[j] += score
+    return ideas[scores.index(max(scores))]
+
+
+@tracing.traced()
+@ledger.request("smartllm")
+def smartllm(
+    question: str = DEFAULT,
+    n_ideas: int = 2,
+    models: Models | None = None,
+    compact: bool = True,
+    consensus_threshold: float | None = 0.9,
+    idea_max_tokens: int | None = 512,
+    idea_stop: list[str] | None = IDEA_STOP,
+) -> tuple[str, dict[str, Usage], Timeline]:
+    """
+    Returns the answer, the usage of each stage (`idea`, `critique` and
+    `merge`) and the timeline of the calls.
+    """
+    usage = {"idea": Usage(), "critique": Usage(), "merge": Usage()}
+    models = models or Models()
+    timeline = Timeline()
+
+    limits = {}
+    if idea_max_tokens is not None:
+        limits["max_tokens"] = idea_max_tokens
+    if idea_stop:
+        limits["stop"] = idea_stop
+
+    # Same prompt for every idea
+    prompt = idea_prompt(question)
+
+    def generate(i: int) -> str:
+        with timeline.span("idea", f"idea {i + 1}") as span, ledger.stage("idea"):
+            return stream_llm(prompt, models.idea, usage["idea"], span, **limits)
+
+    with usage["idea"].timed(), tracing.span("ideas", n_ideas=n_ideas):
+        # The context of this thread makes the ideas children of its span
+        futures = [
+            executor.submit(copy_context().run, generate, i) for i in range(n_ideas)
+        ]
+        ideas = [future.result() for future in futures]
+
+    if (
+        consensus_threshold is not None
+        and (answer := consensus(ideas, consensus_threshold)) is not None
+    ):
+        return answer, usage, timeline
+
+    with (
+        usage["critique"].timed(),
+        timeline.span("critique"),
+        tracing.span("critique"),
+        ledger.stage("critique"),
+    ):
+        prompt = critique_prompt(question, ideas)
+        critique = llm(prompt, models.critique, usage["critique"])
+
+    idea = best_idea(critique, ideas) if compact else None
+    if idea is not None:
+        prompt = compact_merge_prompt(question, idea, critique)
+    else:
+        prompt = merge_prompt(question, ideas, critique)
+
+    with (
+        usage["merge"].timed(),
+        timeline.span("merge"),
+        tracing.span("merge"),
+        ledger.stage("merge"),
+    ):
+        answer = llm(prompt, models.merge, usage["merge"])
+    return answer, usage, timeline
+
+
+if __name__ == "__main__":
+    question = sys.argv[1] if len(sys.argv) > 1 else DEFAULT
+    answer, usage, timeline = smartllm(question)
+    print(answer)
+    print()
+    for stage, stage_usage in usage.items():
+        print(f"{stage}: {stage_usage}")
+    print()
+    print("Timeline (* critical path):")
+    print(timeline)
+    print(f"Waiting between stages: {timeline.waiting() * 1000:.1f} ms")
@@ -0,0 +1,4 @@
+import os
+
+# The clients of the modules are created on import, the tests never call the API
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
@@ -0,0 +1,60 @@
+import json
+from types import SimpleNamespace
+
+from gateway.batch import BatchError, request_line, run_batch, split_requests
+
+
+def body(model: str, content: str = "Hi") -> dict:
+    return {"model": model, "messages": [{"role": "user", "content": content}]}
+
+
+def test_split_by_model_and_limits():
+    requests = {f"a{i}": body("gpt-4o-mini") for i in range(5)}
+    requests |= {f"b{i}": body("gpt-4o") for i in range(2)}
+
+    parts = split_requests(requests, max_requests=2)
+    assert [list(part) for part in parts] == [
+        ["a0", "a1"],
+        ["a2", "a3"],
+        ["a4"],
+        ["b0", "b1"],
+    ]
+
+    size = len(request_line("a0", requests["a0"]).encode())
+    parts = split_requests(requests, max_bytes=3 * size)
+    assert [len(part) for part in parts] == [3, 2, 2]
+
+
+class Batches:
+    """
+    Fails the batches of `gpt-4o`.
+    """
+
+    poll = 0
+
+    def __init__(self):
+        self.rows = {}
+
+    def submit(self, path: str) -> str:
+        with open(path) as f:
+            self.rows[path] = [json.loads(line) for line in f]
+        return path
+
+    def status(self, batch_id: str) -> str:
+        models = {row["body"]["model"] for row in self.rows[batch_id]}
+        return "failed" if "gpt-4o" in models else "completed"
+
+    def results(self, batch_id: str) -> dict:
+        rows = self.rows[batch_id]
+        return {row["custom_id"]: SimpleNamespace(ok=True) for row in rows}
+
+
+def test_a_failed_batch_doesnt_lose_the_others(tmp_path):
+    requests = {"a": body("gpt-4o-mini"), "b": body("gpt-4o")}
+    results = run_batch(Batches(), requests, str(tmp_path / "round.jsonl"))
+    assert results["a"].ok
+    assert isinstance(results["b"], BatchError)
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "round-1.jsonl",
+        "round-2.jsonl",
+    ]
@@ -0,0 +1,50 @@
+from itertools import pairwise
+
+from retrieval.chunks import Chunk, SourceStore, chunk_hash
+from retrieval.splitting import span_splitter
+
+
+def chunks(source: str, text: bytes, **kwargs) -> list[Chunk]:
+    return [
+        Chunk(source, start, end, chunk_hash(text[start:end]))
+        for start, end in span_splitter(text, **kwargs)
+    ]
+
+
+def test_spans_are_whole_words_of_the_text():
+    text = ("Ñandú " * 50 + "café, tea. " * 50).encode()
+    spans = list(span_splitter(text, chunk_size=100, chunk_overlap=20))
+    # The offsets are at the start or end of a word (without punctuation)
+    assert spans[0][0] == 0 and spans[-1][1] == len(text.rstrip(b". "))
+    for (start, end), (next_start, _) in pairwise(spans):
+        assert next_start < end  # The overlap
+        assert text[start:end].decode() == text[start:end].decode().strip()
+        assert end - start <= 100 + 20
+
+
+def test_ids_round_trip(tmp_path):
+    store = SourceStore(str(tmp_path / "sources"))
+    text = "Agents plan, remember and use tools. " * 40
+    store.add("https://example.com/a#b", text.encode())
+    for chunk in chunks("https://example.com/a#b", text.encode()):
+        assert store.text(Chunk.from_id(chunk.id)) == text.encode()[
+            chunk.start : chunk.end
+        ].decode()
+
+
+def test_sources_added_by_another_store(tmp_path):
+    path = str(tmp_path / "sources")
+    reader = SourceStore(path)
+    writer = SourceStore(path)
+    writer.add("a", b"first page")
+    writer.add("b", b"second page")
+
+    [chunk] = chunks("b", b"second page")
+    assert reader.text(chunk) == "second page"
+
+    # A new version of the page, added by the other process
+    SourceStore(path).add("b", b"edited page")
+    [edited] = chunks("b", b"edited page")
+    assert reader.text(edited) == "edited page"
+    assert reader.text(chunk) is None
+    assert writer.text(Chunk.from_id(chunks("a", b"first page")[0].id)) == "first page"
@@ -0,0 +1,44 @@
+import importlib
+
+import pytest
+
+STEPS = """The shop sells apples at 2 dollars each and pears at 3 dollars each.
+Maria buys 3 apples, which cost 3 * 2 = 6 dollars.
+She also buys 4 pears, which cost 4 * 3 = 12 dollars.
+Adding both amounts gives the total of the purchase.
+"""
+
+
+@pytest.fixture(params=["v4", "v5", "v6"])
+def smartllm(request):
+    return importlib.import_module(f"solved.smartllm.{request.param}")
+
+
+def test_different_results_are_not_a_consensus(smartllm):
+    ideas = [f"{STEPS}The total is 18 dollars.", f"{STEPS}The total is 16 dollars."]
+    assert smartllm.similarity(*ideas) > 0.9
+    assert smartllm.consensus(ideas, 0.9) is None
+
+
+def test_same_conclusion_is_a_consensus(smartllm):
+    other_steps = STEPS.replace("Adding both", "The sum of both")
+    ideas = [
+        f"{STEPS}The total is 18 dollars.",
+        f"{other_steps}The total is 18 dollars",
+    ]
+    assert smartllm.consensus(ideas, 0.9) in ideas
+
+
+def test_opposite_conclusions_are_not_a_consensus(smartllm):
+    reasoning = (
+        "The bridge was inspected last year and the report lists minor rust.\n"
+        "The maximum load is 40 tonnes and the truck weighs 30 tonnes.\n"
+    )
+    ideas = [f"{reasoning}So yes, it is safe.", f"{reasoning}So no, it is not safe."]
+    assert smartllm.similarity(*ideas) > 0.9
+    assert smartllm.consensus(ideas, 0.9) is None
+
+
+def test_different_reasonings_are_not_a_consensus(smartllm):
+    ideas = ["The meaning of life is 42.", "Nobody knows, but 42 is a classic."]
+    assert smartllm.consensus(ideas, 0.9) is None
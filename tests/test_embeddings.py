@@ -0,0 +1,17 @@
+from retrieval.embeddings import HashingEmbedder, LocalEmbedder, embedder_from_env
+
+
+def test_backends_from_env(monkeypatch):
+    monkeypatch.delenv("EMBEDDINGS_CACHE", raising=False)
+
+    monkeypatch.setenv("EMBEDDINGS", "local-onnx")
+    embedder = embedder_from_env()
+    assert isinstance(embedder, LocalEmbedder)
+    assert embedder.backend == "onnx"
+
+    monkeypatch.setenv("EMBEDDINGS", "local:paraphrase-MiniLM-L3-v2")
+    embedder = embedder_from_env()
+    assert (embedder.name, embedder.backend) == ("paraphrase-MiniLM-L3-v2", "torch")
+
+    monkeypatch.setenv("EMBEDDINGS", "hashing:64")
+    assert embedder_from_env() == HashingEmbedder(64)
@@ -0,0 +1,106 @@
+import asyncio
+import json
+
+import pytest
+
+from gateway.accounting import Budget, BudgetExceeded, Ledger
+from gateway.batch import LocalBatches
+from solved.extractor import v5, v6
+
+MODEL = v5.Model(fields=[v5.Field(name="title", description="The title")])
+
+
+def completion(content: str, tokens: int = 30):
+    from openai.types.chat import ChatCompletion
+
+    return ChatCompletion.model_validate(
+        {
+            "id": "chatcmpl-test",
+            "object": "chat.completion",
+            "created": 0,
+            "model": "gpt-4o-mini",
+            "choices": [
+                {
+                    "index": 0,
+                    "finish_reason": "stop",
+                    "message": {"role": "assistant", "content": content},
+                }
+            ],
+            "usage": {
+                "prompt_tokens": tokens,
+                "completion_tokens": tokens,
+                "total_tokens": 2 * tokens,
+            },
+        }
+    )
+
+
+def create(model: str, messages: list[dict[str, str]]):
+    # The document "broken" never gets a JSON block
+    if "broken" in messages[0]["content"]:
+        return completion("I can't")
+    return completion(f"```json\n{json.dumps({'title': 'Talk'})}\n```")
+
+
+def test_request_budget_applies_per_document(monkeypatch, tmp_path):
+    ledger = Ledger(request_budget=Budget(max_tokens=100))
+    monkeypatch.setattr(v5, "ledger", ledger)
+    docs = ["talk one", "broken talk", "talk two"]
+
+    results = v5.extract_batch(
+        MODEL, docs, LocalBatches(create), max_retries=3, workdir=str(tmp_path)
+    )
+
+    assert results == [{"title": "Talk"}, None, {"title": "Talk"}]
+    # The broken document is dropped once its own budget is spent
+    assert ledger.to_dict()["total"]["calls"] == 4
+    assert ledger.aborted == 1
+
+
+def test_validator_errors_that_are_not_of_the_field_propagate():
+    def validator(value):
+        raise BudgetExceeded("Budget of extractor/validate spent")
+
+    model = v5.Model(fields=[v5.Field("title", "The title", validator)])
+    with pytest.raises(BudgetExceeded):
+        v5.validate_output('```json\n{"title": "Talk"}\n```', model)
+
+    _, errors = v5.validate_output("```json\n{}\n```", MODEL)
+    assert errors == [("title", "title")]
+
+
+@pytest.mark.parametrize("links", [None, 42, "https://2024.es.pycon.org"])
+def test_null_and_wrong_type_fields_are_errors_to_fix(links):
+    output = f"```json\n{json.dumps({'links': links})}\n```"
+
+    model = v5.Model([v5.Field("links", "The links", v5.validate_links)])
+    _, errors = v5.validate_output(output, model)
+    assert [field for field, _ in errors] == ["links"]
+
+    model = v6.Model([v6.Field("links", "The links", v6.validate_links)])
+    _, errors = asyncio.run(v6.validate_output(output, model))
+    assert [field for field, _ in errors] == ["links"]
+
+
+def test_documents_that_fail_while_validated_are_reported(monkeypatch, tmp_path):
+    monkeypatch.setattr(v5, "ledger", Ledger())
+
+    def validator(value):
+        if value == "Broken":
+            raise BudgetExceeded("Budget of extractor/validate spent")
+
+    def create(model: str, messages: list[dict[str, str]]):
+        title = "Broken" if "broken" in messages[0]["content"] else "Talk"
+        return completion(f"```json\n{json.dumps({'title': title})}\n```")
+
+    model = v5.Model(fields=[v5.Field("title", "The title", validator)])
+    results = v5.extract_batch_with_errors(
+        model, ["talk", "broken talk"], LocalBatches(create), workdir=str(tmp_path)
+    )
+
+    assert results[0] == ({"title": "Talk"}, [])
+    parsed, errors = results[1]
+    assert parsed is None
+    assert errors == [
+        ("extraction", "BudgetExceeded: Budget of extractor/validate spent")
+    ]
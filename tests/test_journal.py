@@ -0,0 +1,79 @@
+import json
+
+from jobs.journal import Journal, run_job
+
+DOCS = [("a", "first"), ("b", "second"), ("c", "third")]
+
+
+def extract_many(texts):
+    return [({"text": text}, []) for text in texts]
+
+
+def lines(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_a_job_that_dies_resumes_where_it_stopped(tmp_path):
+    output = tmp_path / "out.jsonl"
+    journal = Journal(str(tmp_path / "job.journal"))
+
+    def dies(texts):
+        if "third" in texts:
+            raise RuntimeError("killed")
+        return extract_many(texts)
+
+    try:
+        run_job(journal, DOCS, dies, str(output), chunk_size=2)
+    except RuntimeError:
+        pass
+    journal.close()
+    assert [line["id"] for line in lines(output)] == ["a", "b"]
+
+    seen = []
+
+    def resumed(texts):
+        seen.extend(texts)
+        return extract_many(texts)
+
+    journal = Journal(str(tmp_path / "job.journal"))
+    stats = run_job(journal, DOCS, resumed, str(output), chunk_size=2)
+    assert seen == ["third"]
+    assert stats["done"] == 3 and stats["skipped"] == 2
+    assert [line["id"] for line in lines(output)] == ["a", "b", "c"]
+
+
+def test_extracted_results_are_flushed_when_resuming(tmp_path):
+    output = tmp_path / "out.jsonl"
+    journal = Journal(str(tmp_path / "job.journal"))
+    # Died after saving the results in the journal, before the output
+    journal.start([("a", "hash")])
+    journal.finish(["a"], [({"x": 1}, [])])
+
+    stats = run_job(journal, [], extract_many, str(output))
+    assert stats["done"] == 1 and stats["extracted"] == 0
+    assert lines(output) == [{"id": "a", "hash": "hash", "result": {"x": 1}}]
+
+
+def test_changed_and_failed_documents_are_extracted_again(tmp_path):
+    output = tmp_path / "out.jsonl"
+    journal = Journal(str(tmp_path / "job.journal"))
+
+    def failing(texts):
+        return [(None, [("text", "invalid")]) for _ in texts]
+
+    run_job(journal, DOCS[:1], extract_many, str(output))
+    run_job(journal, DOCS[1:2], failing, str(output))
+    assert list(journal.failures()) == [("b", [["text", "invalid"]])]
+
+    seen = []
+
+    def again(texts):
+        seen.extend(texts)
+        return extract_many(texts)
+
+    docs = [("a", "first, edited"), ("b", "second")]
+    stats = run_job(journal, docs, again, str(output))
+    assert seen == ["first, edited", "second"]
+    assert stats["done"] == 2 and stats["failed"] == 0
+    assert lines(output)[-2]["result"] == {"text": "first, edited"}
@@ -0,0 +1,60 @@
+import sys
+
+import openai
+import pytest
+from openai.types.chat import ChatCompletion
+
+
+@pytest.fixture
+def logged(monkeypatch):
+    # Without intercepting the imports of the rest of the tests
+    monkeypatch.setattr(sys, "meta_path", list(sys.meta_path))
+    from observability import openai as observability
+    from observability.sampling import Sampler
+
+    monkeypatch.setattr(observability, "sampler", Sampler(rate=1))
+    return lambda fn: observability.logged_competion(fn, openai)
+
+
+MESSAGES = [{"role": "user", "content": "Hi"}]
+
+
+def completion(content: str) -> ChatCompletion:
+    return ChatCompletion.model_validate(
+        {
+            "id": "chatcmpl-test",
+            "object": "chat.completion",
+            "created": 0,
+            "model": "gpt-4o-mini",
+            "choices": [
+                {
+                    "index": 0,
+                    "finish_reason": "stop",
+                    "message": {"role": "assistant", "content": content},
+                }
+            ],
+        }
+    )
+
+
+def test_completions_are_printed(logged, capsys):
+    create = logged(lambda **_: completion("Hello"))
+    assert create(messages=MESSAGES).choices[0].message.content == "Hello"
+    assert "< Hello" in capsys.readouterr().out
+
+
+def test_streams_are_printed_without_reading_them(logged, capsys):
+    chunks = iter(["Hel", "lo"])
+    create = logged(lambda **_: chunks)
+    assert create(messages=MESSAGES, stream=True) is chunks
+    assert "< <stream>" in capsys.readouterr().out
+    assert list(chunks) == ["Hel", "lo"]
+
+
+def test_interruptions_are_not_masked(logged, capsys):
+    def interrupted(**_):
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        logged(interrupted)(messages=MESSAGES)
+    assert "! KeyboardInterrupt" in capsys.readouterr().out
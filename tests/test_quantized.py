@@ -0,0 +1,86 @@
+import threading
+
+import numpy as np
+
+from retrieval.quantized import QuantizedClient, QuantizedIndex
+
+
+def vectors(n: int, seed: int) -> np.ndarray:
+    return np.random.default_rng(seed).normal(size=(n, 16)).astype(np.float32)
+
+
+def test_rows_of_an_interrupted_add_are_dropped(tmp_path):
+    index = QuantizedIndex(str(tmp_path))
+    first = vectors(3, 0)
+    index.add(first, ["a0", "a1", "a2"], ["A0", "A1", "A2"])
+
+    # A crash after writing the rows but before saving the count
+    orphans = vectors(2, 1)
+    with open(index.file("vectors.f32"), "ab") as f:
+        orphans.tofile(f)
+    with open(index.file("codes.i8"), "ab") as f:
+        np.zeros(orphans.shape, dtype=np.int8).tofile(f)
+    index.ids.extend(["x0", "x1"])
+    index.documents.extend(["X0", "X1"])
+
+    index = QuantizedIndex(str(tmp_path))
+    assert index.count == 3
+    second = vectors(2, 2)
+    index.add(second, ["c0", "c1"], ["C0", "C1"])
+
+    index = QuantizedIndex(str(tmp_path))
+    assert [index.ids[i] for i in range(index.count)] == ["a0", "a1", "a2", "c0", "c1"]
+    [top], [score] = index.search(second[0], 1)
+    assert index.ids[top] == "c0"
+    assert index.documents[top] == "C0"
+    assert score > 0.99
+
+
+def test_existing_ids_are_skipped(tmp_path):
+    collection = QuantizedClient(str(tmp_path)).get_or_create_collection("rag")
+    collection.add(ids=["a", "b"], documents=["A", "B"], embeddings=vectors(2, 0))
+    collection.add(
+        ids=["b", "c", "c"], documents=["B", "C", "C"], embeddings=vectors(3, 1)
+    )
+    assert collection.count() == 3
+
+    reopened = QuantizedClient(str(tmp_path)).get_or_create_collection("rag")
+    reopened.add(ids=["a"], documents=["A"], embeddings=vectors(1, 2))
+    assert reopened.count() == 3
+
+
+def test_one_index_per_collection(tmp_path):
+    client = QuantizedClient(str(tmp_path))
+    collection = client.get_or_create_collection("rag")
+    assert client.get_or_create_collection("rag") is collection
+    assert client.get_or_create_collection("other") is not collection
+
+
+def test_searches_while_adding_see_a_consistent_index(tmp_path):
+    collection = QuantizedClient(str(tmp_path)).get_or_create_collection("rag")
+    batches = [vectors(20, seed) for seed in range(50)]
+    collection.add(ids=["0-0"], documents=["0-0"], embeddings=batches[0][:1])
+    errors = []
+
+    def search():
+        try:
+            while not done.is_set():
+                result = collection.query(query_embeddings=vectors(1, 0), n_results=5)
+                # Each id is its document: ids and rows are in line
+                assert result["ids"][0] == result["documents"][0]
+        except Exception as e:
+            errors.append(e)
+
+    done = threading.Event()
+    threads = [threading.Thread(target=search) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for b, batch in enumerate(batches):
+        ids = [f"{b}-{i}" for i in range(len(batch))]
+        collection.add(ids=ids, documents=ids, embeddings=batch)
+    done.set()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert collection.count() == 20 * 50
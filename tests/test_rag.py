@@ -0,0 +1,27 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+
+
+def test_importing_v5_creates_no_clients_nor_files(tmp_path):
+    code = (
+        "from solved.rag import v5\n"
+        "assert v5.clients.cache_info().currsize == 0\n"
+        "import sys; assert 'chromadb' not in sys.modules\n"
+    )
+    env = {**os.environ, "PYTHONPATH": str(ROOT), "OPENAI_API_KEY": "sk-test"}
+    subprocess.run([sys.executable, "-c", code], check=True, cwd=tmp_path, env=env)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_overridden_clients_are_not_created(monkeypatch, tmp_path):
+    from solved.rag import v5
+
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    monkeypatch.chdir(tmp_path)
+    fake = v5.Clients.create(db="db", sources="sources", tenants="tenants")
+    assert (fake.db, fake.sources, fake.tenants) == ("db", "sources", "tenants")
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,39 @@
+import asyncio
+from types import SimpleNamespace
+
+from gateway import ratelimit
+from gateway.ratelimit import RateLimiter
+
+MESSAGES = [{"role": "user", "content": "Hi"}]
+
+
+def chunks(total_tokens: int):
+    yield SimpleNamespace(usage=None, content="Hello")
+    yield SimpleNamespace(usage=SimpleNamespace(total_tokens=total_tokens))
+
+
+def test_streams_are_settled_with_the_usage_of_the_last_chunk():
+    limiter = RateLimiter(tpm=10_000)
+    stream = limiter(lambda **_: chunks(10), messages=MESSAGES, stream=True)
+    # The estimation (prompt plus 256 completion tokens) is taken first
+    assert limiter._state[1] < 10_000 - 250
+
+    assert [chunk.usage for chunk in stream][-1].total_tokens == 10
+    assert 10_000 - 10 <= limiter._state[1] <= 10_000
+
+
+def test_async_calls_take_the_file_lock_in_a_thread(tmp_path, monkeypatch):
+    threads = []
+
+    async def to_thread(fn, *args):
+        threads.append(fn.__name__)
+        return fn(*args)
+
+    monkeypatch.setattr(ratelimit.asyncio, "to_thread", to_thread)
+    limiter = RateLimiter(rpm=60, tpm=10_000, path=str(tmp_path / "limits"))
+
+    async def create(**_):
+        return SimpleNamespace(usage=SimpleNamespace(total_tokens=10))
+
+    asyncio.run(limiter.call_async(create, messages=MESSAGES))
+    assert threads == ["take", "settle"]
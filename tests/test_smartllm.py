@@ -0,0 +1,39 @@
+import asyncio
+import importlib
+from types import SimpleNamespace
+
+import pytest
+
+
+def chunk(content: str):
+    delta = SimpleNamespace(content=content)
+    return SimpleNamespace(usage=None, choices=[SimpleNamespace(delta=delta)])
+
+
+def create(**kwargs):
+    # A backend without `include_usage`: no chunk has the usage
+    return iter([chunk("Hello"), chunk(" world")])
+
+
+async def create_async(**kwargs):
+    async def stream():
+        for part in create(**kwargs):
+            yield part
+
+    return stream()
+
+
+@pytest.mark.parametrize("version", ["v5", "v6"])
+def test_streams_without_usage_count_their_calls(version, monkeypatch):
+    smartllm = importlib.import_module(f"solved.smartllm.{version}")
+    router = SimpleNamespace(create=create, create_async=create_async)
+    monkeypatch.setattr(smartllm, "router", router)
+
+    usage = smartllm.Usage()
+    answer = smartllm.stream_llm("Hi", usage=usage)
+    if asyncio.iscoroutine(answer):
+        answer = asyncio.run(answer)
+
+    assert answer == "Hello world"
+    assert usage.calls == 1
+    assert usage.prompt_tokens == 0
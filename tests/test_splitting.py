@@ -0,0 +1,126 @@
+import os
+import subprocess
+import sys
+import types
+from itertools import pairwise
+from pathlib import Path
+
+import pytest
+
+from retrieval import splitting
+from retrieval.splitting import (
+    StructuredSplitter,
+    make_splitter,
+    span_splitter,
+    splitter_from_env,
+)
+
+ROOT = Path(__file__).parent.parent
+
+DOC = "\n".join(
+    [
+        "# Agents",
+        "Agents plan their tasks. They remember what they did. " * 6,
+        "They also use tools.",
+        "Memory",
+        "Short-term memory is the context. Long-term memory is an index. " * 6,
+    ]
+).encode()
+
+
+@pytest.fixture(autouse=True)
+def estimated_tokens(monkeypatch):
+    # 4 bytes per token, whether `tiktoken` is installed or not
+    monkeypatch.setattr(splitting, "token_counter", lambda _: splitting.estimate_tokens)
+
+
+def texts(splitter, doc: bytes = DOC) -> list[str]:
+    return [doc[start:end].decode() for start, end in splitter(doc)]
+
+
+def test_sections_are_never_mixed():
+    chunks = texts(StructuredSplitter(chunk_tokens=1000))
+    assert len(chunks) == 2
+    assert chunks[0].startswith("# Agents") and chunks[0].endswith("tools.")
+    assert chunks[1].startswith("Memory")
+
+
+def test_long_paragraphs_are_split_into_sentences():
+    for chunk in texts(StructuredSplitter(chunk_tokens=40)):
+        pieces = [
+            sentence.strip()
+            for line in chunk.encode().splitlines()
+            for sentence in splitting.SENTENCE_RE.findall(line)
+        ]
+        assert sum(splitting.estimate_tokens(piece) for piece in pieces) <= 40
+        assert chunk.endswith((".", "Agents", "Memory"))
+
+
+def test_overlap_repeats_whole_sentences():
+    chunks = texts(StructuredSplitter(chunk_tokens=40, overlap_tokens=10))
+    repeated = [
+        chunk for previous, chunk in pairwise(chunks)
+        if chunk.split(".")[0] in previous
+    ]
+    assert repeated
+    assert all(chunk[0].isupper() for chunk in repeated)
+
+
+def test_offsets_are_utf8_boundaries():
+    doc = ("Título\n" + "Él comió ñandú asado. " * 50).encode()
+    assert "".join(texts(StructuredSplitter(chunk_tokens=16), doc))
+
+
+def test_encoding_that_cant_be_loaded_is_estimated(monkeypatch):
+    def get_encoding(name):
+        raise ConnectionError("offline")
+
+    monkeypatch.undo()
+    monkeypatch.setitem(
+        sys.modules, "tiktoken", types.SimpleNamespace(get_encoding=get_encoding)
+    )
+    splitting.token_counter.cache_clear()
+    try:
+        with pytest.warns(RuntimeWarning, match="estimated"):
+            counter = splitting.token_counter("cl100k_base")
+        assert counter is splitting.estimate_tokens
+    finally:
+        splitting.token_counter.cache_clear()
+
+
+def test_splitters_are_built_from_plain_specs(monkeypatch):
+    monkeypatch.setenv("SPLITTER", "structured:128:16")
+    assert make_splitter(splitter_from_env()) == StructuredSplitter(128, 16)
+    monkeypatch.delenv("SPLITTER")
+    assert splitter_from_env() == ""
+
+    doc = b"Agents plan, remember and use tools. " * 40
+    assert list(make_splitter("")(doc)) == list(span_splitter(doc))
+    assert list(make_splitter("span:100:0")(doc)) == list(span_splitter(doc, 100, 0))
+
+    monkeypatch.setenv("SPLITTER", "semantic")
+    with pytest.raises(ValueError):
+        splitter_from_env()
+
+
+SPAWNED = """
+import multiprocessing
+import sys
+
+from retrieval.ingest import chunk_pages
+
+if __name__ == "__main__":
+    multiprocessing.set_start_method("spawn")
+    page = '<h1 class="post-title">Agents</h1><p class="post-content">Plan.</p>'
+    [(_, _, chunks)] = chunk_pages([("page", page)], "span:10:0", workers=2)
+    assert chunks
+    assert not [name for name in sys.modules if name.startswith("solved")]
+"""
+
+
+def test_ingestion_processes_only_import_retrieval(tmp_path):
+    # With `spawn`, each process imports the module of the task again
+    script = tmp_path / "spawned.py"
+    script.write_text(SPAWNED)
+    env = {**os.environ, "PYTHONPATH": str(ROOT)}
+    subprocess.run([sys.executable, str(script)], check=True, env=env)
@@ -0,0 +1,23 @@
+import pytest
+
+from benchmarks.stages import Stages
+
+
+def test_concurrent_stages_are_counted_once():
+    stages = Stages()
+    # Two ideas generated at the same time, then a merge
+    calls = [("llm", 0.0, 1.0), ("llm", 0.2, 1.0), ("merge", 2.0, 2.5)]
+    for name, start, end in calls:
+        stages.seconds[name] += end - start
+        stages.intervals.append((start, end))
+
+    assert stages.busy() == pytest.approx(1.5)
+    assert stages.overlap() == pytest.approx(0.8)
+
+
+def test_nested_stages_add_up_to_their_wall_time():
+    stages = Stages()
+    with stages.stage("validate"), stages.stage("llm"):
+        pass
+    assert abs(sum(stages.seconds.values()) - stages.busy()) < 1e-6
+    assert stages.overlap() < 1e-6
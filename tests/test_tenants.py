@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+from retrieval.quantized import QuantizedClient
+from retrieval.tenants import Tenants
+
+
+@pytest.fixture
+def tenants(tmp_path):
+    db = QuantizedClient(str(tmp_path / "index"))
+    return Tenants(db, None, str(tmp_path / "tenants"), memory_budget=2, item_bytes=1)
+
+
+def add(tenant, n: int):
+    ids = [f"{tenant.name}-{i}" for i in range(n)]
+    vectors = np.random.default_rng(n).normal(size=(n, 8))
+    tenant.collection.add(ids=ids, documents=ids, embeddings=vectors.tolist())
+
+
+@pytest.mark.parametrize("name", ["a", "acme", "acme-2", "ACME_corp", "x" * 48])
+def test_valid_names(tenants, name):
+    assert tenants.get(name).name == name
+
+
+@pytest.mark.parametrize(
+    "name", ["", "acme-", "acme_", "-acme", "ac me", "../x", "x" * 49]
+)
+def test_invalid_names(tenants, name):
+    with pytest.raises(ValueError):
+        tenants.get(name)
+
+
+def test_each_tenant_has_its_own_index(tenants):
+    acme, globex = tenants.get("acme"), tenants.get("globex")
+    add(acme, 1)
+    assert acme.collection.count() == 1 and globex.collection.count() == 0
+    assert acme.sources is not globex.sources
+    assert acme.answers is not globex.answers
+
+    assert tenants.get("acme") is acme
+    assert tenants.metrics()["hit_rate"] == pytest.approx(1 / 3)
+
+
+def test_coldest_tenants_are_evicted(tenants):
+    acme = tenants.get("acme")
+    add(acme, 1)
+    tenants.resize("acme")
+    globex = tenants.get("globex")
+    add(globex, 1)
+    tenants.resize("globex")
+    assert list(tenants.open) == ["acme", "globex"]
+
+    tenants.get("acme")  # Now `globex` is the coldest
+    initech = tenants.get("initech")
+    add(initech, 1)
+    tenants.resize("initech")
+    assert list(tenants.open) == ["acme", "initech"]
+    assert tenants.metrics()["evictions"] == 1
+
+    # Opened again with its vectors (but not its cached answers)
+    assert tenants.get("globex").collection.count() == 1
+
+
+def test_the_tenant_in_use_is_never_evicted(tenants):
+    acme = tenants.get("acme")
+    add(acme, 5)
+    tenants.resize("acme")
+    assert list(tenants.open) == ["acme"]